@@ -1,34 +1,84 @@
 import os
 import math
-import sqlite3
+import hashlib
+import json
+import shutil
 import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 from io import BytesIO
 from qgis.core import (QgsProject, QgsVectorLayer, QgsGeometry, 
                        QgsFeature, QgsMapSettings, QgsMapRendererCustomPainterJob,
                        QgsWkbTypes, QgsCoordinateTransform, QgsPointXY,
-                       QgsCoordinateReferenceSystem, QgsRectangle)
+                       QgsCoordinateReferenceSystem, QgsRectangle,
+                       QgsApplication, QgsTask, QgsMapRendererParallelJob,
+                       QgsMapRendererSequentialJob, QgsMessageLog, Qgis)
 from qgis.gui import QgsMapTool, QgsRubberBand
 from qgis.utils import iface
-from PyQt5.QtCore import Qt, QSize, QBuffer, QIODevice, QByteArray, pyqtSignal, QObject, QTimer
+from PyQt5.QtCore import (Qt, QSize, QBuffer, QIODevice, QByteArray, pyqtSignal, QObject, QTimer,
+                          QThread, QProcess)
 from PyQt5.QtGui import QColor, QImage, QPainter, QPainterPath, QKeyEvent
 from PyQt5.QtWidgets import (QAction, QDialog, QSpinBox, QPushButton, 
                              QFileDialog, QFormLayout, QDialogButtonBox, 
                              QLabel, QProgressDialog, QComboBox, QMessageBox,
                              QApplication, QCheckBox, QColorDialog, QGroupBox,
                              QVBoxLayout, QHBoxLayout)
+from .shaped_mbtiles_tiles import (TILE_SIZE, ORIGIN_SHIFT, WORLD_CIRCUMFERENCE,
+                                   TILE_OUTSIDE, TILE_BOUNDARY, TILE_INSIDE,
+                                   scanline_tile_rows, scanline_tile_classes,
+                                   classify_row_ranges, count_tile_rows, TileSet,
+                                   ORDER_ROWS, ORDER_HILBERT, ORDER_MORTON, block_order_key)
+from .shaped_mbtiles_writers import (create_writer, output_kind, ThreadedTileWriter,
+                                     SQLITE_PROFILE_SAFE, SQLITE_PROFILE_BULK,
+                                     JOB_METADATA_KEY, CURSOR_METADATA_KEY,
+                                     COMPLETE_METADATA_KEY,
+                                     read_job_metadata, read_existing_tiles)
+# Re-exported for scripts that used shaped_mbtiles.MBTilesWriter before the split
+from .shaped_mbtiles_writers import MBTilesWriter, PMTilesWriter  # noqa: F401
+from .shaped_mbtiles_farm import write_job as write_farm_job, farm_command
+from .shaped_mbtiles_stats import (RunStats, write_report, STATS_REPORT_SUFFIX,
+                                   STATS_METADATA_KEY, STAGE_ENUMERATE, STAGE_CLIP,
+                                   STAGE_RENDER, STAGE_CROP, STAGE_DOWNSAMPLE,
+                                   STAGE_ENCODE, STAGE_LAYER_PROFILE)
 
 # ======================================================
 # CONSTANTS
 # ======================================================
-TILE_SIZE = 256  # Standard web map tile size (TMS specification)
-ORIGIN_SHIFT = 20037508.342789244  # Web Mercator (EPSG:3857) extent in meters
-WORLD_CIRCUMFERENCE = 40075016.686  # Earth's circumference at equator in meters
+# Tile grid constants (TILE_SIZE, ORIGIN_SHIFT, WORLD_CIRCUMFERENCE) and the
+# tile classes (TILE_OUTSIDE, TILE_BOUNDARY, TILE_INSIDE) are defined in
+# shaped_mbtiles_tiles so QGIS-free code can share them
 
 # Memory safety limits
 MAX_RENDER_PIXELS = 4096  # Maximum render canvas size in pixels (prevents OOM)
 MAX_METATILE_SIZE = 16    # Capped metatile size (16 * 256 = 4096 pixels)
 MEMORY_WARNING_MB = 200   # Warn if estimated memory usage exceeds this
 
+# Block metatiles: extra pixels rendered around each N×N block so labels and
+# symbols crossing the block edge are drawn identically in neighbouring blocks
+METATILE_BUFFER_PX = 128
+
+# Clip paths are cut from the polygon per cell of this many tiles squared
+# (see ShapedTileRenderer._cell_path)
+CLIP_CELL_TILES = 32
+
+# Tile enumeration engines (see get_intersecting_tiles)
+ENUMERATION_SCANLINE = 'scanline'  # Analytic per-row spans, no GEOS calls
+ENUMERATION_QUADTREE = 'quadtree'  # GEOS-classified quadtree descent
+
+# Main-thread scheduling (see IncrementalTileGenerator._process_next_tile)
+FRAME_BUDGET_MS = 40          # Keep rendering this long per timer tick before yielding
+PROGRESS_INTERVAL_S = 0.25    # Minimum time between progress dialog updates
+PROGRESS_TOP_LAYERS = 3       # Most expensive layers shown while profiling
+LAYER_PROFILE_EVERY = 25      # Renders per per-layer sample render (layer profile)
+LOG_TAG = "Shaped MBTiles"    # QGIS message log tab
+CHECKPOINT_INTERVAL_S = 10.0  # Time between resume checkpoints in the MBTiles metadata
+FARM_TERMINATE_TIMEOUT_MS = 30000  # Wait for a cancelled farm coordinator before killing it
+
+# Rendering backends (see IncrementalTileGenerator)
+RENDER_BACKEND_PAINTER = 'painter'        # QgsMapRendererCustomPainterJob, main thread
+RENDER_BACKEND_PARALLEL = 'parallel'      # QgsMapRendererParallelJob, thread per layer
+RENDER_BACKEND_SEQUENTIAL = 'sequential'  # QgsMapRendererSequentialJob, one worker thread
+
 # Global state to persist drawing between pause/resume cycles
 # This dict allows the drawing tool to be deactivated (for pan/zoom) while
 # preserving the polygon points and rubber band. When resuming, a new tool
@@ -41,6 +91,16 @@ _drawing_state = {
     'intentional_pause': False # Flag to distinguish pause from accidental tool switch
 }
 
+# Per-zoom tile sets for the most recently configured polygon. Counting runs
+# in a background task; each zoom is computed once and reused when the user
+# changes the other zoom spin box or reopens the dialog, and the cached sets
+# are handed to the generator so they are never recomputed.
+_tile_set_cache = {
+    'polygon_key': None,       # Hash of the Web Mercator polygon WKB
+    'zooms': {},               # zoom -> (tiles TileSet, boundary TileSet)
+    'seconds': {}              # zoom -> enumeration time (timing report)
+}
+
 # ======================================================
 # 1. TILE MATH UTILITIES
 # ======================================================
@@ -108,64 +168,391 @@ def tile_to_geometry(z, x, y):
     extent = tile_to_extent(z, x, y)
     return QgsGeometry.fromRect(extent)
 
-def get_intersecting_tiles(polygon_geom, source_crs, zoom_min, zoom_max):
+class PolygonPredicates:
+    """
+    Prepared GEOS predicates for the export polygon.
+    
+    Plain QgsGeometry predicates (intersects/contains/intersection) convert
+    and re-index the full polygon inside GEOS on every call. This class
+    builds a geometry engine once per export with createGeometryEngine() and
+    prepareGeometry(), then answers all tile-vs-polygon questions against it.
+    A single instance is shared by enumeration, containment tests and clip
+    path construction.
+    """
+    
+    def __init__(self, polygon_geom_3857):
+        """
+        Build and prepare the geometry engine.
+        
+        Args:
+            polygon_geom_3857: QgsGeometry polygon in Web Mercator (EPSG:3857)
+        """
+        self.polygon = polygon_geom_3857
+        self.bbox = polygon_geom_3857.boundingBox()
+        self.engine = QgsGeometry.createGeometryEngine(polygon_geom_3857.constGet())
+        self.engine.prepareGeometry()
+    
+    def intersects(self, rect):
+        """Return True if the rectangle (QgsRectangle) intersects the polygon."""
+        if not rect.intersects(self.bbox):
+            return False
+        rect_geom = QgsGeometry.fromRect(rect)
+        return self.engine.intersects(rect_geom.constGet())
+    
+    def contains(self, rect):
+        """Return True if the polygon fully contains the rectangle (QgsRectangle)."""
+        if not self.bbox.contains(rect):
+            return False
+        rect_geom = QgsGeometry.fromRect(rect)
+        return self.engine.contains(rect_geom.constGet())
+    
+    def intersection(self, rect):
+        """
+        Intersect the polygon with a rectangle.
+        
+        Args:
+            rect: QgsRectangle in Web Mercator
+        
+        Returns:
+            QgsGeometry of the intersection (empty if disjoint)
+        """
+        rect_geom = QgsGeometry.fromRect(rect)
+        result = self.engine.intersection(rect_geom.constGet())
+        return QgsGeometry(result) if result else QgsGeometry()
+    
+    def classify(self, rect):
+        """
+        Classify a rectangle against the polygon.
+        
+        A rectangle that only touches the polygon along an edge or at a
+        corner is outside: none of its pixels would be drawn. The scanline
+        engine (scanline_tile_classes) applies the same rule, so both
+        enumeration engines return the same tiles.
+        
+        Args:
+            rect: QgsRectangle in Web Mercator
+        
+        Returns:
+            TILE_OUTSIDE, TILE_BOUNDARY or TILE_INSIDE
+        """
+        if not self.intersects(rect):
+            return TILE_OUTSIDE
+        if self.contains(rect):
+            return TILE_INSIDE
+        # Only boundary candidates pay for the third predicate
+        if self.engine.touches(QgsGeometry.fromRect(rect).constGet()):
+            return TILE_OUTSIDE
+        return TILE_BOUNDARY
+
+def _log_warning(message):
+    """Write a warning to the plugin's tab of the QGIS message log."""
+    QgsMessageLog.logMessage(message, LOG_TAG, Qgis.Warning)
+
+def _to_web_mercator(polygon_geom, source_crs):
+    """
+    Return a copy of the polygon transformed to Web Mercator (EPSG:3857).
+    
+    Args:
+        polygon_geom: QgsGeometry polygon in source_crs
+        source_crs: QgsCoordinateReferenceSystem of the polygon
+    
+    Returns:
+        New QgsGeometry in Web Mercator
+    """
+    web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
+    transform = QgsCoordinateTransform(source_crs, web_mercator, QgsProject.instance())
+    poly_3857 = QgsGeometry(polygon_geom)
+    poly_3857.transform(transform)
+    return poly_3857
+
+def polygon_wgs84_bounds(polygon_3857):
+    """
+    WGS84 bounds of a Web Mercator polygon (for the MBTiles metadata).
+    
+    Args:
+        polygon_3857: QgsGeometry in EPSG:3857
+    
+    Returns:
+        Tuple of (lon_min, lat_min, lon_max, lat_max)
+    """
+    wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
+    web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
+    to_wgs84 = QgsCoordinateTransform(web_mercator, wgs84, QgsProject.instance())
+    bbox_wgs84 = to_wgs84.transformBoundingBox(polygon_3857.boundingBox())
+    return (bbox_wgs84.xMinimum(), bbox_wgs84.yMinimum(), 
+            bbox_wgs84.xMaximum(), bbox_wgs84.yMaximum())
+
+def _polygon_rings(geom):
+    """
+    Extract all rings of a (multi)polygon as plain (x, y) tuples.
+    
+    Args:
+        geom: QgsGeometry polygon or multipolygon
+    
+    Returns:
+        List of rings (outer rings and holes of every part)
+    """
+    if geom.isMultipart():
+        polygons = geom.asMultiPolygon()
+    else:
+        polygons = [geom.asPolygon()]
+    return [[(pt.x(), pt.y()) for pt in ring] for polygon in polygons for ring in polygon]
+
+def iter_intersecting_tiles(poly_3857, zoom_min, zoom_max, method=ENUMERATION_SCANLINE,
+                            predicates=None):
+    """
+    Lazily yield all tiles that spatially intersect a polygon, classified.
+    
+    Nothing is materialized: the scanline engine rasterizes one zoom level
+    at a time and yields tiles row by row, the quadtree engine yields tiles
+    while descending. Memory use is independent of the tile count.
+    
+    Each tile carries its classification (TILE_INSIDE or TILE_BOUNDARY) so
+    the renderer never has to re-test containment. The scanline engine gets
+    it for free from the rasterization; the quadtree engine from the single
+    classification it already made (descendants of inside tiles need none).
+    
+    Two enumeration engines are available:
+    - ENUMERATION_SCANLINE (default): rasterizes the polygon rings at tile
+      resolution, computing each row's covered x-ranges analytically in
+      O(vertices + rows) per zoom without any GEOS calls
+    - ENUMERATION_QUADTREE: descends the tile quadtree with GEOS predicates,
+      pruning disjoint subtrees and accepting fully contained ones
+    
+    Args:
+        poly_3857: QgsGeometry polygon in Web Mercator (EPSG:3857)
+        zoom_min, zoom_max: Zoom level range (inclusive)
+        method: ENUMERATION_SCANLINE or ENUMERATION_QUADTREE
+        predicates: Optional PolygonPredicates to reuse (quadtree engine)
+    
+    Yields:
+        (z, x, y, tile_class) tuples for intersecting tiles
+    """
+    if method == ENUMERATION_QUADTREE:
+        predicates = predicates or PolygonPredicates(poly_3857)
+        for z, x, y, tile_class in _quadtree_nodes(predicates, zoom_min, zoom_max):
+            if tile_class == TILE_INSIDE:
+                for tile in _iter_subtree(z, x, y, zoom_min, zoom_max):
+                    yield tile + (TILE_INSIDE,)
+            else:
+                yield z, x, y, tile_class
+    else:
+        rings = _polygon_rings(poly_3857)
+        for z in range(zoom_min, zoom_max + 1):
+            rows, boundary_rows = scanline_tile_classes(rings, z)
+            for y in sorted(rows):
+                segments = classify_row_ranges(rows[y], boundary_rows.get(y, []))
+                for x_first, x_last, tile_class in segments:
+                    for x in range(x_first, x_last + 1):
+                        yield z, x, y, tile_class
+
+def count_intersecting_tiles(poly_3857, zoom_min, zoom_max, method=ENUMERATION_SCANLINE,
+                             predicates=None):
+    """
+    Count the tiles iter_intersecting_tiles() would yield, without yielding them.
+    
+    The scanline engine sums row ranges; the quadtree engine counts fully
+    contained subtrees arithmetically, so only boundary tiles are visited.
+    Used to size the progress bar before streaming generation starts.
+    
+    Args:
+        poly_3857: QgsGeometry polygon in Web Mercator (EPSG:3857)
+        zoom_min, zoom_max: Zoom level range (inclusive)
+        method: ENUMERATION_SCANLINE or ENUMERATION_QUADTREE
+        predicates: Optional PolygonPredicates to reuse (quadtree engine)
+    
+    Returns:
+        Exact number of tiles
+    """
+    total = 0
+    if method == ENUMERATION_QUADTREE:
+        predicates = predicates or PolygonPredicates(poly_3857)
+        for z, x, y, tile_class in _quadtree_nodes(predicates, zoom_min, zoom_max):
+            if tile_class == TILE_INSIDE:
+                for zz in range(max(z, zoom_min), zoom_max + 1):
+                    total += 4 ** (zz - z)
+            else:
+                total += 1
+    else:
+        rings = _polygon_rings(poly_3857)
+        for z in range(zoom_min, zoom_max + 1):
+            total += count_tile_rows(scanline_tile_rows(rings, z))
+    return total
+
+def build_tile_sets(poly_3857, zoom_min, zoom_max, method=ENUMERATION_SCANLINE,
+                    predicates=None):
+    """
+    Enumerate intersecting tiles into compact TileSets.
+    
+    Both engines add whole row runs rather than single tiles where they
+    can (scanline spans, fully contained quadtree subtrees), so building
+    costs O(rows) rather than O(tiles) and the result takes a few MB even
+    for 100M-tile jobs.
+    
+    Args:
+        poly_3857: QgsGeometry polygon in Web Mercator (EPSG:3857)
+        zoom_min, zoom_max: Zoom level range (inclusive)
+        method: ENUMERATION_SCANLINE or ENUMERATION_QUADTREE
+        predicates: Optional PolygonPredicates to reuse (quadtree engine)
+    
+    Returns:
+        Tuple of (tiles, boundary_tiles) TileSets. boundary_tiles is the
+        subset of tiles that cross the polygon boundary; all other tiles
+        are fully inside.
+    """
+    if method != ENUMERATION_QUADTREE:
+        rings = _polygon_rings(poly_3857)
+        zoom_sets = [scanline_zoom_tile_sets(rings, z) for z in range(zoom_min, zoom_max + 1)]
+        return merge_zoom_tile_sets(zoom_sets)
+    
+    tiles = TileSet()
+    boundary_tiles = TileSet()
+    predicates = predicates or PolygonPredicates(poly_3857)
+    for z, x, y, tile_class in _quadtree_nodes(predicates, zoom_min, zoom_max):
+        if tile_class == TILE_INSIDE:
+            for zz in range(max(z, zoom_min), zoom_max + 1):
+                shift = zz - z
+                x_first, x_last = x << shift, ((x + 1) << shift) - 1
+                for yy in range(y << shift, (y + 1) << shift):
+                    tiles.add_range(zz, yy, x_first, x_last)
+        else:
+            tiles.add(z, x, y)
+            boundary_tiles.add(z, x, y)
+    
+    return tiles, boundary_tiles
+
+def scanline_zoom_tile_sets(rings, z):
+    """
+    Build the tile sets of a single zoom level with the scanline engine.
+    
+    Works on plain rings (see _polygon_rings()), so it is safe to call from
+    a background task.
+    
+    Args:
+        rings: Polygon rings in Web Mercator meters
+        z: Zoom level
+    
+    Returns:
+        Tuple of (tiles, boundary_tiles) TileSets for zoom z
+    """
+    tiles = TileSet()
+    boundary_tiles = TileSet()
+    rows, boundary_rows = scanline_tile_classes(rings, z)
+    tiles.add_rows(z, rows)
+    boundary_tiles.add_rows(z, boundary_rows)
+    return tiles, boundary_tiles
+
+def merge_zoom_tile_sets(zoom_sets):
+    """
+    Combine per-zoom (tiles, boundary_tiles) pairs into one pair of TileSets.
+    
+    Args:
+        zoom_sets: Iterable of (tiles, boundary_tiles) TileSet pairs
+    
+    Returns:
+        Tuple of (tiles, boundary_tiles) TileSets
+    """
+    tiles = TileSet()
+    boundary_tiles = TileSet()
+    for zoom_tiles, zoom_boundary in zoom_sets:
+        tiles.update(zoom_tiles)
+        boundary_tiles.update(zoom_boundary)
+    return tiles, boundary_tiles
+
+def get_intersecting_tiles(polygon_geom, source_crs, zoom_min, zoom_max,
+                           method=ENUMERATION_SCANLINE):
     """
     Calculate all tiles that spatially intersect a polygon across zoom levels.
     
-    This is a two-stage process:
-    1. Transform polygon to Web Mercator
-    2. For each zoom level:
-       - Calculate tile range from bounding box
-       - Test each candidate tile for intersection
-       - Keep only tiles that actually intersect
+    Materializing wrapper around iter_intersecting_tiles(). Prefer the
+    iterator for large exports; a list costs ~80+ bytes per tile.
     
     Args:
         polygon_geom: QgsGeometry polygon in source_crs
         source_crs: QgsCoordinateReferenceSystem of the polygon
         zoom_min, zoom_max: Zoom level range (inclusive)
+        method: ENUMERATION_SCANLINE or ENUMERATION_QUADTREE
     
     Returns:
         Tuple of:
         - List of (z, x, y) tuples for intersecting tiles
         - Transformed polygon in Web Mercator (EPSG:3857)
     """
-    web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
-    transform = QgsCoordinateTransform(source_crs, web_mercator, QgsProject.instance())
+    poly_3857 = _to_web_mercator(polygon_geom, source_crs)
+    tiles = [(z, x, y) for z, x, y, _ in
+             iter_intersecting_tiles(poly_3857, zoom_min, zoom_max, method)]
+    return tiles, poly_3857
+
+def _iter_subtree(z, x, y, zoom_min, zoom_max):
+    """
+    Yield every descendant of a tile (and the tile itself) within a zoom range.
     
-    # Transform polygon to Web Mercator for tile calculations
-    poly_3857 = QgsGeometry(polygon_geom)
-    poly_3857.transform(transform)
+    Args:
+        z, x, y: XYZ coordinates of the subtree root
+        zoom_min, zoom_max: Zoom level range (inclusive)
+    
+    Yields:
+        (z, x, y) tuples, zoom by zoom
+    """
+    for zz in range(max(z, zoom_min), zoom_max + 1):
+        shift = zz - z
+        for cx in range(x << shift, (x + 1) << shift):
+            for cy in range(y << shift, (y + 1) << shift):
+                yield zz, cx, cy
+
+def _quadtree_nodes(predicates, zoom_min, zoom_max):
+    """
+    Descend the tile quadtree and yield the nodes that make up the tile set.
     
-    tiles = []
-    bbox = poly_3857.boundingBox()
+    Starting from the world tile, each visited tile is classified:
+    - Outside: the whole subtree is pruned
+    - Fully inside: yielded as a subtree root; every descendant down to
+      zoom_max intersects, so no further geometry tests are needed
+    - Boundary: yielded (if at or below zoom_min) and its four children
+      are visited
     
-    # For each zoom level, find tiles in bounding box and test for intersection
-    for z in range(zoom_min, zoom_max + 1):
-        x_min, y_min = meters_to_tile(bbox.xMinimum(), bbox.yMaximum(), z)
-        x_max, y_max = meters_to_tile(bbox.xMaximum(), bbox.yMinimum(), z)
-        
-        # Clamp to valid tile range for this zoom level
-        max_tile = (2 ** z) - 1
-        x_min = max(0, x_min)
-        x_max = min(max_tile, x_max)
-        y_min = max(0, y_min)
-        y_max = min(max_tile, y_max)
-        
-        # Test each candidate tile for actual intersection with polygon
-        for x in range(x_min, x_max + 1):
-            for y in range(y_min, y_max + 1):
-                tile_geom = tile_to_geometry(z, x, y)
-                if tile_geom.intersects(poly_3857):
-                    tiles.append((z, x, y))
+    Tiles that only touch the polygon count as outside (see
+    PolygonPredicates.classify()).
     
-    return tiles, poly_3857
+    Tiles above zoom_min are visited (to prune/accept whole subtrees) but
+    boundary tiles there are not yielded. The number of geometry tests
+    scales with the polygon's boundary length in tiles rather than with its
+    bounding box area.
+    
+    Args:
+        predicates: PolygonPredicates for the polygon
+        zoom_min, zoom_max: Zoom level range (inclusive)
+    
+    Yields:
+        (z, x, y, tile_class) with tile_class TILE_INSIDE (subtree root,
+        possibly above zoom_min) or TILE_BOUNDARY (single tile)
+    """
+    stack = [(0, 0, 0)]
+    while stack:
+        z, x, y = stack.pop()
+        
+        # Prepared predicates (with a bounding box pre-check)
+        tile_class = predicates.classify(tile_to_extent(z, x, y))
+        if tile_class == TILE_OUTSIDE:
+            continue
+        if tile_class == TILE_INSIDE:
+            yield z, x, y, TILE_INSIDE
+            continue
+        
+        # Boundary tile: emit it and descend into its children
+        if z >= zoom_min:
+            yield z, x, y, TILE_BOUNDARY
+        if z < zoom_max:
+            cx, cy = x * 2, y * 2
+            stack.extend([(z + 1, cx + 1, cy + 1), (z + 1, cx, cy + 1),
+                          (z + 1, cx + 1, cy), (z + 1, cx, cy)])
 
 def estimate_tile_count_fast(polygon_geom, source_crs, zoom_min, zoom_max):
     """
-    Quick estimate of tile count using bounding box only (no intersection test).
+    Exact tile count using the scanline rasterizer (no tile list is built).
     
-    This is much faster than get_intersecting_tiles() and useful for UI feedback.
-    The actual count will be lower for irregular polygons.
+    Only the per-row x-ranges are computed and summed, so this stays fast
+    even at z18+ and is suitable for live UI feedback.
     
     Args:
         polygon_geom: QgsGeometry polygon
@@ -173,45 +560,45 @@ def estimate_tile_count_fast(polygon_geom, source_crs, zoom_min, zoom_max):
         zoom_min, zoom_max: Zoom level range
     
     Returns:
-        Tuple of (estimated_count, is_exact). is_exact=False for estimates.
+        Tuple of (count, is_exact). is_exact is always True.
     """
-    web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
-    transform = QgsCoordinateTransform(source_crs, web_mercator, QgsProject.instance())
+    poly_3857 = _to_web_mercator(polygon_geom, source_crs)
+    total = count_intersecting_tiles(poly_3857, zoom_min, zoom_max)
     
-    poly_3857 = QgsGeometry(polygon_geom)
-    poly_3857.transform(transform)
-    bbox = poly_3857.boundingBox()
+    return total, True
+
+def metatile_block_size(metatile_size):
+    """
+    Block edge length (in tiles) used for block metatile rendering.
     
-    total = 0
-    for z in range(zoom_min, zoom_max + 1):
-        x_min, y_min = meters_to_tile(bbox.xMinimum(), bbox.yMaximum(), z)
-        x_max, y_max = meters_to_tile(bbox.xMaximum(), bbox.yMinimum(), z)
-        
-        max_tile = (2 ** z) - 1
-        x_min = max(0, x_min)
-        x_max = min(max_tile, x_max)
-        y_min = max(0, y_min)
-        y_max = min(max_tile, y_max)
-        
-        cols = x_max - x_min + 1
-        rows = y_max - y_min + 1
-        total += cols * rows
+    Capped so the block plus its label buffer fits in MAX_RENDER_PIXELS.
+    
+    Args:
+        metatile_size: Requested metatile size
     
-    return total, False  # is_exact=False because this is bbox estimate
+    Returns:
+        Block size in tiles
+    """
+    max_block = (MAX_RENDER_PIXELS - 2 * METATILE_BUFFER_PX) // TILE_SIZE
+    return max(1, min(metatile_size, max_block))
 
-def estimate_memory_usage(metatile_size, dpi):
+def estimate_memory_usage(metatile_size, dpi, blocks=False):
     """
     Estimate memory usage per tile render in MB.
     
     Args:
         metatile_size: Metatile multiplier
         dpi: DPI setting
+        blocks: True for block metatile rendering (block + label buffer)
     
     Returns:
-        Estimated MB per tile
+        Estimated MB per render
     """
     # Render size in pixels (capped at MAX_RENDER_PIXELS)
-    render_size = min(TILE_SIZE * metatile_size, MAX_RENDER_PIXELS)
+    if blocks:
+        render_size = metatile_block_size(metatile_size) * TILE_SIZE + 2 * METATILE_BUFFER_PX
+    else:
+        render_size = min(TILE_SIZE * metatile_size, MAX_RENDER_PIXELS)
     # 4 bytes per pixel (RGBA), plus some overhead
     bytes_per_tile = render_size * render_size * 4 * 1.5  # 1.5x for overhead
     return bytes_per_tile / (1024 * 1024)
@@ -219,129 +606,193 @@ def estimate_memory_usage(metatile_size, dpi):
 # ======================================================
 # 2. MBTILES DATABASE HANDLER
 # ======================================================
-class MBTilesWriter:
+# MBTilesWriter, PMTilesWriter and ThreadedTileWriter live in
+# shaped_mbtiles_writers (no QGIS imports) so the render farm coordinator can
+# use them as well; they are re-exported here for existing scripts
+
+# ======================================================
+# 3. TILE RENDERER
+# ======================================================
+# What to render for one tile or metatile block:
+#   extent:    QgsRectangle to render (None = background only, no render)
+#   size:      Render canvas size in pixels
+#   clip_path: QPainterPath in canvas pixels (None = no clipping needed)
+#   crops:     [(x, y, left, top)] canvas offset of each output tile
+#   zoom:      Zoom level (for timing statistics)
+RenderPlan = namedtuple('RenderPlan', ['extent', 'size', 'clip_path', 'crops', 'zoom'],
+                        defaults=(None,))
+
+def encode_tile_image(image, tile_format, jpeg_quality=75):
     """
-    Writes tiles to an MBTiles SQLite database.
+    Encode a rendered tile for storage.
     
-    Handles:
-    - Schema initialization (tiles and metadata tables)
-    - Metadata writing (name, bounds, format, zoom levels, etc.)
-    - Tile writing with XYZ to TMS coordinate conversion
-    - Batch commits for performance
+    Args:
+        image: QImage tile
+        tile_format: "png" or "jpg"
+        jpeg_quality: JPEG quality (1-100), JPG only
     
-    MBTiles spec: https://github.com/mapbox/mbtiles-spec
+    Returns:
+        Encoded image bytes
+    """
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    if tile_format == 'png':
+        image.save(buffer, "PNG")
+    else:
+        image.save(buffer, "JPEG", jpeg_quality)
+    return bytes(buffer.data())
+
+def uniform_tile_pixel(image):
     """
+    Return the pixel value of a single-colour image, or None.
     
-    def __init__(self, path, name="Shaped Export", description="Generated by QGIS", 
-                 tile_format="png", bounds=None, min_zoom=0, max_zoom=14):
+    Compares the raw image bits (a memoryview of constBits(), copied out as
+    bytes so the comparison is a single memcmp) against the first pixel
+    repeated. The first row is checked before the whole image to reject
+    most tiles early.
+    
+    Args:
+        image: 32-bit QImage (ARGB32 or RGB32)
+    
+    Returns:
+        The pixel as a 32-bit integer (0xAARRGGBB), or None if the image
+        has more than one colour
+    """
+    size = image.sizeInBytes()
+    bits = image.constBits()
+    bits.setsize(size)
+    view = memoryview(bits)
+    first = view[:4].tobytes()
+    row = image.bytesPerLine()
+    if view[:row].tobytes() != first * (row // 4):
+        return None
+    if view.tobytes() != first * (size // 4):
+        return None
+    return image.pixel(0, 0)
+
+class TileEncoder:
+    """
+    Encodes rendered tiles, short-cutting empty and single-colour tiles.
+    
+    - Fully transparent PNG tiles are skipped (encode() returns None):
+      a missing tile displays exactly like a transparent one
+    - Other single-colour tiles (solid background, water, no-data) are
+      encoded once per colour and the cached blob is reused
+    - Everything else goes through encode_tile_image(), optionally on a
+      thread pool (submit()): QImage.save() on distinct images is
+      thread-safe and PyQt releases the GIL while it runs
+    """
+    
+    def __init__(self, tile_format, jpeg_quality=75, skip_transparent=True, workers=0,
+                 stats=None):
         """
-        Initialize MBTiles database.
-        
         Args:
-            path: Output file path (.mbtiles)
-            name: Tileset name for metadata
-            description: Tileset description for metadata
             tile_format: "png" or "jpg"
-            bounds: WGS84 bounds tuple (lon_min, lat_min, lon_max, lat_max)
-            min_zoom, max_zoom: Zoom level range
-        """
-        self.path = path
-        self.conn = sqlite3.connect(path)
-        self.cursor = self.conn.cursor()
-        self._init_schema()
-        self._write_metadata(name, description, tile_format, bounds, min_zoom, max_zoom)
-    
-    def _init_schema(self):
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tiles (
-                zoom_level INTEGER,
-                tile_column INTEGER,
-                tile_row INTEGER,
-                tile_data BLOB,
-                PRIMARY KEY (zoom_level, tile_column, tile_row)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS metadata (
-                name TEXT PRIMARY KEY,
-                value TEXT
-            )
-        """)
-        self.conn.commit()
-    
-    def _write_metadata(self, name, description, tile_format, bounds, min_zoom, max_zoom):
-        metadata = {
-            'name': name,
-            'type': 'baselayer',
-            'version': '1.0',
-            'description': description,
-            'format': tile_format,
-            'minzoom': str(min_zoom),
-            'maxzoom': str(max_zoom)
-        }
-        if bounds:
-            metadata['bounds'] = f"{bounds[0]},{bounds[1]},{bounds[2]},{bounds[3]}"
-            # Add center point (lon, lat, zoom)
-            center_lon = (bounds[0] + bounds[2]) / 2
-            center_lat = (bounds[1] + bounds[3]) / 2
-            center_zoom = (min_zoom + max_zoom) // 2
-            metadata['center'] = f"{center_lon},{center_lat},{center_zoom}"
-        
-        for key, value in metadata.items():
-            self.cursor.execute(
-                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
-                (key, value)
-            )
-        self.conn.commit()
+            jpeg_quality: JPEG quality (1-100), JPG only
+            skip_transparent: Skip fully transparent PNG tiles
+            workers: Encoder threads for submit() (0 = encode synchronously)
+            stats: RunStats receiving the time of each real encode
+        """
+        self.tile_format = tile_format
+        self.jpeg_quality = jpeg_quality
+        self.skip_transparent = skip_transparent
+        self.uniform_blobs = {}  # (pixel, QImage format) -> encoded bytes
+        self.skipped = 0
+        self.uniform = 0
+        self.stats = stats
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="ShapedMBTilesEncoder") if workers else None
+    
+    def encode(self, image, zoom=None):
+        """
+        Encode a tile image on the calling thread.
+        
+        Args:
+            image: QImage tile
+            zoom: Zoom level of the tile (for timing statistics)
+        
+        Returns:
+            Encoded bytes, or None if the tile should not be stored
+        """
+        return self._encode(image, uniform_tile_pixel(image), zoom)
     
-    def write_tile(self, z, x, y, image_data):
+    def submit(self, image, zoom=None):
         """
-        Write a single tile to the database.
+        Encode a tile image on the encoder pool.
         
-        Converts XYZ coordinates to TMS (flips Y axis) as required by MBTiles spec.
-        Uses INSERT OR REPLACE to overwrite existing tiles.
+        The uniformity check and the cached uniform tiles are handled right
+        away on the calling thread; only real encodes go to the pool.
         
         Args:
-            z, x, y: XYZ tile coordinates
-            image_data: Tile image as bytes (PNG or JPEG)
+            image: QImage tile
+            zoom: Zoom level of the tile (for timing statistics)
+        
+        Returns:
+            concurrent.futures.Future resolving to what encode() returns
         """
-        # Convert XYZ (origin top-left) to TMS (origin bottom-left)
-        tms_y = (2 ** z) - 1 - y
-        self.cursor.execute(
-            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
-            (z, x, tms_y, image_data)
-        )
-    
-    def commit(self):
-        self.conn.commit()
-    
-    def close(self):
-        """Close the database connection."""
-        self.conn.commit()
-        self.conn.close()
+        pixel = uniform_tile_pixel(image)
+        if pixel is not None or self.pool is None:
+            future = Future()
+            future.set_result(self._encode(image, pixel, zoom))
+            return future
+        return self.pool.submit(self._encode_image, image, zoom)
+    
+    def shutdown(self):
+        """Stop the encoder pool without waiting for running encodes."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+    
+    def _encode(self, image, pixel, zoom=None):
+        if pixel is None:
+            return self._encode_image(image, zoom)
+        
+        if self.skip_transparent and self.tile_format == 'png' and (pixel >> 24) == 0:
+            self.skipped += 1
+            return None
+        
+        self.uniform += 1
+        key = (pixel, image.format())
+        blob = self.uniform_blobs.get(key)
+        if blob is None:
+            blob = self._encode_image(image, zoom)
+            self.uniform_blobs[key] = blob
+        return blob
+    
+    def _encode_image(self, image, zoom):
+        """encode_tile_image() with the encoder settings, timed if stats are on."""
+        if self.stats is None:
+            return encode_tile_image(image, self.tile_format, self.jpeg_quality)
+        with self.stats.timed(STAGE_ENCODE, zoom):
+            return encode_tile_image(image, self.tile_format, self.jpeg_quality)
 
-# ======================================================
-# 3. TILE RENDERER
-# ======================================================
 class ShapedTileRenderer:
     """
     Renders map tiles with polygon clipping using QPainter paths.
     
     Rendering approach:
-    1. Create image buffer with background color
-    2. Set QPainter clip path to polygon (if needed)
-    3. Render map layers - only pixels inside clip path are drawn
-    4. Crop to final tile size (if using metatiling)
+    1. Plan the render (extent, size, clip path, tile crops)
+    2. Create image buffer with background color
+    3. Set QPainter clip path to polygon (if needed) and render map layers -
+       only pixels inside clip path are drawn. Background jobs (start_job)
+       render unclipped and the clip is applied as a mask afterwards
+    4. Crop to final tile size (if using metatiling), or slice a whole
+       block into tiles (render_metatile)
     
     Optimizations:
-    - Skips clipping for tiles fully inside polygon (containment test)
+    - Skips clipping for tiles fully inside polygon (classification carried
+      over from enumeration, so no containment test is repeated here)
+    - Clipping uses prepared geometry (PolygonPredicates) and one polygon
+      path per zoom, translated to each canvas (no per-tile intersection)
     - Uses meta-tiling to prevent label clipping at tile edges
+    - Block metatiles render N×N tiles at once instead of one padded
+      canvas per tile (render_metatile)
+    - Pyramid mode builds lower zooms from their four children instead of
+      rendering them (downsample_tile)
     - Configurable DPI and antialiasing for quality/speed trade-offs
     - Reuses QgsMapSettings across all tiles (only extent/size change per tile)
     """
     
     def __init__(self, polygon_geom_3857, layers, tile_format='png', background_color=None, 
-                 dpi=96, antialias=True, metatile_size=4):
+                 dpi=96, antialias=True, metatile_size=4, predicates=None, stats=None):
         """
         Initialize renderer.
         
@@ -353,14 +804,22 @@ class ShapedTileRenderer:
             dpi: Dots per inch for rendering (48-384)
             antialias: Enable antialiasing (slower but smoother)
             metatile_size: Render multiplier for edge buffering (1-20, default 4)
+            predicates: Shared PolygonPredicates (built here if not given)
+            stats: RunStats receiving clip path, render and crop timings
         """
         self.polygon = polygon_geom_3857
+        self.predicates = predicates or PolygonPredicates(polygon_geom_3857)
         self.tile_format = tile_format
         self.background_color = background_color
         self.dpi = dpi
         self.antialias = antialias
         self.metatile_size = metatile_size
+        self.stats = stats
+        self._renders = 0  # Renders so far, for sampling the layer profile
         self.web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
+        # (cell x, cell y) -> polygon QPainterPath of the current zoom (see _cell_path)
+        self._cell_paths = {}
+        self._cell_paths_zoom = None
         
         # Pre-configure map settings (reused across all tiles)
         # Only extent and output size change per tile
@@ -371,29 +830,35 @@ class ShapedTileRenderer:
         self.map_settings.setFlag(QgsMapSettings.Antialiasing, antialias)
         self.map_settings.setFlag(QgsMapSettings.UseAdvancedEffects, antialias)
         
-    def render_tile(self, z, x, y):
+    def plan_tile(self, z, x, y, tile_class=None):
         """
-        Render a single tile with polygon clipping.
+        Plan the render of a single tile with polygon clipping.
         
         Process:
-        1. Calculate tile extent and check if fully inside polygon
+        1. Calculate tile extent (and classify it if enumeration didn't)
         2. Calculate render size with metatile buffer
-        3. Create image buffer with background
-        4. Set clip path if needed (tiles crossing polygon boundary)
-        5. Render map with QgsMapRendererCustomPainterJob
-        6. Crop to final 256×256 tile size
+        3. Compute clip path for boundary tiles (clipped over the full render
+           extent, so the metatile margin is handled as well)
+        
+        Inside tiles need no geometry work at all. Boundary tiles need one
+        prepared intersection for the clip path. Outside tiles (or boundary
+        tiles whose clip turns out empty) need no render at all.
         
         Args:
             z, x, y: XYZ tile coordinates
+            tile_class: TILE_INSIDE, TILE_BOUNDARY or TILE_OUTSIDE as emitted
+                        by iter_intersecting_tiles(). None = classify here.
         
         Returns:
-            QImage of size 256×256 pixels
+            RenderPlan with one crop (the centre 256×256 tile)
         """
         extent = tile_to_extent(z, x, y)
-        tile_geom = QgsGeometry.fromRect(extent)
         
-        # Optimization: Skip clipping overhead for tiles fully inside polygon
-        tile_fully_inside = self.polygon.contains(tile_geom)
+        if tile_class is None:
+            tile_class = self.predicates.classify(extent)
+        
+        if tile_class == TILE_OUTSIDE:
+            return RenderPlan(None, TILE_SIZE, None, [(x, y, 0, 0)], z)
         
         # Calculate render size based on metatile size
         render_size = TILE_SIZE * self.metatile_size
@@ -408,76 +873,420 @@ class ShapedTileRenderer:
             extent.xMaximum() + expand_x,
             extent.yMaximum() + expand_y
         )
+        buffer_px = (render_size - TILE_SIZE) // 2
+        
+        # Boundary tiles: compute clip path BEFORE rendering
+        clip_path = None
+        if tile_class == TILE_BOUNDARY:
+            clip_path = self._get_clip_path(z, render_extent, render_size)
+            if clip_path is None:
+                # Polygon doesn't reach the render area - nothing to draw
+                return RenderPlan(None, TILE_SIZE, None, [(x, y, 0, 0)], z)
+        
+        return RenderPlan(render_extent, render_size, clip_path,
+                          [(x, y, buffer_px, buffer_px)], z)
+    
+    def plan_metatile(self, z, block_x, block_y, block_size, tiles):
+        """
+        Plan the render of an aligned block of tiles (block metatile).
+        
+        The block is rendered with METATILE_BUFFER_PX extra pixels on every
+        side so labels crossing the block edge are placed the same way in
+        neighbouring blocks. Only the tiles listed are cut out; the clip
+        path is computed once for the whole block if any tile is a boundary
+        tile.
+        
+        Args:
+            z: Zoom level
+            block_x, block_y: Block coordinates (tile coordinates // block_size)
+            block_size: Block edge length in tiles
+            tiles: List of (x, y, tile_class) inside this block
+        
+        Returns:
+            RenderPlan with one crop per listed tile
+        """
+        # At low zooms the world is smaller than one block
+        n = min(block_size, 2 ** z)
+        x0 = block_x * block_size
+        y0 = block_y * block_size
+        crops = [(x, y, METATILE_BUFFER_PX + (x - x0) * TILE_SIZE,
+                  METATILE_BUFFER_PX + (y - y0) * TILE_SIZE)
+                 for x, y, _ in tiles]
+        
+        top_left = tile_to_extent(z, x0, y0)
+        bottom_right = tile_to_extent(z, x0 + n - 1, y0 + n - 1)
+        buffer_m = METATILE_BUFFER_PX * top_left.width() / TILE_SIZE
+        render_extent = QgsRectangle(
+            top_left.xMinimum() - buffer_m,
+            bottom_right.yMinimum() - buffer_m,
+            bottom_right.xMaximum() + buffer_m,
+            top_left.yMaximum() + buffer_m
+        )
+        render_size = n * TILE_SIZE + 2 * METATILE_BUFFER_PX
+        
+        # One clip path for the block, only if it touches the polygon edge
+        clip_path = None
+        if any(tile_class != TILE_INSIDE for _, _, tile_class in tiles):
+            clip_path = self._get_clip_path(z, render_extent, render_size)
+            if clip_path is None:
+                return RenderPlan(None, render_size, None, crops, z)
+        
+        return RenderPlan(render_extent, render_size, clip_path, crops, z)
+    
+    def render_tile(self, z, x, y, tile_class=None):
+        """
+        Render a single tile on the calling (main) thread.
+        
+        Args:
+            z, x, y: XYZ tile coordinates
+            tile_class: Tile class from enumeration, None = classify here
+        
+        Returns:
+            QImage of size 256×256 pixels
+        """
+        return self.render_plan(self.plan_tile(z, x, y, tile_class))[0][2]
+    
+    def render_metatile(self, z, block_x, block_y, block_size, tiles):
+        """
+        Render an aligned block of tiles once and slice it into tiles.
+        
+        Args:
+            z: Zoom level
+            block_x, block_y: Block coordinates (tile coordinates // block_size)
+            block_size: Block edge length in tiles
+            tiles: List of (x, y, tile_class) inside this block
+        
+        Returns:
+            List of (x, y, QImage) with 256×256 tile images
+        """
+        return self.render_plan(self.plan_metatile(z, block_x, block_y, block_size, tiles))
+    
+    def render_plan(self, plan):
+        """
+        Render a plan with QgsMapRendererCustomPainterJob (main thread).
         
-        # Update only the per-tile settings (extent and size)
-        self.map_settings.setOutputSize(QSize(render_size, render_size))
-        self.map_settings.setExtent(render_extent)
+        The clip path is set on the painter, so only pixels inside the
+        polygon are drawn.
         
-        # Determine background color
-        if self.background_color:
-            bg_color = self.background_color
+        Args:
+            plan: RenderPlan from plan_tile() or plan_metatile()
+        
+        Returns:
+            List of (x, y, QImage) with 256×256 tile images
+        """
+        if plan.extent is None:
+            return self._blank_tiles(plan)
+        
+        # Update only the per-render settings (extent and size)
+        self.map_settings.setOutputSize(QSize(plan.size, plan.size))
+        self.map_settings.setExtent(plan.extent)
+        
+        render_image = self._create_image(plan.size)
+        
+        painter = QPainter(render_image)
+        if self.antialias:
+            painter.setRenderHint(QPainter.Antialiasing, True)
+        if plan.clip_path is not None:
+            painter.setClipPath(plan.clip_path)
+        
+        # Render map - with clipping, only pixels inside the path are drawn
+        start = time.perf_counter()
+        job = QgsMapRendererCustomPainterJob(self.map_settings, painter)
+        job.start()
+        job.waitForFinished()
+        
+        painter.end()
+        
+        if self.stats is None:
+            return self._slice(render_image, plan)
+        sliced = time.perf_counter()
+        tiles = self._slice(render_image, plan)
+        self._record(STAGE_RENDER, sliced - start, plan)
+        self._record(STAGE_CROP, time.perf_counter() - sliced, plan)
+        self._record_layers(plan)
+        return tiles
+    
+    def start_job(self, plan, backend=RENDER_BACKEND_PARALLEL):
+        """
+        Start a background image render job for a plan.
+        
+        QgsMapRendererParallelJob (one thread per layer) and
+        QgsMapRendererSequentialJob render into their own QImage off the GUI
+        thread, so several plans can be in flight at once. The job renders
+        on a transparent background; finish_job() applies the background and
+        the polygon clip afterwards.
+        
+        Args:
+            plan: RenderPlan with an extent (blank plans need no job)
+            backend: RENDER_BACKEND_PARALLEL or RENDER_BACKEND_SEQUENTIAL
+        
+        Returns:
+            Started QgsMapRendererQImageJob; connect to its finished signal
+        """
+        settings = QgsMapSettings(self.map_settings)
+        settings.setOutputSize(QSize(plan.size, plan.size))
+        settings.setExtent(plan.extent)
+        settings.setBackgroundColor(QColor(Qt.transparent))
+        
+        if backend == RENDER_BACKEND_SEQUENTIAL:
+            job = QgsMapRendererSequentialJob(settings)
         else:
-            # Default to transparent for PNG, white for JPG
-            bg_color = Qt.transparent if self.tile_format == 'png' else QColor("white")
+            job = QgsMapRendererParallelJob(settings)
+        job.start()
+        return job
+    
+    def finish_job(self, job, plan):
+        """
+        Composite a finished background job and slice it into tiles.
+        
+        The rendered image is drawn over the tile background through the
+        clip path, which masks everything outside the polygon.
+        
+        Args:
+            job: Finished job from start_job()
+            plan: RenderPlan the job was started for
+        
+        Returns:
+            List of (x, y, QImage) with 256×256 tile images
+        """
+        start = time.perf_counter()
+        render_image = self._create_image(plan.size)
+        
+        painter = QPainter(render_image)
+        if self.antialias:
+            painter.setRenderHint(QPainter.Antialiasing, True)
+        if plan.clip_path is not None:
+            painter.setClipPath(plan.clip_path)
+        painter.drawImage(0, 0, job.renderedImage())
+        painter.end()
+        
+        tiles = self._slice(render_image, plan)
+        if self.stats is not None:
+            # The job ran off the GUI thread; its own timer is the render time
+            self._record(STAGE_RENDER, job.renderingTime() / 1000.0, plan)
+            self._record(STAGE_CROP, time.perf_counter() - start, plan)
+            self._record_layers(plan)
+        return tiles
+    
+    def downsample_tile(self, z, x, y, children, tile_class=None):
+        """
+        Build a tile from its four children at zoom z + 1 (pyramid mode).
+        
+        Each child is scaled to a quarter tile with smooth (filtered)
+        scaling and drawn into its quadrant over the tile background,
+        through the polygon clip path for boundary tiles. Missing children
+        (outside the polygon or skipped as empty) leave their quadrant blank.
+        
+        Args:
+            z, x, y: XYZ coordinates of the tile to build
+            children: Encoded images (bytes or None) of the children
+                      (2x, 2y), (2x+1, 2y), (2x, 2y+1), (2x+1, 2y+1)
+            tile_class: Tile class from enumeration, None = classify here
+        
+        Returns:
+            QImage of size 256×256 pixels
+        """
+        image = self._create_image(TILE_SIZE)
+        extent = tile_to_extent(z, x, y)
         
-        # Create image with appropriate format
-        if self.tile_format == 'png' and not self.background_color:
-            render_image = QImage(render_size, render_size, QImage.Format_ARGB32)
-            render_image.fill(Qt.transparent)
-        else:
-            render_image = QImage(render_size, render_size, QImage.Format_RGB32)
-            render_image.fill(bg_color)
+        if tile_class is None:
+            tile_class = self.predicates.classify(extent)
+        if tile_class == TILE_OUTSIDE:
+            return image
         
-        # Set DPI for the image
-        render_image.setDotsPerMeterX(int(self.dpi / 0.0254))
-        render_image.setDotsPerMeterY(int(self.dpi / 0.0254))
+        clip_path = None
+        if tile_class == TILE_BOUNDARY:
+            clip_path = self._get_clip_path(z, extent, TILE_SIZE)
+            if clip_path is None:
+                return image
         
-        painter = QPainter(render_image)
+        half = TILE_SIZE // 2
+        painter = QPainter(image)
         if self.antialias:
             painter.setRenderHint(QPainter.Antialiasing, True)
+        if clip_path is not None:
+            painter.setClipPath(clip_path)
+        for i, data in enumerate(children):
+            if not data:
+                continue
+            child = QImage.fromData(data)
+            if child.isNull():
+                continue
+            child = child.scaled(half, half, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            painter.drawImage((i % 2) * half, (i // 2) * half, child)
+        painter.end()
         
-        # If tile is NOT fully inside, set clip path BEFORE rendering
-        if not tile_fully_inside:
-            clip_path = self._get_clip_path(render_extent, render_size)
-            if clip_path:
-                painter.setClipPath(clip_path)
+        return image
+    
+    def _blank_tiles(self, plan):
+        """Background-only tiles for a plan that needs no render."""
+        return [(x, y, self._create_image(TILE_SIZE)) for x, y, _, _ in plan.crops]
+    
+    def _slice(self, render_image, plan):
+        """Cut the 256×256 tiles of a plan out of its rendered image."""
+        return [(x, y, render_image.copy(left, top, TILE_SIZE, TILE_SIZE))
+                for x, y, left, top in plan.crops]
+    
+    def _record(self, stage, seconds, plan):
+        """Record a render stage of a plan, classed boundary if it was clipped."""
+        tile_class = TILE_BOUNDARY if plan.clip_path is not None else TILE_INSIDE
+        self.stats.record(stage, seconds, plan.zoom, tile_class)
+    
+    def _record_layers(self, plan):
+        """
+        Sample each layer's render time for the layer profile.
         
-        # Render map - with clipping, only pixels inside the path are drawn
-        job = QgsMapRendererCustomPainterJob(self.map_settings, painter)
-        job.start()
-        job.waitForFinished()
+        PyQGIS doesn't expose the per-layer times of a render job
+        (perLayerRenderingTime() is not wrapped), so every
+        LAYER_PROFILE_EVERY-th render, starting with the first, is rendered
+        again once per layer: each layer alone, with a custom painter job
+        into a scratch image of the same size and extent, through the same
+        clip path. Each sample stands for LAYER_PROFILE_EVERY renders, so
+        the profile's totals estimate the whole export. The time spent on
+        the samples is recorded as STAGE_LAYER_PROFILE.
         
-        painter.end()
+        Args:
+            plan: RenderPlan that was just rendered
+        """
+        self._renders += 1
+        if (self._renders - 1) % LAYER_PROFILE_EVERY:
+            return
+        start = time.perf_counter()
+        settings = QgsMapSettings(self.map_settings)
+        settings.setOutputSize(QSize(plan.size, plan.size))
+        settings.setExtent(plan.extent)
+        settings.setBackgroundColor(QColor(Qt.transparent))
+        image = QImage(plan.size, plan.size, QImage.Format_ARGB32_Premultiplied)
+        
+        layer_times = []
+        for layer in self.map_settings.layers():
+            settings.setLayers([layer])
+            image.fill(Qt.transparent)
+            painter = QPainter(image)
+            if self.antialias:
+                painter.setRenderHint(QPainter.Antialiasing, True)
+            if plan.clip_path is not None:
+                painter.setClipPath(plan.clip_path)
+            layer_start = time.perf_counter()
+            job = QgsMapRendererCustomPainterJob(settings, painter)
+            job.start()
+            job.waitForFinished()
+            layer_times.append((layer.id(), layer.name(), time.perf_counter() - layer_start))
+            painter.end()
+        
+        x, y = plan.crops[0][:2]
+        self.stats.record_layers(layer_times, plan.zoom, (x, y), LAYER_PROFILE_EVERY)
+        self._record(STAGE_LAYER_PROFILE, time.perf_counter() - start, plan)
+    
+    def _create_image(self, size):
+        """
+        Create a square image filled with the tile background.
         
-        # Crop to final tile size
-        buffer_px = (render_size - TILE_SIZE) // 2
-        final_image = render_image.copy(buffer_px, buffer_px, TILE_SIZE, TILE_SIZE)
+        Args:
+            size: Image width and height in pixels
+        
+        Returns:
+            QImage (ARGB32 transparent for PNG without background color,
+            otherwise RGB32 filled with the background color)
+        """
+        if self.tile_format == 'png' and not self.background_color:
+            image = QImage(size, size, QImage.Format_ARGB32)
+            image.fill(Qt.transparent)
+        else:
+            # Default to white for JPG
+            image = QImage(size, size, QImage.Format_RGB32)
+            image.fill(self.background_color or QColor("white"))
         
-        return final_image
+        # Set DPI for the image
+        image.setDotsPerMeterX(int(self.dpi / 0.0254))
+        image.setDotsPerMeterY(int(self.dpi / 0.0254))
+        return image
     
-    def _get_clip_path(self, extent, render_size):
+    def _get_clip_path(self, z, extent, render_size):
         """
         Calculate QPainterPath for clipping this tile to the polygon.
         
         Process:
-        1. Intersect polygon with render extent
-        2. Convert resulting geometry to QPainterPath in pixel coordinates
+        1. Test the render extent against the polygon (prepared geometry)
+        2. Translate the path of the clip cell holding the canvas
+           (_cell_path) to the canvas; Qt clips it to the canvas while
+           painting
+        
+        No intersection is computed per tile and no vertex is visited in
+        Python; the translation copies only the polygon's vertices near
+        the canvas, and every coordinate stays within a few thousand
+        pixels, far inside the range of Qt's raster engine.
         
         Args:
+            z: Zoom level of the render
             extent: QgsRectangle of render area in Web Mercator meters
             render_size: Size of render buffer in pixels
         
         Returns:
             QPainterPath for clipping, or None if no intersection
         """
-        render_geom = QgsGeometry.fromRect(extent)
-        clipped = self.polygon.intersection(render_geom)
-        
-        if clipped.isEmpty():
+        start = time.perf_counter()
+        if not self.predicates.intersects(extent):
             # Tile is entirely outside polygon - nothing to render
-            return None
+            clip_path = None
+        else:
+            # Canvas origin in the zoom's global pixel space
+            scale = render_size / extent.width()
+            left = (extent.xMinimum() + ORIGIN_SHIFT) * scale
+            top = (ORIGIN_SHIFT - extent.yMaximum()) * scale
+            cell_px = CLIP_CELL_TILES * TILE_SIZE
+            cell_x = math.floor(left / cell_px)
+            cell_y = math.floor(top / cell_px)
+            path = self._cell_path(z, cell_x, cell_y)
+            # The cell path starts TILE_SIZE pixels before the cell origin
+            clip_path = path.translated(cell_x * cell_px - TILE_SIZE - left,
+                                        cell_y * cell_px - TILE_SIZE - top)
+        if self.stats is not None:
+            self.stats.record(STAGE_CLIP, time.perf_counter() - start, z, TILE_BOUNDARY)
+        return clip_path
+    
+    def _cell_path(self, z, cell_x, cell_y):
+        """
+        The polygon near one clip cell as a QPainterPath relative to the cell.
+        
+        A clip cell is a square of CLIP_CELL_TILES × CLIP_CELL_TILES tiles of
+        zoom z. Every canvas whose top-left corner lies in the cell fits in
+        the cell grown by TILE_SIZE pixels on the top and left and by
+        MAX_RENDER_PIXELS + TILE_SIZE on the bottom and right, so the
+        polygon is intersected with that square once (prepared geometry) and
+        converted to a path with its origin at the square's top-left corner
+        (the only per-vertex Python loop). Paths are cached for the current
+        zoom; moving to another zoom drops them.
+        
+        Args:
+            z: Zoom level
+            cell_x, cell_y: Cell coordinates in the zoom's global pixel
+                            space divided by the cell size
         
-        return self._geometry_to_path(clipped, extent, render_size)
+        Returns:
+            QPainterPath with the polygon clipped to the grown cell
+        """
+        if z != self._cell_paths_zoom:
+            self._cell_paths = {}
+            self._cell_paths_zoom = z
+        path = self._cell_paths.get((cell_x, cell_y))
+        if path is None:
+            cell_px = CLIP_CELL_TILES * TILE_SIZE
+            size_px = cell_px + MAX_RENDER_PIXELS + 2 * TILE_SIZE
+            meters_per_px = 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** z)
+            left = (cell_x * cell_px - TILE_SIZE) * meters_per_px - ORIGIN_SHIFT
+            top = ORIGIN_SHIFT - (cell_y * cell_px - TILE_SIZE) * meters_per_px
+            cell = QgsRectangle(left, top - size_px * meters_per_px,
+                                left + size_px * meters_per_px, top)
+            clipped = self.predicates.intersection(cell)
+            if clipped.type() != QgsWkbTypes.PolygonGeometry:
+                # Edges along the cell border come back as lines or points
+                clipped = QgsGeometry.collectGeometry(
+                    [part for part in clipped.asGeometryCollection()
+                     if part.type() == QgsWkbTypes.PolygonGeometry])
+            path = self._geometry_to_path(clipped, cell, size_px)
+            self._cell_paths[(cell_x, cell_y)] = path
+        return path
     
     def _geometry_to_path(self, geom, extent, image_size=TILE_SIZE):
         """
@@ -531,6 +1340,92 @@ class ShapedTileRenderer:
 # ======================================================
 # 4. INCREMENTAL TILE GENERATOR
 # ======================================================
+def job_definition(settings):
+    """
+    JSON-serializable definition of an export: polygon and render settings.
+    
+    Stored in the MBTiles metadata (so an interrupted export can be resumed)
+    and used as the base of render farm jobs.
+    
+    Args:
+        settings: Settings dict from ShapedTileConfigDialog.get_settings()
+    
+    Returns:
+        Dict of plain JSON values
+    """
+    polygon = settings['POLYGON_3857']
+    background = settings.get('BACKGROUND_COLOR')
+    return {
+        'polygon_wkb': bytes(polygon.asWkb()).hex(),
+        'bounds': polygon_wgs84_bounds(polygon),
+        'zoom_min': settings['ZOOM_MIN'],
+        'zoom_max': settings['ZOOM_MAX'],
+        'tile_format': settings['TILE_FORMAT'],
+        'jpeg_quality': settings.get('JPEG_QUALITY', 75),
+        'dpi': settings.get('DPI', 96),
+        'antialias': settings.get('ANTIALIAS', True),
+        'background_color': background.name(QColor.HexArgb) if background else None,
+        'metatile_size': settings.get('METATILE_SIZE', 4),
+        'metatile_blocks': settings.get('METATILE_BLOCKS', True),
+        'pyramid_levels': settings.get('PYRAMID_LEVELS', 0),
+        'tile_order': settings.get('TILE_ORDER', ORDER_ROWS),
+        'render_backend': settings.get('RENDER_BACKEND', RENDER_BACKEND_PAINTER),
+        'sqlite_profile': settings.get('SQLITE_PROFILE', SQLITE_PROFILE_SAFE),
+        'deduplicate': settings.get('DEDUPLICATE', False),
+        'stats_report': settings.get('STATS_REPORT', False),
+        'stats_metadata': settings.get('STATS_METADATA', False)
+    }
+
+def settings_from_job(job, output_file):
+    """
+    Rebuild generator settings from a job_definition() dict.
+    
+    The tile sets are enumerated again from the stored polygon (the
+    scanline enumeration is deterministic, so they match the original run).
+    
+    Args:
+        job: Dict from job_definition()
+        output_file: MBTiles file to write
+    
+    Returns:
+        Settings dict as returned by ShapedTileConfigDialog.get_settings()
+    """
+    polygon = QgsGeometry()
+    polygon.fromWkb(bytes.fromhex(job['polygon_wkb']))
+    rings = _polygon_rings(polygon)
+    zoom_sets = []
+    seconds = {}
+    for z in range(job['zoom_min'], job['zoom_max'] + 1):
+        start = time.perf_counter()
+        zoom_sets.append(scanline_zoom_tile_sets(rings, z))
+        seconds[z] = time.perf_counter() - start
+    tiles, boundary_tiles = merge_zoom_tile_sets(zoom_sets)
+    background = job.get('background_color')
+    return {
+        'ZOOM_MIN': job['zoom_min'],
+        'ZOOM_MAX': job['zoom_max'],
+        'DPI': job['dpi'],
+        'BACKGROUND_COLOR': QColor(background) if background else None,
+        'ANTIALIAS': job['antialias'],
+        'TILE_FORMAT': job['tile_format'],
+        'JPEG_QUALITY': job['jpeg_quality'],
+        'METATILE_SIZE': job['metatile_size'],
+        'METATILE_BLOCKS': job['metatile_blocks'],
+        'PYRAMID_LEVELS': job.get('pyramid_levels', 0),
+        'TILE_ORDER': job.get('tile_order', ORDER_ROWS),
+        'RENDER_BACKEND': job.get('render_backend', RENDER_BACKEND_PAINTER),
+        'SQLITE_PROFILE': job.get('sqlite_profile', SQLITE_PROFILE_SAFE),
+        'DEDUPLICATE': job.get('deduplicate', False),
+        'STATS_REPORT': job.get('stats_report', False),
+        'STATS_METADATA': job.get('stats_metadata', False),
+        'OUTPUT_FILE': output_file,
+        'TILES': tiles,
+        'ENUMERATION_SECONDS': seconds,
+        'BOUNDARY_TILES': boundary_tiles,
+        'TILE_COUNT': len(tiles),
+        'POLYGON_3857': polygon
+    }
+
 class IncrementalTileGenerator(QObject):
     """
     Generates tiles incrementally using QTimer to keep UI responsive.
@@ -540,10 +1435,39 @@ class IncrementalTileGenerator(QObject):
     This is necessary because QPainter and QgsMapRendererCustomPainterJob
     require main thread execution.
     
+    Each timer tick keeps rendering until the frame budget
+    (settings['FRAME_BUDGET_MS'], default FRAME_BUDGET_MS) is used up, so
+    cheap tiles don't pay an event-loop round trip each. Progress dialog
+    updates are throttled to PROGRESS_INTERVAL_S.
+    
     Benefits over blocking loop with processEvents():
     - Proper event loop integration (no re-entrancy bugs)
     - Clean cancellation via dialog
     - Progress updates without blocking
+    
+    With the parallel or sequential backend (settings['RENDER_BACKEND']),
+    rendering moves off the main thread: up to QThread.idealThreadCount()
+    QgsMapRendererParallelJob/SequentialJob renders are kept in flight, and
+    the main thread only plans renders, applies the clip mask and writes
+    finished tiles as each job's finished signal arrives.
+    
+    Resume: the job definition is stored in the MBTiles metadata, and a
+    checkpoint (the key of the last work item completed in enumeration
+    order) is queued to the writer every CHECKPOINT_INTERVAL_S. A resumed
+    run (settings['RESUME_CURSOR']) skips work items up to the checkpoint;
+    resume_export() also drops tiles already stored.
+    
+    Pyramid mode (settings['PYRAMID_LEVELS'] > 0): only the top
+    PYRAMID_LEVELS zooms are rendered. Each lower zoom is then built, from
+    the top down, by reading the four children of every tile back from the
+    writer and downsampling them (ShapedTileRenderer.downsample_tile).
+    
+    Timing statistics (settings['STATS_REPORT'] / ['STATS_METADATA']): the
+    renderer, encoder and writer thread record per-stage durations into a
+    RunStats, written at the end as "<output>.stats.json" and/or as the
+    STATS_METADATA_KEY metadata row. The renderer also records per-layer
+    render times; the most expensive layers are shown in the progress
+    dialog.
     """
     
     finished = pyqtSignal(bool, str)  # success, message
@@ -554,12 +1478,56 @@ class IncrementalTileGenerator(QObject):
         self.layers = layers
         self.on_complete_callback = on_complete_callback
         
+        # Tiles are pulled lazily from the compact TileSet; boundary
+        # membership gives each tile's class without a geometry test
         self.tiles = settings['TILES']
+        self.boundary_tiles = settings['BOUNDARY_TILES']
+        self.total_tiles = len(self.tiles)
+        # Order within each zoom: rows, or a curve for render-cache locality
+        self.tile_order = settings.get('TILE_ORDER', ORDER_ROWS)
+        if self.tile_order == ORDER_ROWS:
+            self.tile_iter = iter(self.tiles)
+        else:
+            self.tile_iter = ((z, x, y) for z, x, y, _ in self.tiles.iter_blocks(1, self.tile_order))
+        # Block metatiles: one render per aligned N×N block of tiles
+        self.block_size = None
+        if settings.get('METATILE_BLOCKS', True):
+            self.block_size = metatile_block_size(settings.get('METATILE_SIZE', 4))
+            self.block_iter = self.tiles.iter_blocks(self.block_size, self.tile_order)
+        # Work items (blocks or tiles) not fully written yet, in enumeration
+        # order: [key, tiles left]. Everything up to done_through is written.
+        self.open_items = deque()
+        cursor = settings.get('RESUME_CURSOR')
+        self.done_through = tuple(cursor) if cursor else None
+        self.resume_cursor = self.done_through
+        self.last_checkpoint = time.time()
+        # Pyramid mode: zooms below render_zoom_min are built from children
+        levels = settings.get('PYRAMID_LEVELS', 0)
+        self.render_zoom_min = settings['ZOOM_MIN']
+        if levels:
+            self.render_zoom_min = max(settings['ZOOM_MIN'], settings['ZOOM_MAX'] - levels + 1)
+        self.pyramid_iter = None
+        self.pyramid_zoom = None
+        # Background render jobs in flight: job -> (z, RenderPlan, work item)
+        self.backend = settings.get('RENDER_BACKEND', RENDER_BACKEND_PAINTER)
+        self.max_jobs = max(2, QThread.idealThreadCount())
+        self.jobs = {}
+        # Time budget per timer tick and progress throttling
+        self.frame_budget = settings.get('FRAME_BUDGET_MS', FRAME_BUDGET_MS) / 1000.0
+        self.last_progress_update = 0.0
+        # Prepared polygon predicates shared by the renderer's clipping
+        self.predicates = PolygonPredicates(settings['POLYGON_3857'])
         self.current_index = 0
         self.tiles_generated = 0
         self.start_time = None
         self.cancelled = False
         self.finished = False  # Prevents double-finish from dialog close signal
+        # Per-stage timings, only collected when a report was requested
+        self.stats = None
+        if settings.get('STATS_REPORT') or settings.get('STATS_METADATA'):
+            self.stats = RunStats()
+            for z, seconds in settings.get('ENUMERATION_SECONDS', {}).items():
+                self.stats.record(STAGE_ENUMERATE, seconds, z)
         
         # Initialize components
         self._init_writer()
@@ -571,28 +1539,38 @@ class IncrementalTileGenerator(QObject):
         self.timer.timeout.connect(self._process_next_tile)
     
     def _init_writer(self):
-        """Initialize MBTiles database writer."""
+        """
+        Initialize the MBTiles database writer (PMTiles archive for .pmtiles,
+        z/x/y folder tree for a path without extension).
+        
+        The database is written on a dedicated thread behind a bounded
+        queue (ThreadedTileWriter), which batches inserts and commits by
+        size or time.
+        """
         polygon = self.settings['POLYGON_3857']
         output_path = self.settings['OUTPUT_FILE']
         tile_format = self.settings['TILE_FORMAT']
         
         # Calculate bounds in WGS84
-        wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
-        web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
-        to_wgs84 = QgsCoordinateTransform(web_mercator, wgs84, QgsProject.instance())
-        bbox_wgs84 = to_wgs84.transformBoundingBox(polygon.boundingBox())
-        bounds = (bbox_wgs84.xMinimum(), bbox_wgs84.yMinimum(), 
-                  bbox_wgs84.xMaximum(), bbox_wgs84.yMaximum())
-        
-        self.writer = MBTilesWriter(
+        bounds = polygon_wgs84_bounds(polygon)
+        
+        self.writer = ThreadedTileWriter(lambda: create_writer(
             output_path,
             name="Shaped Export",
             description="Generated by QGIS",
             tile_format=tile_format,
             bounds=bounds,
             min_zoom=self.settings['ZOOM_MIN'],
-            max_zoom=self.settings['ZOOM_MAX']
-        )
+            max_zoom=self.settings['ZOOM_MAX'],
+            profile=self.settings.get('SQLITE_PROFILE', SQLITE_PROFILE_SAFE),
+            deduplicate=self.settings.get('DEDUPLICATE', False),
+            tiles=self.tiles,
+            directory=self.settings.get('OUTPUT_DIRECTORY', False)
+        ), stats=self.stats)
+        # Job definition for resuming an interrupted export
+        self.writer.set_metadata(JOB_METADATA_KEY, json.dumps(job_definition(self.settings)))
+        # Cleared until this run finishes (the file may hold an earlier export)
+        self.writer.set_metadata(COMPLETE_METADATA_KEY, '0')
     
     def _init_renderer(self):
         """Initialize tile renderer with pre-configured map settings."""
@@ -607,10 +1585,19 @@ class IncrementalTileGenerator(QObject):
             background_color=self.settings.get('BACKGROUND_COLOR'),
             dpi=self.settings.get('DPI', 96),
             antialias=self.settings.get('ANTIALIAS', True),
-            metatile_size=metatile_size
+            metatile_size=metatile_size,
+            predicates=self.predicates,
+            stats=self.stats
         )
         self.tile_format = self.settings['TILE_FORMAT']
         self.jpeg_quality = self.settings.get('JPEG_QUALITY', 75)
+        # Encoding runs on a thread pool while the main loop keeps rendering;
+        # encoded tiles wait here (in submission order) to be written
+        encoder_threads = self.settings.get('ENCODER_THREADS', max(1, QThread.idealThreadCount()))
+        self.encoder = TileEncoder(self.tile_format, self.jpeg_quality, workers=encoder_threads,
+                                   stats=self.stats)
+        self.pending_encodes = deque()
+        self.max_pending_encodes = max(64, 4 * encoder_threads)
     
     def _init_progress_dialog(self):
         """Initialize progress dialog."""
@@ -618,7 +1605,7 @@ class IncrementalTileGenerator(QObject):
             "Generating MBTiles...", 
             "Cancel", 
             0, 
-            len(self.tiles), 
+            self.total_tiles, 
             iface.mainWindow()
         )
         self.progress.setWindowModality(Qt.WindowModal)
@@ -629,7 +1616,10 @@ class IncrementalTileGenerator(QObject):
     def start(self):
         """Start tile generation."""
         self.start_time = time.time()
-        self.timer.start(0)  # Process as fast as possible, yielding to event loop
+        if self.backend == RENDER_BACKEND_PAINTER:
+            self.timer.start(0)  # Process as fast as possible, yielding to event loop
+        else:
+            self._fill_jobs()
     
     def _on_cancel(self):
         """Handle cancel button click."""
@@ -640,51 +1630,281 @@ class IncrementalTileGenerator(QObject):
             self.timer.stop()
             self._finish(False, "Generation cancelled by user")
     
+    def _next_plan(self):
+        """
+        Plan the next render: a metatile block or a single tile.
+        
+        Work items up to the resume cursor are skipped. Each planned item is
+        tracked in open_items until all its tiles are handed to the writer.
+        
+        Returns:
+            (z, RenderPlan, work item), or None when all tiles have been planned
+        """
+        while True:
+            if self.block_size:
+                block = next(self.block_iter, None)
+                if block is None:
+                    return None
+                z, block_x, block_y, block_tiles = block
+                if z < self.render_zoom_min:
+                    continue
+                key = block_order_key(self.tile_order, z, block_x, block_y, self.block_size)
+                if self.resume_cursor is not None and key <= self.resume_cursor:
+                    self.current_index += len(block_tiles)
+                    continue
+                tiles = [(x, y, self._tile_class(z, x, y)) for x, y in block_tiles]
+                plan = self.renderer.plan_metatile(z, block_x, block_y, self.block_size, tiles)
+            else:
+                tile = next(self.tile_iter, None)
+                if tile is None:
+                    return None
+                z, x, y = tile
+                if z < self.render_zoom_min:
+                    continue
+                key = block_order_key(self.tile_order, z, x, y, 1)
+                if self.resume_cursor is not None and key <= self.resume_cursor:
+                    self.current_index += 1
+                    continue
+                # The class from enumeration spares the renderer its containment test
+                plan = self.renderer.plan_tile(z, x, y, self._tile_class(z, x, y))
+            
+            work = [key, len(plan.crops)]
+            self.open_items.append(work)
+            return z, plan, work
+    
     def _process_next_tile(self):
-        """Process the next tile in the queue."""
+        """
+        Process tiles (or metatile blocks) on the main thread.
+        
+        Keeps going until the frame budget for this timer tick is used up,
+        then yields to the event loop. At least one render is done per tick.
+        """
         if self.cancelled:
             return
         
-        if self.current_index >= len(self.tiles):
-            # All tiles processed
+        deadline = time.perf_counter() + self.frame_budget
+        try:
+            while True:
+                item = self._next_plan()
+                if item is None:
+                    # All tiles processed
+                    self.timer.stop()
+                    self._complete()
+                    return
+                
+                # Render (layers already set in renderer) and write its tiles
+                z, plan, work = item
+                for x, y, image in self.renderer.render_plan(plan):
+                    self._write_tile(z, x, y, image, work)
+                
+                if time.perf_counter() >= deadline:
+                    break
+            
+            # Update progress (throttled)
+            self._update_progress(z)
+        
+        except Exception as e:
             self.timer.stop()
-            self._finish(True, f"Generated {self.tiles_generated} tiles")
+            self._finish(False, f"Error at tile {self.current_index}: {str(e)}")
+    
+    def _fill_jobs(self):
+        """Start background render jobs until max_jobs are in flight."""
+        if self.cancelled or self.finished:
             return
         
         try:
-            z, x, y = self.tiles[self.current_index]
-            
-            # Render tile (layers already set in renderer)
-            image = self.renderer.render_tile(z, x, y)
-            
-            # Encode image
-            buffer = QBuffer()
-            buffer.open(QIODevice.WriteOnly)
-            if self.tile_format == 'png':
-                image.save(buffer, "PNG")
-            else:
-                image.save(buffer, "JPEG", self.jpeg_quality)
-            
-            self.writer.write_tile(z, x, y, bytes(buffer.data()))
-            
-            # Batch commit every 100 tiles
-            if (self.current_index + 1) % 100 == 0:
-                self.writer.commit()
-            
-            self.current_index += 1
-            self.tiles_generated += 1
+            while len(self.jobs) < self.max_jobs:
+                item = self._next_plan()
+                if item is None:
+                    break
+                
+                z, plan, work = item
+                if plan.extent is None:
+                    # Nothing to render - write the background tiles right away
+                    for x, y, image in self.renderer.render_plan(plan):
+                        self._write_tile(z, x, y, image, work)
+                    self._update_progress(z)
+                    continue
+                
+                job = self.renderer.start_job(plan, self.backend)
+                self.jobs[job] = (z, plan, work)
+                job.finished.connect(lambda job=job: self._on_job_finished(job))
             
-            # Update progress
+            if not self.jobs:
+                # All tiles planned and every job written
+                self._complete()
+        
+        except Exception as e:
+            self._finish(False, f"Error at tile {self.current_index}: {str(e)}")
+    
+    def _on_job_finished(self, job):
+        """Mask, slice and write a finished background render, then refill."""
+        z, plan, work = self.jobs.pop(job)
+        if self.cancelled or self.finished:
+            return
+        
+        try:
+            for x, y, image in self.renderer.finish_job(job, plan):
+                self._write_tile(z, x, y, image, work)
             self._update_progress(z)
+        except Exception as e:
+            self._finish(False, f"Error at tile {self.current_index}: {str(e)}")
+            return
+        
+        self._fill_jobs()
+    
+    def _pyramid_tiles(self):
+        """Tiles built by downsampling: zoom by zoom from the top, row by row."""
+        for z in range(self.render_zoom_min - 1, self.settings['ZOOM_MIN'] - 1, -1):
+            yield from self.tiles.zoom_subset([z])
+    
+    def _zoom_rank(self, z):
+        """
+        Position of a zoom in processing order (first item of a work key).
+        
+        Rendered zooms keep their zoom level; built zooms come after
+        ZOOM_MAX, in the order they are built (top down), so work keys stay
+        increasing and the resume cursor can be compared with them.
+        """
+        if z >= self.render_zoom_min:
+            return z
+        return self.settings['ZOOM_MAX'] + self.render_zoom_min - z
+    
+    def _build_next_parents(self):
+        """
+        Build pyramid tiles from their children on the main thread.
+        
+        Children are read back through the writer thread, so before the
+        first tile of each zoom every tile of the zoom above is queued to
+        the writer. Keeps going until the frame budget is used up.
+        """
+        if self.cancelled:
+            return
+        
+        deadline = time.perf_counter() + self.frame_budget
+        try:
+            while True:
+                tile = next(self.pyramid_iter, None)
+                if tile is None:
+                    self.timer.stop()
+                    self._complete()
+                    return
+                
+                z, x, y = tile
+                key = (self._zoom_rank(z), y, x)
+                if self.resume_cursor is not None and key <= self.resume_cursor:
+                    self.current_index += 1
+                    continue
+                if z != self.pyramid_zoom:
+                    self._write_encoded(drain=True)
+                    self.pyramid_zoom = z
+                
+                work = [key, 1]
+                self.open_items.append(work)
+                children = [(z + 1, 2 * x + dx, 2 * y + dy) for dy in (0, 1) for dx in (0, 1)]
+                children = self.writer.read_tiles(children)
+                tile_class = self._tile_class(z, x, y)
+                start = time.perf_counter()
+                image = self.renderer.downsample_tile(z, x, y, children, tile_class)
+                if self.stats is not None:
+                    self.stats.record(STAGE_DOWNSAMPLE, time.perf_counter() - start, z, tile_class)
+                self._write_tile(z, x, y, image, work)
+                
+                if time.perf_counter() >= deadline:
+                    break
             
+            self._update_progress(z)
+        
         except Exception as e:
             self.timer.stop()
             self._finish(False, f"Error at tile {self.current_index}: {str(e)}")
     
+    def _success_message(self):
+        """Completion message, mentioning skipped empty tiles."""
+        message = f"Generated {self.tiles_generated} tiles"
+        if self.encoder.skipped:
+            message += f" ({self.encoder.skipped} empty tiles skipped)"
+        if self.stats is not None:
+            layers = self.stats.top_layers(PROGRESS_TOP_LAYERS)
+            if layers:
+                message += "\nMost expensive layers: " + ", ".join(
+                    f"{name} ({total:.1f}s)" for name, total, _ in layers)
+        return message
+    
+    def _tile_class(self, z, x, y):
+        """Tile class from enumeration (boundary membership, no geometry test)."""
+        return TILE_BOUNDARY if (z, x, y) in self.boundary_tiles else TILE_INSIDE
+    
+    def _write_tile(self, z, x, y, image, work):
+        """Hand a rendered tile to the encoder pool and write finished ones."""
+        self.pending_encodes.append((z, x, y, self.encoder.submit(image, z), work))
+        self._write_encoded(wait=len(self.pending_encodes) > self.max_pending_encodes)
+        
+        self.current_index += 1
+        self.tiles_generated += 1
+    
+    def _write_encoded(self, wait=False, drain=False):
+        """
+        Queue encoded tiles for the writer thread, in submission order.
+        
+        Args:
+            wait: Block until the pending queue is back under its limit
+                  (backpressure on the renderer)
+            drain: Block until every pending tile is written
+        """
+        while self.pending_encodes:
+            z, x, y, future, work = self.pending_encodes[0]
+            over_limit = wait and len(self.pending_encodes) > self.max_pending_encodes
+            if not (future.done() or over_limit or drain):
+                break
+            self.pending_encodes.popleft()
+            data = future.result()
+            if data is not None:
+                # Blocks while the write queue is full (backpressure)
+                self.writer.write_tile(z, x, y, data)
+            work[1] -= 1
+        
+        self._advance_cursor()
+    
+    def _advance_cursor(self):
+        """Move the resume cursor past fully written work items; checkpoint periodically."""
+        while self.open_items and self.open_items[0][1] == 0:
+            self.done_through = self.open_items.popleft()[0]
+        if time.time() - self.last_checkpoint >= CHECKPOINT_INTERVAL_S:
+            self._checkpoint()
+    
+    def _checkpoint(self):
+        """
+        Queue the resume cursor to the writer thread.
+        
+        The metadata row is written after every tile queued before it, so it
+        never claims work that isn't stored.
+        """
+        self.last_checkpoint = time.time()
+        if self.done_through is not None:
+            self.writer.set_metadata(CURSOR_METADATA_KEY, json.dumps(self.done_through))
+    
+    def _complete(self):
+        """Write the tiles still being encoded, then build the pyramid or finish."""
+        self._write_encoded(drain=True)
+        if self.pyramid_iter is None and self.render_zoom_min > self.settings['ZOOM_MIN']:
+            # Rendered zooms are done - build the lower zooms from them
+            self.pyramid_iter = self._pyramid_tiles()
+            self.timer.timeout.disconnect()
+            self.timer.timeout.connect(self._build_next_parents)
+            self.timer.start(0)
+            return
+        self._finish(True, self._success_message())
+    
     def _update_progress(self, current_zoom):
-        """Update progress dialog with ETA."""
-        elapsed = time.time() - self.start_time
-        remaining_tiles = len(self.tiles) - self.current_index
+        """Update progress dialog with ETA (at most every PROGRESS_INTERVAL_S)."""
+        now = time.time()
+        if now - self.last_progress_update < PROGRESS_INTERVAL_S:
+            return
+        self.last_progress_update = now
+        
+        elapsed = now - self.start_time
+        remaining_tiles = max(0, self.total_tiles - self.current_index)
         
         if self.current_index > 0:
             per_tile = elapsed / self.current_index
@@ -699,8 +1919,14 @@ class IncrementalTileGenerator(QObject):
         else:
             eta_str = ""
         
+        label = f"Tile {self.current_index}/{self.total_tiles} (Z{current_zoom}){eta_str}"
+        if self.stats is not None:
+            # Layer profile: the layers with the most render time so far
+            for name, total, mean in self.stats.top_layers(PROGRESS_TOP_LAYERS):
+                label += f"\n{name}: {total:.1f}s ({1000 * mean:.0f} ms/render)"
+        
         self.progress.setValue(self.current_index)
-        self.progress.setLabelText(f"Tile {self.current_index}/{len(self.tiles)} (Z{current_zoom}){eta_str}")
+        self.progress.setLabelText(label)
     
     def _finish(self, success, message):
         """Clean up and call completion callback."""
@@ -709,10 +1935,180 @@ class IncrementalTileGenerator(QObject):
             return
         self.finished = True
         
+        # Stop background renders still in flight (their results are dropped);
+        # loop over a copy, a job that finishes meanwhile leaves self.jobs
+        for job in list(self.jobs):
+            job.cancelWithoutBlocking()
+        # Drop tiles still waiting for the encoder (empty after success)
+        for _, _, _, future, _ in self.pending_encodes:
+            future.cancel()
+        self.pending_encodes.clear()
+        self.encoder.shutdown()
+        
+        # Clean-up failures are logged; they must not hide the export's result
+        try:
+            # Final checkpoint, so a cancelled export resumes where it stopped
+            self._checkpoint()
+            if success:
+                # Skipped empty tiles are not stored, so only this marker
+                # tells a resume that nothing is left
+                self.writer.set_metadata(COMPLETE_METADATA_KEY, '1')
+        except Exception as e:
+            _log_warning(f"Final checkpoint failed: {e}")
+        if self.stats is not None and self.settings.get('STATS_METADATA'):
+            try:
+                self.writer.set_metadata(STATS_METADATA_KEY, json.dumps(self._stats_report(success)))
+            except Exception as e:
+                _log_warning(f"Storing the timing report failed: {e}")
         try:
             self.writer.close()
-        except:
-            pass
+        except Exception as e:
+            _log_warning(f"Closing {self.settings['OUTPUT_FILE']} failed: {e}")
+        # Written after closing, so the final commit is included
+        if self.stats is not None and self.settings.get('STATS_REPORT'):
+            try:
+                write_report(self.settings['OUTPUT_FILE'] + STATS_REPORT_SUFFIX,
+                             self._stats_report(success))
+            except OSError as e:
+                _log_warning(f"Writing the timing report failed: {e}")
+        
+        self.progress.close()
+        self.on_complete_callback(success, message)
+    
+    def _stats_report(self, success):
+        """Run report of the timing statistics, with the export settings."""
+        return self.stats.report(
+            output=self.settings['OUTPUT_FILE'],
+            success=success,
+            tiles=self.tiles_generated,
+            skipped=self.encoder.skipped,
+            uniform=self.encoder.uniform,
+            zoom_min=self.settings['ZOOM_MIN'],
+            zoom_max=self.settings['ZOOM_MAX'],
+            render_backend=self.backend,
+            metatile_block_size=self.block_size,
+            tile_order=self.tile_order
+        )
+
+class FarmTileGenerator(QObject):
+    """
+    Generates tiles with the multi-process render farm (shaped_mbtiles_farm).
+    
+    Writes a job folder next to the output file and runs the farm
+    coordinator in a QProcess. The coordinator starts N headless QGIS
+    worker processes that load the saved project, and writes every tile
+    itself. Its "progress <done> <total>" lines drive the progress dialog;
+    Cancel terminates the coordinator, which terminates and joins the
+    worker pool. The job folder is removed when the run ends.
+    
+    Same interface as IncrementalTileGenerator (start() plus completion
+    callback).
+    """
+    
+    def __init__(self, settings, layers, on_complete_callback):
+        super().__init__()
+        self.settings = settings
+        self.on_complete_callback = on_complete_callback
+        self.total_tiles = settings['TILE_COUNT']
+        self.tiles_done = 0
+        self.finished = False
+        self.start_time = None
+        self._stdout = b''
+        
+        self.job_dir = settings['OUTPUT_FILE'] + '.job'
+        job = job_definition(settings)
+        job.update({
+            'project': QgsProject.instance().fileName(),
+            'layers': [layer.id() for layer in layers],
+            'output': settings['OUTPUT_FILE'],
+            'output_directory': settings.get('OUTPUT_DIRECTORY', False),
+            'qgis_prefix_path': QgsApplication.prefixPath()
+        })
+        write_farm_job(self.job_dir, job, settings['TILES'], settings['BOUNDARY_TILES'])
+        
+        self.process = QProcess()
+        self.process.readyReadStandardOutput.connect(self._on_output)
+        self.process.finished.connect(self._on_process_finished)
+        
+        self.progress = QProgressDialog(
+            "Starting render processes...", 
+            "Cancel", 
+            0, 
+            self.total_tiles, 
+            iface.mainWindow()
+        )
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setMinimumDuration(0)
+        self.progress.setValue(0)
+        self.progress.canceled.connect(self._on_cancel)
+    
+    def start(self):
+        """Start the farm coordinator process."""
+        self.start_time = time.time()
+        program, arguments = farm_command(self.job_dir, self.settings['PROCESSES'])
+        self.process.start(program, arguments)
+    
+    def _on_output(self):
+        """Parse progress lines from the coordinator."""
+        self._stdout += bytes(self.process.readAllStandardOutput())
+        *lines, self._stdout = self._stdout.split(b'\n')
+        for line in lines:
+            parts = line.decode(errors='replace').split()
+            if len(parts) == 3 and parts[0] == 'progress':
+                self.tiles_done = int(parts[1])
+                self._update_progress()
+    
+    def _update_progress(self):
+        """Update progress dialog with ETA."""
+        elapsed = time.time() - self.start_time
+        eta_str = ""
+        if self.tiles_done > 0:
+            remaining_secs = elapsed / self.tiles_done * (self.total_tiles - self.tiles_done)
+            if remaining_secs < 60:
+                eta_str = f" (~{int(remaining_secs)}s left)"
+            elif remaining_secs < 3600:
+                eta_str = f" (~{int(remaining_secs/60)}m left)"
+            else:
+                eta_str = f" (~{remaining_secs/3600:.1f}h left)"
+        
+        self.progress.setValue(self.tiles_done)
+        self.progress.setLabelText(
+            f"Tile {self.tiles_done}/{self.total_tiles} "
+            f"({self.settings['PROCESSES']} processes){eta_str}"
+        )
+    
+    def _on_cancel(self):
+        """Handle cancel button click."""
+        if not self.finished:
+            # The coordinator terminates and joins its worker pool on SIGTERM
+            # and closes the output; kill it only if it doesn't exit
+            self.process.finished.disconnect(self._on_process_finished)
+            self.process.terminate()
+            if not self.process.waitForFinished(FARM_TERMINATE_TIMEOUT_MS):
+                self.process.kill()
+                self.process.waitForFinished()
+            self._finish(False, "Generation cancelled by user")
+    
+    def _on_process_finished(self, exit_code, exit_status):
+        """Report the coordinator's result."""
+        if exit_status == QProcess.NormalExit and exit_code == 0:
+            self._finish(True, f"Generated {self.tiles_done} tiles")
+        else:
+            error = bytes(self.process.readAllStandardError()).decode(errors='replace').strip()
+            last_line = error.splitlines()[-1] if error else f"exit code {exit_code}"
+            self._finish(False, f"Render processes failed: {last_line}")
+    
+    def _finish(self, success, message):
+        """Clean up and call completion callback."""
+        if self.finished:
+            return
+        self.finished = True
+        
+        # The job folder is only needed while the coordinator runs
+        try:
+            shutil.rmtree(self.job_dir)
+        except OSError as e:
+            _log_warning(f"Removing {self.job_dir} failed: {e}")
         
         self.progress.close()
         self.on_complete_callback(success, message)
@@ -720,6 +2116,32 @@ class IncrementalTileGenerator(QObject):
 # ======================================================
 # 5. CONFIGURATION DIALOG  
 # ======================================================
+def _count_tiles_task(task, rings, zooms, polygon_key):
+    """
+    QgsTask function: build per-zoom tile sets in a background thread.
+    
+    Args:
+        task: QgsTask running this function (for progress/cancellation)
+        rings: Polygon rings in Web Mercator meters (plain tuples)
+        zooms: Zoom levels to compute
+        polygon_key: Cache key of the polygon, returned with the result
+    
+    Returns:
+        Tuple of (polygon_key, {zoom: (tiles, boundary_tiles)}, {zoom:
+        seconds}). If the task is cancelled, the zooms finished so far are
+        returned.
+    """
+    zoom_sets = {}
+    seconds = {}
+    for i, z in enumerate(zooms):
+        if task.isCanceled():
+            break
+        start = time.perf_counter()
+        zoom_sets[z] = scanline_zoom_tile_sets(rings, z)
+        seconds[z] = time.perf_counter() - start
+        task.setProgress(100.0 * (i + 1) / len(zooms))
+    return polygon_key, zoom_sets, seconds
+
 class ShapedTileConfigDialog(QDialog):
     """
     Configuration dialog for shaped MBTiles export.
@@ -733,7 +2155,8 @@ class ShapedTileConfigDialog(QDialog):
     - JPEG quality (when using JPG)
     - Metatile size for edge buffering
     - Output file selection
-    - Tile count estimate (pre-flight check)
+    - Exact tile count (pre-flight check, computed in a background QgsTask
+      and cached per zoom level)
     - Memory usage warning
     
     Validates inputs (min <= max zoom) before accepting.
@@ -754,6 +2177,19 @@ class ShapedTileConfigDialog(QDialog):
         self.web_mercator = QgsCoordinateReferenceSystem("EPSG:3857")
         self.source_crs = QgsProject.instance().crs()
         self.background_color = None  # Optional background color
+        
+        # Tile sets are cached per (polygon, zoom) in _tile_set_cache
+        self.poly_3857 = _to_web_mercator(self.poly, self.source_crs)
+        self._rings = _polygon_rings(self.poly_3857)
+        self._polygon_key = hashlib.sha1(bytes(self.poly_3857.asWkb())).hexdigest()
+        if _tile_set_cache['polygon_key'] != self._polygon_key:
+            _tile_set_cache['polygon_key'] = self._polygon_key
+            _tile_set_cache['zooms'] = {}
+            _tile_set_cache['seconds'] = {}
+        self._count_task = None  # Running background count, if any
+        self._accept_pending = False  # OK pressed, waiting for the count to finish
+        self._closed = False
+        
         self._update_timer = QTimer()
         self._update_timer.setSingleShot(True)
         self._update_timer.timeout.connect(self._do_update_estimate)
@@ -817,6 +2253,70 @@ class ShapedTileConfigDialog(QDialog):
         self.metatile_size.valueChanged.connect(self.update_memory_warning)
         layout.addRow("Metatile size:", self.metatile_size)
         
+        # Block metatiles: render N×N tiles at once and slice them
+        self.metatile_blocks_check = QCheckBox("Render metatiles as blocks (faster)")
+        self.metatile_blocks_check.setChecked(True)
+        self.metatile_blocks_check.toggled.connect(self.update_memory_warning)
+        layout.addRow(self.metatile_blocks_check)
+        
+        # Pyramid mode: render the top zooms, downsample the lower ones
+        self.pyramid_levels = QSpinBox()
+        self.pyramid_levels.setRange(0, 22)
+        self.pyramid_levels.setValue(0)
+        self.pyramid_levels.setSpecialValueText("All")
+        self.pyramid_levels.setToolTip("Number of top zoom levels to render; lower zooms are built "
+                                       "by downsampling the rendered tiles (labels and line widths "
+                                       "shrink with them). Single-process exports only")
+        layout.addRow("Rendered zoom levels:", self.pyramid_levels)
+        
+        # Tile order within each zoom (render cache locality)
+        self.tile_order = QComboBox()
+        self.tile_order.addItem("Rows", ORDER_ROWS)
+        self.tile_order.addItem("Hilbert curve", ORDER_HILBERT)
+        self.tile_order.addItem("Quadtree, depth-first", ORDER_MORTON)
+        self.tile_order.setToolTip("Curve orders render neighbouring tiles one after another, "
+                                   "so raster and database layer caches are reused more")
+        layout.addRow("Tile order:", self.tile_order)
+        
+        # Rendering backend
+        self.render_backend = QComboBox()
+        self.render_backend.addItem("Main thread", RENDER_BACKEND_PAINTER)
+        self.render_backend.addItem("Background threads (parallel)", RENDER_BACKEND_PARALLEL)
+        self.render_backend.addItem("Background thread (sequential)", RENDER_BACKEND_SEQUENTIAL)
+        layout.addRow("Rendering:", self.render_backend)
+        
+        # Render farm: >1 renders in separate headless QGIS processes
+        self.processes = QSpinBox()
+        self.processes.setRange(1, max(1, os.cpu_count() or 1))
+        self.processes.setValue(1)
+        self.processes.setToolTip("More than 1 renders in separate QGIS processes "
+                                  "that load the saved project (for very large exports)")
+        layout.addRow("Processes:", self.processes)
+        
+        # SQLite bulk-load profile (write-ahead log, no fsync per commit)
+        self.bulk_load_check = QCheckBox("Fast database writes (bulk load)")
+        self.bulk_load_check.setToolTip("Writes through a write-ahead log without syncing every "
+                                        "commit; a crash may lose the last commits (a resumed "
+                                        "export renders them again) but never corrupts the file")
+        layout.addRow(self.bulk_load_check)
+        
+        # Deduplicated MBTiles layout (map + images tables, tiles view)
+        self.dedup_check = QCheckBox("Store identical tiles once (deduplicate)")
+        self.dedup_check.setToolTip("Uses the map/images MBTiles layout: tiles with the same "
+                                    "image (water, forest, background) share one stored blob")
+        layout.addRow(self.dedup_check)
+        
+        # Timing report: per-stage histograms as a JSON sidecar and/or metadata row
+        self.stats_report_check = QCheckBox("Write a timing report (JSON sidecar)")
+        self.stats_report_check.setToolTip("Writes <output>.stats.json with p50/p95/max times of "
+                                           "each export stage per zoom and tile class, and the "
+                                           "most expensive layers (single-process exports)")
+        layout.addRow(self.stats_report_check)
+        self.stats_metadata_check = QCheckBox("Also store the timing report in the file metadata")
+        self.stats_metadata_check.setEnabled(False)
+        self.stats_report_check.toggled.connect(self.stats_metadata_check.setEnabled)
+        layout.addRow(self.stats_metadata_check)
+        
         # Memory warning label
         self.memory_label = QLabel("")
         self.memory_label.setWordWrap(True)
@@ -826,6 +2326,7 @@ class ShapedTileConfigDialog(QDialog):
         self.file_btn = QPushButton("Select Output File...")
         self.file_btn.clicked.connect(self.select_file)
         self.output_path = ""
+        self.output_directory = False
         self.file_label = QLabel("No file selected")
         self.file_label.setWordWrap(True)
         layout.addRow("Output:", self.file_btn)
@@ -845,7 +2346,12 @@ class ShapedTileConfigDialog(QDialog):
         self._update_timer.start(300)  # 300ms delay
     
     def _do_update_estimate(self):
-        """Actually calculate and display tile estimate."""
+        """
+        Display the exact tile count for the selected zoom range.
+        
+        Zoom levels already in the cache are reused; missing ones are
+        computed by a background QgsTask, after which this runs again.
+        """
         min_z = self.min_zoom.value()
         max_z = self.max_zoom.value()
         
@@ -853,10 +2359,81 @@ class ShapedTileConfigDialog(QDialog):
             self.estimate_label.setText("Invalid: min > max")
             self.estimate_label.setStyleSheet("font-weight: bold; padding: 5px; background: #ffcccc; border-radius: 3px;")
             return
-
-        # Quick bbox-based estimate (doesn't freeze)
-        count, _ = estimate_tile_count_fast(self.poly, self.source_crs, min_z, max_z)
         
+        cached = _tile_set_cache['zooms']
+        missing = self._missing_zooms()
+        if missing:
+            waiting = " - export starts when done" if self._accept_pending else ""
+            self.estimate_label.setText(f"Counting... ({len(missing)} zoom level(s) left){waiting}")
+            self.estimate_label.setStyleSheet("font-weight: bold; padding: 5px; background: #f0f0f0; border-radius: 3px;")
+            self._start_count_task(missing)
+            return
+        
+        count = sum(len(cached[z][0]) for z in range(min_z, max_z + 1))
+        self._show_estimate(count)
+    
+    def _missing_zooms(self):
+        """Zoom levels of the selected range not in the tile set cache yet."""
+        cached = _tile_set_cache['zooms']
+        return [z for z in range(self.min_zoom.value(), self.max_zoom.value() + 1)
+                if z not in cached]
+    
+    def _start_count_task(self, zooms):
+        """
+        Compute tile sets for the given zooms in a background QgsTask.
+        
+        Only one task runs at a time. If one is already running, its result
+        triggers a new estimate update, which starts a task for whatever is
+        still missing.
+        """
+        if self._count_task is not None:
+            return
+        self._count_task = QgsTask.fromFunction(
+            "Counting shaped MBTiles tiles",
+            _count_tiles_task,
+            self._rings, zooms, self._polygon_key,
+            on_finished=self._on_count_finished
+        )
+        QgsApplication.taskManager().addTask(self._count_task)
+    
+    def _on_count_finished(self, exception, result=None):
+        """
+        Store background count results in the cache and refresh the label.
+        
+        If OK was pressed while counting, the dialog is accepted as soon as
+        every selected zoom is cached (otherwise the next count starts).
+        """
+        self._count_task = None
+        if exception is None and result:
+            polygon_key, zoom_sets, seconds = result
+            if polygon_key == _tile_set_cache['polygon_key']:
+                _tile_set_cache['zooms'].update(zoom_sets)
+                _tile_set_cache['seconds'].update(seconds)
+        if self._closed:
+            return
+        if exception is not None:
+            self._set_accept_pending(False)
+            self.estimate_label.setText("Count failed")
+            return
+        if self._accept_pending and not self._missing_zooms():
+            self.accept()
+            return
+        self._do_update_estimate()
+    
+    def _set_accept_pending(self, pending):
+        """
+        Wait for the background count before accepting (or stop waiting).
+        
+        While waiting, OK and the zoom range are locked so the count that
+        is running stays the one needed.
+        """
+        self._accept_pending = pending
+        self.buttons.button(QDialogButtonBox.Ok).setEnabled(not pending)
+        self.min_zoom.setEnabled(not pending)
+        self.max_zoom.setEnabled(not pending)
+    
+    def _show_estimate(self, count):
+        """Display an exact tile count with a rough time estimate."""
         # Color based on count
         if count < 10000:
             self.estimate_label.setStyleSheet("font-weight: bold; padding: 5px; background: #ccffcc; border-radius: 3px;")
@@ -868,11 +2445,12 @@ class ShapedTileConfigDialog(QDialog):
             self.estimate_label.setStyleSheet("font-weight: bold; padding: 5px; background: #ffcccc; border-radius: 3px;")
             time_est = f" (~{count * 0.1 / 3600:.1f}h)"
         
-        self.estimate_label.setText(f"~{count:,} tiles (max){time_est}")
+        self.estimate_label.setText(f"{count:,} tiles{time_est}")
     
     def update_memory_warning(self):
         """Update memory usage warning based on metatile size and DPI."""
-        mem_mb = estimate_memory_usage(self.metatile_size.value(), self.dpi.value())
+        mem_mb = estimate_memory_usage(self.metatile_size.value(), self.dpi.value(),
+                                       self.metatile_blocks_check.isChecked())
         
         if mem_mb > MEMORY_WARNING_MB:
             self.memory_label.setText(f"High memory usage: ~{mem_mb:.0f}MB per tile")
@@ -896,14 +2474,75 @@ class ShapedTileConfigDialog(QDialog):
             )
             return
         
+        if self.output_path:
+            try:
+                output_kind(self.output_path, self.output_directory)
+            except ValueError as e:
+                QMessageBox.warning(self, "Invalid Output", f"{e}.")
+                return
+        
+        # Worker processes load the project from disk
+        if self.processes.value() > 1:
+            # The farm renders every zoom and keeps no timings
+            unsupported = []
+            if self.pyramid_levels.value() > 0:
+                unsupported.append("pyramid levels")
+            if self.stats_report_check.isChecked():
+                unsupported.append("the timing report")
+            if unsupported:
+                QMessageBox.warning(
+                    self,
+                    "Not Available With Several Processes",
+                    f"Rendering with several processes does not support {' or '.join(unsupported)}.\n\nSet Processes to 1 or turn these options off."
+                )
+                return
+            project = QgsProject.instance()
+            if not project.fileName():
+                QMessageBox.warning(
+                    self,
+                    "Project Not Saved",
+                    "Rendering with several processes loads the project from disk.\n\nPlease save the project first."
+                )
+                return
+            if project.isDirty():
+                reply = QMessageBox.question(
+                    self,
+                    "Unsaved Changes",
+                    "Render processes use the saved project; unsaved changes will not be rendered.\n\nContinue anyway?"
+                )
+                if reply != QMessageBox.Yes:
+                    return
+        
+        # Tile sets still being counted: accept when the background count
+        # finishes rather than enumerating them here on the GUI thread
+        if self._missing_zooms():
+            self._set_accept_pending(True)
+            self._do_update_estimate()  # Starts the count if none is running
+            return
+        
         # If validation passes, accept the dialog
         self.accept()
-
+    
+    def done(self, result):
+        """Cancel any background count when the dialog closes."""
+        self._closed = True
+        if self._count_task is not None:
+            self._count_task.cancel()
+        super().done(result)
+    
     def select_file(self):
-        f, _ = QFileDialog.getSaveFileName(self, "Save MBTiles", "", "MBTiles (*.mbtiles)")
+        f, selected = QFileDialog.getSaveFileName(
+            self, "Save MBTiles", "",
+            "MBTiles (*.mbtiles);;PMTiles (*.pmtiles);;Folder of tiles, z/x/y (*)"
+        )
         if f:
-            if not f.endswith('.mbtiles'):
+            # A path without extension is written as a z/x/y folder tree
+            if selected.startswith("MBTiles") and not f.endswith('.mbtiles'):
                 f += '.mbtiles'
+            elif selected.startswith("PMTiles") and not f.endswith('.pmtiles'):
+                f += '.pmtiles'
+            # The folder filter writes a folder tree even for "tiles.v2"
+            self.output_directory = selected.startswith("Folder")
             self.output_path = f
             self.file_label.setText(os.path.basename(f))
     
@@ -924,12 +2563,20 @@ class ShapedTileConfigDialog(QDialog):
         is_jpg = self.tile_format.currentText() == "JPG"
         self.jpeg_quality.setVisible(is_jpg)
         self.jpeg_quality_label.setVisible(is_jpg)
-
+    
     def get_settings(self):
-        tiles, poly_3857 = get_intersecting_tiles(
-            self.poly, self.source_crs, 
-            self.min_zoom.value(), self.max_zoom.value()
-        )
+        # Reuse the cached per-zoom tile sets. OK waits for the background
+        # count, so after exec_() nothing is left to compute; zooms are only
+        # enumerated here for callers that skip the dialog's OK button
+        zooms = range(self.min_zoom.value(), self.max_zoom.value() + 1)
+        cached = _tile_set_cache['zooms']
+        seconds = _tile_set_cache['seconds']
+        for z in zooms:
+            if z not in cached:
+                start = time.perf_counter()
+                cached[z] = scanline_zoom_tile_sets(self._rings, z)
+                seconds[z] = time.perf_counter() - start
+        tiles, boundary_tiles = merge_zoom_tile_sets(cached[z] for z in zooms)
         return {
             'ZOOM_MIN': self.min_zoom.value(),
             'ZOOM_MAX': self.max_zoom.value(),
@@ -939,9 +2586,24 @@ class ShapedTileConfigDialog(QDialog):
             'TILE_FORMAT': self.tile_format.currentText().lower(),
             'JPEG_QUALITY': self.jpeg_quality.value(),
             'METATILE_SIZE': min(self.metatile_size.value(), MAX_METATILE_SIZE),
+            'METATILE_BLOCKS': self.metatile_blocks_check.isChecked(),
+            'PYRAMID_LEVELS': self.pyramid_levels.value(),
+            'TILE_ORDER': self.tile_order.currentData(),
+            'RENDER_BACKEND': self.render_backend.currentData(),
+            'PROCESSES': self.processes.value(),
+            'SQLITE_PROFILE': (SQLITE_PROFILE_BULK if self.bulk_load_check.isChecked()
+                               else SQLITE_PROFILE_SAFE),
+            'DEDUPLICATE': self.dedup_check.isChecked(),
+            'STATS_REPORT': self.stats_report_check.isChecked(),
+            'STATS_METADATA': (self.stats_report_check.isChecked()
+                               and self.stats_metadata_check.isChecked()),
             'OUTPUT_FILE': self.output_path,
+            'OUTPUT_DIRECTORY': self.output_directory,
             'TILES': tiles,
-            'POLYGON_3857': poly_3857
+            'ENUMERATION_SECONDS': {z: seconds[z] for z in zooms if z in seconds},
+            'BOUNDARY_TILES': boundary_tiles,
+            'TILE_COUNT': len(tiles),
+            'POLYGON_3857': self.poly_3857
         }
 
 # ======================================================
@@ -993,7 +2655,7 @@ class ShapedMBTilesTool(QgsMapTool):
         _drawing_state['tool'] = self
         _drawing_state['rubber_band'] = self.rubberBand
         _drawing_state['paused'] = False
-
+    
     def canvasPressEvent(self, e):
         if e.button() == Qt.LeftButton:
             point = self.toMapCoordinates(e.pos())
@@ -1042,7 +2704,7 @@ class ShapedMBTilesTool(QgsMapTool):
                 f"{len(self.points)} points remaining",
                 level=0, duration=1
             )
-
+    
     def reset(self):
         self.points = []
         self.rubberBand.reset(QgsWkbTypes.PolygonGeometry)
@@ -1055,7 +2717,7 @@ class ShapedMBTilesTool(QgsMapTool):
         # Update pause button text
         if _pause_action:
             _pause_action.setText("Pause Drawing")
-
+    
     def pause(self):
         """
         Pause drawing and release the tool.
@@ -1074,7 +2736,7 @@ class ShapedMBTilesTool(QgsMapTool):
             f"{len(self.points)} points saved. Click 'Resume Drawing' to continue.",
             level=0, duration=3
         )
-
+    
     def deactivate(self):
         """
         Called when tool is deactivated (user switches to another tool).
@@ -1099,7 +2761,7 @@ class ShapedMBTilesTool(QgsMapTool):
         # Reset the flag
         _drawing_state['intentional_pause'] = False
         QgsMapTool.deactivate(self)
-
+    
     def finish_drawing(self):
         poly_geom = QgsGeometry.fromPolygonXY([self.points])
         
@@ -1120,7 +2782,7 @@ class ShapedMBTilesTool(QgsMapTool):
         
         # Only proceed with generation if everything is set
         self.generate_tiles(settings)
-
+    
     def generate_tiles(self, settings):
         """
         Generate MBTiles from the drawn polygon and current map layers.
@@ -1130,11 +2792,9 @@ class ShapedMBTilesTool(QgsMapTool):
         
         Args:
             settings: Dict from ShapedTileConfigDialog.get_settings() containing
-                      all configuration options and pre-calculated tile list
+                      all configuration options and the exact tile count
         """
-        tiles = settings['TILES']
-        
-        if not tiles:
+        if not settings['TILE_COUNT']:
             QMessageBox.warning(None, "No Tiles", "No tiles intersect the drawn polygon.")
             return
         
@@ -1156,9 +2816,12 @@ class ShapedMBTilesTool(QgsMapTool):
             else:
                 iface.messageBar().pushMessage("Generation", message, level=1, duration=5)
         
-        # Create and start incremental generator
+        # Create and start incremental generator (or the multi-process farm)
         # Store reference to prevent garbage collection
-        self._generator = IncrementalTileGenerator(settings, layers, on_complete)
+        if settings.get('PROCESSES', 1) > 1:
+            self._generator = FarmTileGenerator(settings, layers, on_complete)
+        else:
+            self._generator = IncrementalTileGenerator(settings, layers, on_complete)
         self._generator.start()
 
 # ======================================================
@@ -1168,6 +2831,9 @@ class ShapedMBTilesTool(QgsMapTool):
 # Store action reference for updating button text
 _pause_action = None
 
+# Generator of a resumed export (reference prevents garbage collection)
+_resume_generator = None
+
 def update_pause_button_text():
     """
     Update the pause/resume button text based on current drawing state.
@@ -1254,3 +2920,62 @@ def cleanup_drawing_state():
     _drawing_state['paused'] = False
     _drawing_state['tool'] = None
     _drawing_state['rubber_band'] = None
+
+def resume_export():
+    """
+    Resume an interrupted export from its MBTiles file.
+    
+    Reads the job definition and checkpoint stored in the file's metadata,
+    enumerates the tiles again, drops the tiles already stored (one sorted
+    pass over the tiles primary key) and continues with the current map
+    layers. A finished export (completion marker) is reported as complete
+    without enumerating anything.
+    """
+    global _resume_generator
+    path, _ = QFileDialog.getOpenFileName(
+        iface.mainWindow(), "Resume Shaped MBTiles Export", "", "MBTiles (*.mbtiles)"
+    )
+    if not path:
+        return
+    
+    try:
+        job, cursor, complete = read_job_metadata(path)
+    except Exception as e:
+        QMessageBox.warning(iface.mainWindow(), "Cannot Resume", f"Cannot read {path}:\n\n{e}")
+        return
+    if job is None:
+        QMessageBox.warning(
+            iface.mainWindow(),
+            "Cannot Resume",
+            "This file has no Shaped MBTiles job information.\n\nOnly exports made with this version of the plugin can be resumed."
+        )
+        return
+    if complete:
+        iface.messageBar().pushMessage("Resume", "This export is already complete.", level=0, duration=5)
+        return
+    
+    settings = settings_from_job(job, path)
+    stored = read_existing_tiles(path)
+    settings['TILES'] = settings['TILES'].difference(stored)
+    settings['BOUNDARY_TILES'] = settings['BOUNDARY_TILES'].difference(stored)
+    settings['TILE_COUNT'] = len(settings['TILES'])
+    settings['RESUME_CURSOR'] = cursor
+    if not settings['TILE_COUNT']:
+        iface.messageBar().pushMessage("Resume", "This export is already complete.", level=0, duration=5)
+        return
+    
+    layers = [l for l in iface.mapCanvas().layers() if l.isValid()]
+    
+    def on_complete(success, message):
+        """Callback when the resumed generation completes."""
+        if success:
+            iface.messageBar().pushMessage(
+                "Success", 
+                f"{message} to {os.path.basename(path)}", 
+                level=3, duration=5
+            )
+        else:
+            iface.messageBar().pushMessage("Generation", message, level=1, duration=5)
+    
+    _resume_generator = IncrementalTileGenerator(settings, layers, on_complete)
+    _resume_generator.start()
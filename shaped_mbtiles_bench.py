@@ -0,0 +1,376 @@
+"""
+Micro-benchmarks for the Shaped MBTiles Generator.
+
+Not part of the plugin runtime. Run from a shell whose Python can import
+QGIS (e.g. the OSGeo4W shell or a Linux QGIS install):
+    
+    python3 shaped_mbtiles_bench.py prepared
+
+Benchmarks:
+- prepared: plain QgsGeometry predicates vs PolygonPredicates on a
+  5,000-vertex polygon
+- sqlite: MBTilesWriter throughput (tiles/s) per PRAGMA profile on 100,000
+  synthetic tile blobs (no QGIS needed)
+- tilemath: scalar Python tile math vs the NumPy batch API
+  (shaped_mbtiles_tilemath) on 1,000,000 tiles (no QGIS needed)
+- ordering: per-tile render time in row, Hilbert and quadtree order, with a
+  tiled GeoTIFF and with a GeoPackage layer standing in for PostGIS
+"""
+
+import argparse
+import importlib
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ======================================================
+# HELPERS
+# ======================================================
+def _plugin_module(name):
+    """
+    Import a module of this plugin as part of its package.
+    
+    The plugin modules use relative imports, so they have to be imported
+    through the package (the plugin folder) rather than as top-level files.
+    
+    Args:
+        name: Module name, e.g. "shaped_mbtiles"
+    
+    Returns:
+        Imported module
+    """
+    parent = os.path.dirname(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
+
+def _start_qgis():
+    """Start a headless QgsApplication (no display required)."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+    app = QgsApplication([], False)
+    app.initQgis()
+    return app
+
+def _star_polygon(vertices, center_x, center_y, radius, seed=1):
+    """
+    Build a jagged star-shaped QgsGeometry polygon in Web Mercator.
+    
+    Args:
+        vertices: Number of ring vertices
+        center_x, center_y: Center in meters
+        radius: Outer radius in meters
+        seed: Random seed for the jitter
+    
+    Returns:
+        QgsGeometry polygon
+    """
+    from qgis.core import QgsGeometry, QgsPointXY
+    rng = random.Random(seed)
+    points = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius * (0.6 + 0.4 * rng.random())
+        points.append(QgsPointXY(center_x + r * math.cos(angle),
+                                 center_y + r * math.sin(angle)))
+    return QgsGeometry.fromPolygonXY([points])
+
+def _report(label, seconds, count):
+    """Print a per-operation timing line and return microseconds per operation."""
+    per_op = seconds / count * 1e6
+    print(f"  {label:<28} {per_op:10.1f} us/op  ({count} ops)")
+    return per_op
+
+# ======================================================
+# BENCHMARKS
+# ======================================================
+def bench_prepared(vertices=5000, zoom=15):
+    """
+    Compare plain QgsGeometry predicates against PolygonPredicates.
+    
+    Tests every tile of the polygon's bounding box at the given zoom with
+    intersects(), contains() and intersection().
+    
+    Args:
+        vertices: Polygon vertex count
+        zoom: Zoom level used to generate test tiles
+    """
+    sm = _plugin_module("shaped_mbtiles")
+    from qgis.core import QgsGeometry
+    
+    polygon = _star_polygon(vertices, 0.0, 0.0, 20000.0)
+    bbox = polygon.boundingBox()
+    x_min, y_min = sm.meters_to_tile(bbox.xMinimum(), bbox.yMaximum(), zoom)
+    x_max, y_max = sm.meters_to_tile(bbox.xMaximum(), bbox.yMinimum(), zoom)
+    extents = [sm.tile_to_extent(zoom, x, y)
+               for x in range(x_min, x_max + 1)
+               for y in range(y_min, y_max + 1)]
+    
+    print(f"Prepared geometry: {vertices} vertices, {len(extents)} tiles at z{zoom}")
+    
+    start = time.perf_counter()
+    predicates = sm.PolygonPredicates(polygon)
+    _report("prepare (once per export)", time.perf_counter() - start, 1)
+    
+    for name in ("intersects", "contains", "intersection"):
+        start = time.perf_counter()
+        for extent in extents:
+            getattr(polygon, name)(QgsGeometry.fromRect(extent))
+        plain = _report(f"{name} plain", time.perf_counter() - start, len(extents))
+        
+        start = time.perf_counter()
+        method = getattr(predicates, name)
+        for extent in extents:
+            method(extent)
+        prepared = _report(f"{name} prepared", time.perf_counter() - start, len(extents))
+        print(f"  {name} speedup: {plain / prepared:.1f}x")
+
+def bench_sqlite(tiles=100000, batch_size=64, commit_tiles=1000):
+    """
+    Compare MBTilesWriter PRAGMA profiles on synthetic tile blobs.
+    
+    Writes the same tiles with each profile, in executemany() batches and
+    commits like ThreadedTileWriter, and reports tiles/s including close().
+    
+    Args:
+        tiles: Number of tiles to write per profile
+        batch_size: Tiles per write_tiles() call
+        commit_tiles: Tiles per commit
+    """
+    writers = _plugin_module("shaped_mbtiles_writers")
+    
+    # A pool of incompressible blobs of typical PNG tile sizes (1-8 KB)
+    rng = random.Random(1)
+    blobs = [bytes(rng.getrandbits(8) for _ in range(rng.randint(1024, 8192)))
+             for _ in range(64)]
+    side = int(math.ceil(math.sqrt(tiles)))
+    zoom = max(1, int(math.ceil(math.log2(side))))
+    
+    print(f"SQLite profiles: {tiles} tiles, {len(blobs)} distinct blobs of 1-8 KB")
+    
+    for profile in (writers.SQLITE_PROFILE_SAFE, writers.SQLITE_PROFILE_BULK):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = writers.MBTilesWriter(os.path.join(tmp, "bench.mbtiles"),
+                                           min_zoom=zoom, max_zoom=zoom, profile=profile)
+            start = time.perf_counter()
+            batch = []
+            for i in range(tiles):
+                batch.append((zoom, i % side, i // side, blobs[i % len(blobs)]))
+                if len(batch) == batch_size:
+                    writer.write_tiles(batch)
+                    batch = []
+                if (i + 1) % commit_tiles == 0:
+                    writer.commit()
+            writer.write_tiles(batch)
+            writer.close()
+            seconds = time.perf_counter() - start
+        print(f"  {profile:<28} {tiles / seconds:10.0f} tiles/s  ({seconds:.1f}s)")
+
+def bench_tilemath(tiles=1000000, zoom=16):
+    """
+    Compare scalar tile math against the NumPy batch API.
+    
+    The scalar side uses the same formulas as shaped_mbtiles (without the
+    QgsRectangle), one tile at a time, as the plugin does.
+    
+    Args:
+        tiles: Number of random tiles
+        zoom: Zoom level of the tiles
+    """
+    tilemath = _plugin_module("shaped_mbtiles_tilemath")
+    tiles_module = _plugin_module("shaped_mbtiles_tiles")
+    import numpy as np
+    
+    origin = tiles_module.ORIGIN_SHIFT
+    circumference = tiles_module.WORLD_CIRCUMFERENCE
+    rng = np.random.default_rng(1)
+    xs = rng.integers(0, 2 ** zoom, tiles)
+    ys = rng.integers(0, 2 ** zoom, tiles)
+    mxs = rng.uniform(-origin, origin, tiles)
+    mys = rng.uniform(-origin, origin, tiles)
+    
+    print(f"Tile math: {tiles} tiles at z{zoom}")
+    
+    def scalar_extents():
+        size = circumference / (2 ** zoom)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            (x * size - origin, origin - (y + 1) * size,
+             (x + 1) * size - origin, origin - y * size)
+    
+    def scalar_tiles():
+        resolution = circumference / (tiles_module.TILE_SIZE * (2 ** zoom))
+        for mx, my in zip(mxs.tolist(), mys.tolist()):
+            (int((mx + origin) / resolution / tiles_module.TILE_SIZE),
+             int((origin - my) / resolution / tiles_module.TILE_SIZE))
+    
+    def scalar_tms():
+        n = 2 ** zoom - 1
+        for y in ys.tolist():
+            n - y
+    
+    cases = (
+        ("tile_to_extent", scalar_extents, lambda: tilemath.tile_to_extent(zoom, xs, ys)),
+        ("meters_to_tile", scalar_tiles, lambda: tilemath.meters_to_tile(mxs, mys, zoom)),
+        ("xyz_to_tms", scalar_tms, lambda: tilemath.xyz_to_tms(zoom, ys)),
+    )
+    for name, scalar, batch in cases:
+        start = time.perf_counter()
+        scalar()
+        plain = _report(f"{name} scalar", time.perf_counter() - start, tiles)
+        start = time.perf_counter()
+        batch()
+        vectorized = _report(f"{name} batch", time.perf_counter() - start, tiles)
+        print(f"  {name} speedup: {plain / vectorized:.1f}x")
+    
+    # Resume diffing: tiles planned minus tiles already stored (both sorted)
+    planned = np.unique(tilemath.pack_tiles(zoom, xs, ys))
+    stored = planned[::2]
+    start = time.perf_counter()
+    stored_set = set(stored.tolist())
+    [key for key in planned.tolist() if key not in stored_set]
+    plain = _report("diff scalar (set)", time.perf_counter() - start, len(planned))
+    start = time.perf_counter()
+    tilemath.difference_keys(planned, stored)
+    vectorized = _report("diff batch (searchsorted)", time.perf_counter() - start, len(planned))
+    print(f"  diff speedup: {plain / vectorized:.1f}x")
+
+def _ordering_datasets(folder, extent, raster_size=8192, features=50000, seed=1):
+    """
+    Write the ordering benchmark's test data.
+    
+    Args:
+        folder: Folder to write into
+        extent: (x_min, y_min, x_max, y_max) in Web Mercator meters
+        raster_size: GeoTIFF width and height in pixels
+        features: Number of random polygons in the GeoPackage
+        seed: Random seed
+    
+    Returns:
+        Tuple of (GeoTIFF path, GeoPackage path)
+    """
+    from osgeo import gdal, ogr, osr
+    import numpy as np
+    
+    x_min, y_min, x_max, y_max = extent
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3857)
+    rng = np.random.default_rng(seed)
+    
+    # Tiled GeoTIFF, written in strips so memory stays small
+    raster_path = os.path.join(folder, "raster.tif")
+    raster = gdal.GetDriverByName("GTiff").Create(
+        raster_path, raster_size, raster_size, 1, gdal.GDT_Byte,
+        options=["TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256"])
+    raster.SetGeoTransform((x_min, (x_max - x_min) / raster_size, 0,
+                            y_max, 0, -(y_max - y_min) / raster_size))
+    raster.SetProjection(srs.ExportToWkt())
+    band = raster.GetRasterBand(1)
+    for row in range(0, raster_size, 256):
+        band.WriteArray(rng.integers(0, 256, (256, raster_size), dtype=np.uint8), 0, row)
+    raster = None
+    
+    # GeoPackage with a spatial index (what a PostGIS table would have)
+    vector_path = os.path.join(folder, "features.gpkg")
+    source = ogr.GetDriverByName("GPKG").CreateDataSource(vector_path)
+    layer = source.CreateLayer("features", srs, ogr.wkbPolygon)
+    layer.StartTransaction()
+    size = (x_max - x_min) / 400
+    for x, y in zip(rng.uniform(x_min, x_max - size, features),
+                    rng.uniform(y_min, y_max - size, features)):
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(
+            f"POLYGON(({x} {y},{x + size} {y},{x + size} {y + size},{x} {y + size},{x} {y}))"))
+        layer.CreateFeature(feature)
+    layer.CommitTransaction()
+    source = None
+    return raster_path, vector_path
+
+def bench_ordering(side=32, zoom=15, cache_mb=32):
+    """
+    Compare per-tile render time across tile orders.
+    
+    Renders a side×side square of tiles one by one (metatile size 1), once
+    per order, for each test layer. Layers are reopened for every run so
+    no order starts with another order's warm cache; the GDAL block cache
+    is capped at cache_mb so the raster does not fit in it.
+    
+    Args:
+        side: Tiles per side of the square
+        zoom: Zoom level of the tiles
+        cache_mb: GDAL block cache size in MB
+    """
+    sm = _plugin_module("shaped_mbtiles")
+    tiles_module = _plugin_module("shaped_mbtiles_tiles")
+    from osgeo import gdal
+    from qgis.core import QgsGeometry, QgsRasterLayer, QgsRectangle, QgsVectorLayer
+    
+    gdal.SetCacheMax(cache_mb * 1024 * 1024)
+    x0 = y0 = 2 ** (zoom - 1) - side // 2
+    tiles = tiles_module.TileSet()
+    for y in range(y0, y0 + side):
+        tiles.add_range(zoom, y, x0, x0 + side - 1)
+    top_left = sm.tile_to_extent(zoom, x0, y0)
+    bottom_right = sm.tile_to_extent(zoom, x0 + side - 1, y0 + side - 1)
+    extent = (top_left.xMinimum(), bottom_right.yMinimum(),
+              bottom_right.xMaximum(), top_left.yMaximum())
+    polygon = QgsGeometry.fromRect(QgsRectangle(*extent))
+    
+    print(f"Tile order: {side}x{side} tiles at z{zoom}, GDAL cache {cache_mb} MB")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        raster_path, vector_path = _ordering_datasets(tmp, extent)
+        layers = (
+            ("raster", lambda: QgsRasterLayer(raster_path, "raster")),
+            ("gpkg", lambda: QgsVectorLayer(f"{vector_path}|layername=features", "features", "ogr")),
+        )
+        for layer_name, open_layer in layers:
+            baseline = None
+            for order in (tiles_module.ORDER_ROWS, tiles_module.ORDER_HILBERT,
+                          tiles_module.ORDER_MORTON):
+                layer = open_layer()
+                renderer = sm.ShapedTileRenderer(polygon, [layer], metatile_size=1)
+                start = time.perf_counter()
+                for z, x, y, _ in tiles.iter_blocks(1, order):
+                    renderer.render_tile(z, x, y, sm.TILE_INSIDE)
+                per_tile = _report(f"{layer_name} {order}", time.perf_counter() - start, len(tiles))
+                if baseline is None:
+                    baseline = per_tile
+                else:
+                    print(f"  {layer_name} {order} vs rows: {baseline / per_tile:.2f}x")
+                del renderer, layer
+
+# ======================================================
+# COMMAND LINE
+# ======================================================
+BENCHMARKS = {
+    'prepared': bench_prepared,
+    'sqlite': bench_sqlite,
+    'tilemath': bench_tilemath,
+    'ordering': bench_ordering,
+}
+
+# Benchmarks that need a running QgsApplication
+QGIS_BENCHMARKS = {'prepared', 'ordering'}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shaped MBTiles micro-benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    args = parser.parse_args(argv)
+    
+    if args.benchmark not in QGIS_BENCHMARKS:
+        BENCHMARKS[args.benchmark]()
+        return
+    
+    app = _start_qgis()
+    try:
+        BENCHMARKS[args.benchmark]()
+    finally:
+        app.exitQgis()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Multi-process render farm for large Shaped MBTiles exports.
+
+The plugin writes a job folder (job.json plus the tile sets) and starts this
+module as a separate Python process:
+    
+    python3 shaped_mbtiles_farm.py run /path/to/export.mbtiles.job -j 8
+
+The coordinator process owns the only tile writer (on a writer thread). It splits the tile set
+into disjoint chunks of metatile blocks and hands them to N worker processes.
+Each worker starts a headless QgsApplication (QT_QPA_PLATFORM=offscreen),
+loads the saved project and renders its chunks with ShapedTileRenderer; the
+encoded tile blobs are streamed back to the coordinator and written there.
+Progress is reported on stdout as "progress <done> <total>" lines.
+
+This module has no QGIS imports at module level, so the plugin can import it
+to write jobs and build the command line.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+JOB_FILE = 'job.json'
+TILES_FILE = 'tiles.tset'
+BOUNDARY_FILE = 'boundary.tset'
+
+# Tiles per chunk handed to a worker (a chunk always holds whole blocks)
+CHUNK_TILES = 256
+
+# Per-process state of a farm worker, set up by _init_worker()
+_worker = {}
+
+# ======================================================
+# JOB FILES
+# ======================================================
+def write_job(job_dir, job, tiles, boundary_tiles):
+    """
+    Write a farm job folder.
+    
+    Args:
+        job_dir: Folder to create (reused if it exists)
+        job: JSON-serializable dict: shaped_mbtiles.job_definition() plus
+             project (path), layers (layer ids), output (path) and
+             qgis_prefix_path (QgsApplication.prefixPath() of the plugin)
+        tiles: TileSet of all tiles to render
+        boundary_tiles: TileSet of the tiles crossing the polygon edge
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    tiles.save(os.path.join(job_dir, TILES_FILE))
+    boundary_tiles.save(os.path.join(job_dir, BOUNDARY_FILE))
+    with open(os.path.join(job_dir, JOB_FILE), 'w') as f:
+        json.dump(job, f, indent=2)
+
+def read_job(job_dir):
+    """
+    Read a farm job folder written by write_job().
+    
+    Returns:
+        Tuple of (job dict, tiles TileSet, boundary TileSet)
+    """
+    TileSet = _plugin_module('shaped_mbtiles_tiles').TileSet
+    with open(os.path.join(job_dir, JOB_FILE)) as f:
+        job = json.load(f)
+    tiles = TileSet.load(os.path.join(job_dir, TILES_FILE))
+    boundary_tiles = TileSet.load(os.path.join(job_dir, BOUNDARY_FILE))
+    return job, tiles, boundary_tiles
+
+def farm_command(job_dir, processes):
+    """
+    Command line that runs a job with this module.
+    
+    Args:
+        job_dir: Job folder written by write_job()
+        processes: Number of worker processes
+    
+    Returns:
+        Tuple of (program, [arguments])
+    """
+    return python_executable(), [os.path.abspath(__file__), 'run', job_dir,
+                                 '-j', str(processes)]
+
+def python_executable():
+    """
+    Path of a Python interpreter that can import QGIS.
+    
+    Inside QGIS, sys.executable may be the QGIS binary rather than Python,
+    so fall back to the interpreter next to the running Python installation.
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    name = 'python.exe' if os.name == 'nt' else 'python3'
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        candidate = os.path.join(folder, name)
+        if os.path.exists(candidate):
+            return candidate
+    return shutil.which(name) or name
+
+# ======================================================
+# WORKER PROCESSES
+# ======================================================
+def _plugin_module(name):
+    """
+    Import a module of this plugin as part of its package.
+    
+    The plugin modules use relative imports, so when this file runs as a
+    script they have to be imported through the package (the plugin folder).
+    
+    Args:
+        name: Module name, e.g. "shaped_mbtiles"
+    
+    Returns:
+        Imported module
+    """
+    if __package__:
+        return importlib.import_module(f"{__package__}.{name}")
+    parent = os.path.dirname(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.{name}")
+
+def _init_worker(job_dir):
+    """
+    Pool initializer: start headless QGIS and build the tile renderer.
+    
+    Args:
+        job_dir: Job folder written by write_job()
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication, QgsGeometry, QgsProject
+    from PyQt5.QtGui import QColor
+    
+    job, _, boundary_tiles = read_job(job_dir)
+    # Without the parent's prefix path, providers and resources aren't
+    # found outside a QGIS environment set up by its launcher
+    if job.get('qgis_prefix_path'):
+        QgsApplication.setPrefixPath(job['qgis_prefix_path'], True)
+    app = QgsApplication([], False)
+    app.initQgis()
+    
+    sm = _plugin_module('shaped_mbtiles')
+    
+    project = QgsProject.instance()
+    if not project.read(job['project']):
+        raise RuntimeError(f"Cannot read project {job['project']}")
+    layers = [project.mapLayer(layer_id) for layer_id in job['layers']]
+    layers = [layer for layer in layers if layer is not None and layer.isValid()]
+    
+    background = job.get('background_color')
+    polygon = QgsGeometry()
+    polygon.fromWkb(bytes.fromhex(job['polygon_wkb']))
+    renderer = sm.ShapedTileRenderer(
+        polygon,
+        layers,
+        tile_format=job['tile_format'],
+        background_color=QColor(background) if background else None,
+        dpi=job['dpi'],
+        antialias=job['antialias'],
+        metatile_size=min(job['metatile_size'], sm.MAX_METATILE_SIZE)
+    )
+    
+    _worker.update(
+        app=app,
+        sm=sm,
+        renderer=renderer,
+        boundary_tiles=boundary_tiles,
+        block_size=(sm.metatile_block_size(job['metatile_size'])
+                    if job['metatile_blocks'] else None),
+        encoder=sm.TileEncoder(job['tile_format'], job['jpeg_quality']),
+        backend=job.get('render_backend', sm.RENDER_BACKEND_PAINTER)
+    )
+
+def _render_chunk(chunk):
+    """
+    Render one chunk of blocks in a worker process.
+    
+    Args:
+        chunk: List of (z, block_x, block_y, [(x, y), ...]) from
+               TileSet.iter_blocks(); blocks of size 1 when rendering
+               per tile
+    
+    Returns:
+        List of (z, x, y, encoded image bytes or None for a skipped tile)
+    """
+    sm = _worker['sm']
+    renderer = _worker['renderer']
+    boundary_tiles = _worker['boundary_tiles']
+    block_size = _worker['block_size']
+    encoder = _worker['encoder']
+    backend = _worker['backend']
+    
+    results = []
+    for z, block_x, block_y, block_tiles in chunk:
+        tiles = [(x, y, sm.TILE_BOUNDARY if (z, x, y) in boundary_tiles else sm.TILE_INSIDE)
+                 for x, y in block_tiles]
+        if block_size:
+            plan = renderer.plan_metatile(z, block_x, block_y, block_size, tiles)
+        else:
+            x, y, tile_class = tiles[0]
+            plan = renderer.plan_tile(z, x, y, tile_class)
+        if backend == sm.RENDER_BACKEND_PAINTER or plan.extent is None:
+            images = renderer.render_plan(plan)
+        else:
+            # Parallel/sequential job; no event loop here, so wait for it
+            job = renderer.start_job(plan, backend)
+            job.waitForFinished()
+            images = renderer.finish_job(job, plan)
+        for x, y, image in images:
+            # Empty (transparent) tiles come back as None and are not stored
+            results.append((z, x, y, encoder.encode(image)))
+    return results
+
+def _iter_chunks(tiles, block_size, order='rows', chunk_tiles=CHUNK_TILES):
+    """
+    Split a TileSet into disjoint chunks of whole blocks.
+    
+    Args:
+        tiles: TileSet to split
+        block_size: Metatile block size, None to render per tile
+        order: Block order within each zoom (see TileSet.iter_blocks());
+               with a curve order each chunk covers a compact area
+        chunk_tiles: Approximate number of tiles per chunk
+    
+    Yields:
+        Lists of (z, block_x, block_y, [(x, y), ...])
+    """
+    chunk = []
+    size = 0
+    for block in tiles.iter_blocks(block_size or 1, order):
+        chunk.append(block)
+        size += len(block[3])
+        if size >= chunk_tiles:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+# ======================================================
+# COORDINATOR
+# ======================================================
+def run_job(job_dir, processes, report=print):
+    """
+    Render a job with a pool of worker processes into one MBTiles file.
+    
+    Args:
+        job_dir: Job folder written by write_job()
+        processes: Number of worker processes
+        report: Callable receiving progress lines
+    
+    Returns:
+        Number of tiles written
+    """
+    sm = _plugin_module('shaped_mbtiles')
+    writers = _plugin_module('shaped_mbtiles_writers')
+    job, tiles, _ = read_job(job_dir)
+    block_size = sm.metatile_block_size(job['metatile_size']) if job['metatile_blocks'] else None
+    
+    # Writes overlap with receiving the next chunk from the workers
+    writer = writers.ThreadedTileWriter(lambda: writers.create_writer(
+        job['output'],
+        name="Shaped Export",
+        description="Generated by QGIS",
+        tile_format=job['tile_format'],
+        bounds=tuple(job['bounds']),
+        min_zoom=job['zoom_min'],
+        max_zoom=job['zoom_max'],
+        profile=job.get('sqlite_profile', writers.SQLITE_PROFILE_SAFE),
+        deduplicate=job.get('deduplicate', False),
+        tiles=tiles,
+        directory=job.get('output_directory', False)
+    ))
+    # The job definition makes the output resumable from the plugin
+    writer.set_metadata(writers.JOB_METADATA_KEY, json.dumps(job))
+    writer.set_metadata(writers.COMPLETE_METADATA_KEY, '0')
+    
+    total = len(tiles)
+    done = 0
+    report(f"progress {done} {total}")
+    # Cancel (SIGTERM from the plugin) unwinds through the clean-up below
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    try:
+        # spawn: every worker gets a fresh interpreter and its own QgsApplication
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(processes, initializer=_init_worker, initargs=(job_dir,))
+        try:
+            chunks = _iter_chunks(tiles, block_size, job.get('tile_order', 'rows'))
+            for results in pool.imap_unordered(_render_chunk, chunks):
+                for z, x, y, data in results:
+                    if data is not None:
+                        writer.write_tile(z, x, y, data)
+                done += len(results)
+                report(f"progress {done} {total}")
+            pool.close()
+        except BaseException:
+            # Stop the workers mid-chunk instead of letting them finish
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        # Empty tiles are not stored; this tells a resume nothing is left
+        writer.set_metadata(writers.COMPLETE_METADATA_KEY, '1')
+    finally:
+        writer.close()
+    return done
+
+def _exit_on_signal(signum, frame):
+    """SIGTERM handler: exit through the coordinator's clean-up."""
+    sys.exit(128 + signum)
+
+# ======================================================
+# COMMAND LINE
+# ======================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shaped MBTiles render farm")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help="Render a job folder written by the plugin")
+    run.add_argument('job_dir')
+    run.add_argument('-j', '--processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    
+    count = run_job(args.job_dir, max(1, args.processes),
+                    report=lambda line: print(line, flush=True))
+    print(f"done {count}", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,8 @@ from .shaped_mbtiles import (
     activate_shaped_tool, 
     toggle_pause_resume, 
     set_pause_action,
-    cleanup_drawing_state
+    cleanup_drawing_state,
+    resume_export
 )
 
 class ShapedMBTilesPlugin:
@@ -16,6 +17,8 @@ class ShapedMBTilesPlugin:
     Provides two toolbar buttons:
     1. Draw Shaped MBTiles (Ctrl+Shift+M) - Start new drawing
     2. Pause/Resume Drawing (Ctrl+Shift+P) - Pause/resume current drawing
+    
+    And a menu item to resume an interrupted export from its MBTiles file.
     """
     
     def __init__(self, iface):
@@ -23,7 +26,8 @@ class ShapedMBTilesPlugin:
         self.plugin_dir = os.path.dirname(__file__)
         self.draw_action = None
         self.pause_action = None
-
+        self.resume_export_action = None
+    
     def initGui(self):
         """Initialize the plugin GUI with toolbar buttons and menu items."""
         icon_path = os.path.join(self.plugin_dir, "icon.png")
@@ -43,6 +47,11 @@ class ShapedMBTilesPlugin:
         self.iface.addToolBarIcon(self.pause_action)
         self.iface.addPluginToMenu("&Shaped MBTiles", self.pause_action)
         
+        # Resume export (menu only) - continue an interrupted export
+        self.resume_export_action = QAction("Resume Shaped MBTiles Export...", self.iface.mainWindow())
+        self.resume_export_action.triggered.connect(resume_export)
+        self.iface.addPluginToMenu("&Shaped MBTiles", self.resume_export_action)
+        
         # Register pause action with shaped_mbtiles module for text updates
         set_pause_action(self.pause_action)
         
@@ -60,6 +69,7 @@ class ShapedMBTilesPlugin:
         # Remove menu items
         self.iface.removePluginMenu("&Shaped MBTiles", self.draw_action)
         self.iface.removePluginMenu("&Shaped MBTiles", self.pause_action)
+        self.iface.removePluginMenu("&Shaped MBTiles", self.resume_export_action)
         
         # Remove toolbar buttons
         self.iface.removeToolBarIcon(self.draw_action)
@@ -71,6 +81,7 @@ class ShapedMBTilesPlugin:
         # Delete actions
         del self.draw_action
         del self.pause_action
+        del self.resume_export_action
 
     def run(self):
         """Start a new drawing session."""
@@ -0,0 +1,290 @@
+"""
+Per-stage timing statistics for Shaped MBTiles exports.
+
+The generator, renderer, encoder and writer thread record how long each
+stage of the pipeline takes per tile (or per render), keyed by zoom level
+and tile class. Durations go into log-scaled histograms, so memory stays
+constant however many tiles are exported, and the run report gives
+count/total/mean/p50/p95/max per stage, per zoom and per class.
+
+The renderer also samples each layer's render time (one render in so many
+is repeated layer by layer): per-zoom histograms per layer plus the
+renders where the layer was slowest, to find the layers (styles, missing
+scale-dependent visibility) that make an export slow.
+
+This module has no QGIS imports; recording is thread-safe (encoder pool and
+writer thread record too).
+"""
+
+import heapq
+import json
+import math
+import threading
+import time
+
+from .shaped_mbtiles_tiles import TILE_OUTSIDE, TILE_BOUNDARY, TILE_INSIDE
+
+# Pipeline stages
+STAGE_ENUMERATE = 'enumerate'  # Tile set of one zoom level (one sample per zoom)
+STAGE_CLIP = 'clip_path'       # Clip path of a boundary render
+STAGE_RENDER = 'render'        # Map render job of a tile or metatile block
+STAGE_CROP = 'crop'            # Mask (background jobs) and slicing into tiles
+STAGE_DOWNSAMPLE = 'downsample'  # Pyramid tile built from its children
+STAGE_LAYER_PROFILE = 'layer_profile'  # Per-layer sample renders (profiling overhead)
+STAGE_ENCODE = 'encode'        # PNG/JPEG encoding of a tile
+STAGE_WRITE = 'write'          # Storage write, per tile (batched on the writer thread)
+STAGE_COMMIT = 'commit'        # Storage commit
+
+# Run report: sidecar next to the output, and metadata row (optional)
+STATS_REPORT_SUFFIX = '.stats.json'
+STATS_METADATA_KEY = 'shaped_mbtiles_stats'
+
+# Per-layer profile: layers listed in the run report, and slowest renders
+# kept per layer
+REPORT_TOP_LAYERS = 10
+LAYER_SPIKES = 5
+
+# Histogram resolution: 8 buckets per doubling (~9% wide) from 0.1 µs
+BUCKETS_PER_DOUBLING = 8
+BUCKET_UNIT_S = 1e-7
+
+CLASS_NAMES = {TILE_OUTSIDE: 'outside', TILE_BOUNDARY: 'boundary', TILE_INSIDE: 'inside'}
+
+# ======================================================
+# HISTOGRAM
+# ======================================================
+class Histogram:
+    """Log-scaled histogram of durations in seconds."""
+    
+    __slots__ = ('count', 'total', 'max', 'buckets')
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}  # Bucket index -> sample count
+    
+    def add(self, seconds, count=1):
+        """
+        Add count samples of the same duration.
+        
+        Args:
+            seconds: Duration in seconds
+            count: Number of samples (e.g. tiles sharing a batch write)
+        """
+        bucket = int(math.log2(max(seconds, BUCKET_UNIT_S) / BUCKET_UNIT_S) * BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+        self.total += seconds * count
+        self.max = max(self.max, seconds)
+    
+    def merge(self, other):
+        """Add all samples of another histogram."""
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, q):
+        """
+        Upper edge of the bucket holding the q-th percentile.
+        
+        Args:
+            q: Percentile (0-100)
+        
+        Returns:
+            Duration in seconds (at most the maximum recorded)
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = BUCKET_UNIT_S * 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+                return min(upper, self.max)
+        return self.max
+    
+    def summary(self):
+        """Dict of count, total seconds and mean/p50/p95/max in milliseconds."""
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 3),
+            'mean_ms': round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(1000 * self.percentile(50), 3),
+            'p95_ms': round(1000 * self.percentile(95), 3),
+            'max_ms': round(1000 * self.max, 3)
+        }
+
+# ======================================================
+# RUN STATISTICS
+# ======================================================
+class RunStats:
+    """
+    Timing histograms of one export, keyed by (stage, zoom, tile class).
+    
+    Zoom and class are optional per sample (None when a stage doesn't
+    know them, e.g. encoding has no class).
+    """
+    
+    def __init__(self):
+        self.histograms = {}
+        self.layers = {}  # Layer id -> _LayerProfile
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+    
+    def record(self, stage, seconds, zoom=None, tile_class=None, count=1):
+        """
+        Record a duration.
+        
+        Args:
+            stage: One of the STAGE_* names
+            seconds: Duration in seconds
+            zoom: Zoom level, if known
+            tile_class: TILE_INSIDE / TILE_BOUNDARY / TILE_OUTSIDE, if known
+            count: Number of tiles the duration applies to each
+        """
+        key = (stage, zoom, tile_class)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.add(seconds, count)
+    
+    def record_layers(self, layer_times, zoom, tile, count=1):
+        """
+        Record the per-layer render times of one render.
+        
+        Args:
+            layer_times: List of (layer id, layer name, seconds)
+            zoom: Zoom level of the render
+            tile: (x, y) of the render's tile (first tile of a block)
+            count: Number of renders the (sampled) times stand for
+        """
+        with self._lock:
+            for layer_id, name, seconds in layer_times:
+                profile = self.layers.get(layer_id)
+                if profile is None:
+                    profile = self.layers[layer_id] = _LayerProfile(name)
+                profile.add(seconds, zoom, tile, count)
+    
+    def top_layers(self, count):
+        """
+        The layers with the most render time so far.
+        
+        Args:
+            count: Number of layers
+        
+        Returns:
+            List of (layer name, total seconds, mean seconds per render),
+            most expensive first
+        """
+        with self._lock:
+            totals = [(p.total.total, p.name, p.total.count) for p in self.layers.values()]
+        totals.sort(reverse=True)
+        return [(name, total, total / renders) for total, name, renders in totals[:count]]
+    
+    def timed(self, stage, zoom=None, tile_class=None):
+        """Context manager recording the time spent in its block."""
+        return _Timed(self, stage, zoom, tile_class)
+    
+    def report(self, **extra):
+        """
+        Build the run report.
+        
+        Args:
+            **extra: Additional top-level values (output path, tile count...)
+        
+        Returns:
+            JSON-serializable dict: {"elapsed_s", **extra, "stages": {stage:
+            {"all": summary, "zooms": {z: summary}, "classes": {name:
+            summary}}}, "layers": [{"id", "name", "all", "zooms",
+            "spikes": [{"zoom", "x", "y", "ms"}]}]}, layers sorted by total
+            render time (REPORT_TOP_LAYERS most expensive)
+        """
+        stages = {}
+        with self._lock:
+            for (stage, zoom, tile_class), histogram in self.histograms.items():
+                groups = stages.setdefault(stage, {'all': Histogram(), 'zooms': {}, 'classes': {}})
+                groups['all'].merge(histogram)
+                if zoom is not None:
+                    groups['zooms'].setdefault(zoom, Histogram()).merge(histogram)
+                if tile_class is not None:
+                    name = CLASS_NAMES.get(tile_class, str(tile_class))
+                    groups['classes'].setdefault(name, Histogram()).merge(histogram)
+            layers = sorted(self.layers.items(), key=lambda item: item[1].total.total, reverse=True)
+            layers = [(layer_id, profile.report()) for layer_id, profile in layers[:REPORT_TOP_LAYERS]]
+        
+        report = {'elapsed_s': round(time.time() - self.start_time, 3)}
+        report.update(extra)
+        report['stages'] = {
+            stage: {
+                'all': groups['all'].summary(),
+                'zooms': {str(z): h.summary() for z, h in sorted(groups['zooms'].items())},
+                'classes': {name: h.summary() for name, h in sorted(groups['classes'].items())}
+            }
+            for stage, groups in stages.items()
+        }
+        report['layers'] = [dict(id=layer_id, **profile) for layer_id, profile in layers]
+        return report
+
+class _LayerProfile:
+    """Render times of one layer: per zoom, and its slowest renders."""
+    
+    __slots__ = ('name', 'total', 'zooms', 'spikes')
+    
+    def __init__(self, name):
+        self.name = name
+        self.total = Histogram()
+        self.zooms = {}    # Zoom -> Histogram
+        self.spikes = []   # Min-heap of (seconds, zoom, x, y), LAYER_SPIKES long
+    
+    def add(self, seconds, zoom, tile, count=1):
+        self.total.add(seconds, count)
+        self.zooms.setdefault(zoom, Histogram()).add(seconds, count)
+        spike = (seconds, zoom) + tuple(tile)
+        if len(self.spikes) < LAYER_SPIKES:
+            heapq.heappush(self.spikes, spike)
+        elif spike > self.spikes[0]:
+            heapq.heapreplace(self.spikes, spike)
+    
+    def report(self):
+        return {
+            'name': self.name,
+            'all': self.total.summary(),
+            'zooms': {str(z): h.summary() for z, h in sorted(self.zooms.items())},
+            'spikes': [{'zoom': z, 'x': x, 'y': y, 'ms': round(1000 * seconds, 3)}
+                       for seconds, z, x, y in sorted(self.spikes, reverse=True)]
+        }
+
+class _Timed:
+    """Context manager for RunStats.timed()."""
+    
+    __slots__ = ('stats', 'stage', 'zoom', 'tile_class', 'start')
+    
+    def __init__(self, stats, stage, zoom, tile_class):
+        self.stats = stats
+        self.stage = stage
+        self.zoom = zoom
+        self.tile_class = tile_class
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stats.record(self.stage, time.perf_counter() - self.start, self.zoom, self.tile_class)
+        return False
+
+def write_report(path, report):
+    """
+    Write a run report as a JSON sidecar file.
+    
+    Args:
+        path: File to write (e.g. "<output>.stats.json")
+        report: Dict from RunStats.report()
+    """
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
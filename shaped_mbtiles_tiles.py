@@ -0,0 +1,694 @@
+"""
+Pure-Python tile enumeration helpers for the Shaped MBTiles Generator.
+
+This module has no QGIS imports so it can be used from worker threads,
+separate processes and benchmarks. Polygons are passed in as plain rings of
+(x, y) tuples in Web Mercator meters (see _polygon_rings() in
+shaped_mbtiles.py for the conversion from QgsGeometry).
+"""
+
+import math
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from itertools import groupby
+
+# ======================================================
+# CONSTANTS
+# ======================================================
+TILE_SIZE = 256  # Standard web map tile size (TMS specification)
+ORIGIN_SHIFT = 20037508.342789244  # Web Mercator (EPSG:3857) extent in meters
+WORLD_CIRCUMFERENCE = 40075016.686  # Earth's circumference at equator in meters
+
+# Tile classification against the export polygon
+TILE_OUTSIDE = 0   # Tile does not touch the polygon
+TILE_BOUNDARY = 1  # Tile crosses the polygon boundary (needs clipping)
+TILE_INSIDE = 2    # Tile is fully contained in the polygon
+
+# Order of the tiles (or metatile blocks) within each zoom level
+ORDER_ROWS = 'rows'        # Row by row, west to east
+ORDER_HILBERT = 'hilbert'  # Along a Hilbert curve
+ORDER_MORTON = 'morton'    # Z-order: depth-first through the quadtree
+
+# ======================================================
+# SCANLINE RASTERIZER
+# ======================================================
+def _ring_edges(ring):
+    """
+    Yield the edges of a ring, closing it if the last point isn't the first.
+    
+    Args:
+        ring: Sequence of (x, y) tuples
+    
+    Yields:
+        Tuples of ((x1, y1), (x2, y2))
+    """
+    count = len(ring)
+    if count < 2:
+        return
+    for i in range(count - 1):
+        yield ring[i], ring[i + 1]
+    if ring[0] != ring[-1]:
+        yield ring[-1], ring[0]
+
+def _merge_ranges(ranges):
+    """
+    Merge overlapping or adjacent inclusive (first, last) integer ranges.
+    
+    Args:
+        ranges: List of (first, last) tuples (modified in place by sorting)
+    
+    Returns:
+        Sorted list of disjoint (first, last) tuples
+    """
+    ranges.sort()
+    merged = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+def scanline_tile_rows(rings, zoom):
+    """
+    Rasterize polygon rings at tile resolution for one zoom level.
+    
+    Convenience wrapper around scanline_tile_classes() that drops the
+    boundary information.
+    
+    Args:
+        rings: List of rings, each a sequence of (x, y) tuples in Web
+               Mercator meters
+        zoom: Zoom level
+    
+    Returns:
+        Dict mapping tile row (XYZ y) to a sorted list of disjoint inclusive
+        (x_first, x_last) tile ranges
+    """
+    return scanline_tile_classes(rings, zoom)[0]
+
+def scanline_tile_classes(rings, zoom):
+    """
+    Rasterize polygon rings at tile resolution and classify the tiles.
+    
+    Works in tile units (u to the right, v downwards) and computes, for each
+    tile row, the x-projection of the polygon clipped to that row. That
+    projection is the union of:
+    - the x-extent of every edge piece that falls inside the row
+    - the even-odd interior spans on the row's top and bottom scanlines
+    
+    Tiles containing an edge piece are boundary tiles; every other covered
+    tile lies in an interior span and is fully inside the polygon.
+    
+    Cost is O(vertices + rows crossed by edges) with no geometry library
+    calls. Tiles that only touch the polygon along a tile edge or corner are
+    not reported (nothing of them would be drawn); the quadtree engine in
+    shaped_mbtiles.py uses the same rule.
+    
+    Args:
+        rings: List of rings (outer rings and holes of all parts), each a
+               sequence of (x, y) tuples in Web Mercator meters
+        zoom: Zoom level
+    
+    Returns:
+        Tuple of two dicts mapping tile row (XYZ y) to sorted lists of
+        disjoint inclusive (x_first, x_last) tile ranges:
+        - all covered tiles
+        - boundary tiles (a subset of the covered tiles)
+    """
+    n = 2 ** zoom
+    tile_meters = WORLD_CIRCUMFERENCE / n
+    
+    edge_ranges = {}  # row -> [(x_first, x_last), ...] from edge pieces
+    below = {}        # scanline -> [u, ...] crossings just below the line
+    above = {}        # scanline -> [u, ...] crossings just above the line
+    
+    def add_range(row, u_a, u_b):
+        if row < 0 or row >= n:
+            return
+        if u_a > u_b:
+            u_a, u_b = u_b, u_a
+        first = max(0, int(math.floor(u_a)))
+        last = min(n - 1, int(math.ceil(u_b)) - 1)
+        # Zero-width pieces on a tile boundary are covered by the spans
+        if last >= first:
+            edge_ranges.setdefault(row, []).append((first, last))
+    
+    for ring in rings:
+        for (x1, y1), (x2, y2) in _ring_edges(ring):
+            u1 = (x1 + ORIGIN_SHIFT) / tile_meters
+            v1 = (ORIGIN_SHIFT - y1) / tile_meters
+            u2 = (x2 + ORIGIN_SHIFT) / tile_meters
+            v2 = (ORIGIN_SHIFT - y2) / tile_meters
+            
+            if v1 == v2:
+                # Horizontal edge inside a single row. One lying exactly on
+                # a row boundary is covered by the spans of the row it bounds.
+                if v1 != math.floor(v1):
+                    add_range(int(math.floor(v1)), u1, u2)
+                continue
+            
+            slope = (u2 - u1) / (v2 - v1)
+            v_min, v_max = (v1, v2) if v1 < v2 else (v2, v1)
+            
+            # Edge pieces clipped to each row the edge passes through
+            row_first = max(0, int(math.floor(v_min)))
+            row_last = min(n - 1, int(math.ceil(v_max)) - 1)
+            for row in range(row_first, row_last + 1):
+                va = max(v_min, row)
+                vb = min(v_max, row + 1)
+                add_range(row, u1 + (va - v1) * slope, u1 + (vb - v1) * slope)
+            
+            # Crossings with integer scanlines. Half-open rules give the
+            # interior just below (v_min <= line < v_max) and just above
+            # (v_min < line <= v_max) each line.
+            for line in range(max(0, int(math.ceil(v_min))),
+                              min(n, int(math.ceil(v_max)) - 1) + 1):
+                below.setdefault(line, []).append(u1 + (line - v1) * slope)
+            for line in range(max(1, int(math.floor(v_min)) + 1),
+                              min(n, int(math.floor(v_max))) + 1):
+                above.setdefault(line, []).append(u1 + (line - v1) * slope)
+    
+    # Interior spans (even-odd rule): spans below line k belong to row k,
+    # spans above line k belong to row k - 1
+    row_spans = {}
+    for crossings, row_offset in ((below, 0), (above, -1)):
+        for line, us in crossings.items():
+            us.sort()
+            spans = row_spans.setdefault(line + row_offset, [])
+            spans.extend((us[i], us[i + 1]) for i in range(0, len(us) - 1, 2))
+    
+    rows = {}
+    boundary_rows = {}
+    for row in set(edge_ranges) | set(row_spans):
+        if row < 0 or row >= n:
+            continue
+        ranges = edge_ranges.get(row, [])
+        if ranges:
+            boundary_rows[row] = _merge_ranges(list(ranges))
+        for u_a, u_b in row_spans.get(row, ()):
+            first = max(0, int(math.floor(u_a)))
+            last = min(n - 1, int(math.ceil(u_b)) - 1)
+            if last >= first:
+                ranges.append((first, last))
+        if ranges:
+            rows[row] = _merge_ranges(ranges)
+    
+    return rows, boundary_rows
+
+def classify_row_ranges(ranges, boundary_ranges):
+    """
+    Split a row's covered ranges into inside and boundary segments.
+    
+    Args:
+        ranges: Sorted disjoint inclusive (x_first, x_last) covered ranges
+        boundary_ranges: Sorted disjoint inclusive boundary ranges, each
+                         contained in one of the covered ranges
+    
+    Yields:
+        (x_first, x_last, tile_class) with TILE_INSIDE or TILE_BOUNDARY,
+        in increasing x order
+    """
+    b_iter = iter(boundary_ranges)
+    boundary = next(b_iter, None)
+    for first, last in ranges:
+        x = first
+        while x <= last:
+            if boundary is None or boundary[0] > last:
+                yield x, last, TILE_INSIDE
+                break
+            if boundary[0] > x:
+                yield x, boundary[0] - 1, TILE_INSIDE
+            yield boundary[0], boundary[1], TILE_BOUNDARY
+            x = boundary[1] + 1
+            boundary = next(b_iter, None)
+
+def count_tile_rows(rows):
+    """
+    Count the tiles described by scanline_tile_rows() output.
+    
+    Args:
+        rows: Dict mapping row to list of inclusive (x_first, x_last) ranges
+    
+    Returns:
+        Total number of tiles
+    """
+    return sum(last - first + 1 for ranges in rows.values() for first, last in ranges)
+
+# ======================================================
+# HILBERT TILE IDS
+# ======================================================
+def hilbert_tile_id(z, x, y):
+    """
+    PMTiles tile id: position on the Hilbert curve, counted across zooms.
+    
+    Ids of zoom z start after the 4**0 + ... + 4**(z-1) tiles of the lower
+    zooms; within a zoom, the (x, y) grid is walked along a Hilbert curve,
+    so tiles close on the map get close ids.
+    
+    Args:
+        z, x, y: XYZ tile coordinates
+    
+    Returns:
+        Tile id (non-negative integer)
+    """
+    return ((1 << (2 * z)) - 1) // 3 + hilbert_index(z, x, y)
+
+def hilbert_index(bits, x, y):
+    """
+    Distance of (x, y) along the Hilbert curve over a 2**bits square.
+    
+    Args:
+        bits: Curve order (the square is 2**bits cells wide)
+        x, y: Cell coordinates
+    
+    Returns:
+        Index from 0 to 4**bits - 1
+    """
+    d = 0
+    s = 1 << bits >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve continues in the sub-square
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - (x & (s - 1))
+                y = s - 1 - (y & (s - 1))
+            x, y = y, x
+        s >>= 1
+    return d
+
+def hilbert_cell(bits, d):
+    """
+    Inverse of hilbert_index(): the cell at distance d along the curve.
+    
+    Args:
+        bits: Curve order (the square is 2**bits cells wide)
+        d: Index from 0 to 4**bits - 1
+    
+    Returns:
+        Tuple of (x, y)
+    """
+    x = y = 0
+    s = 1
+    while s < (1 << bits):
+        rx = 1 & (d >> 1)
+        ry = 1 & (d ^ rx)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        x += s * rx
+        y += s * ry
+        d >>= 2
+        s <<= 1
+    return x, y
+
+def morton_index(x, y):
+    """Z-order index of (x, y): the bits of x and y interleaved (x lowest)."""
+    d = 0
+    bit = 0
+    while x or y:
+        d |= (x & 1) << (2 * bit) | (y & 1) << (2 * bit + 1)
+        x >>= 1
+        y >>= 1
+        bit += 1
+    return d
+
+def morton_cell(d):
+    """Inverse of morton_index(): Tuple of (x, y)."""
+    x = y = 0
+    bit = 0
+    while d:
+        x |= (d & 1) << bit
+        y |= ((d >> 1) & 1) << bit
+        d >>= 2
+        bit += 1
+    return x, y
+
+def block_order_key(order, z, block_x, block_y, size):
+    """
+    Sort key of a block (or tile, with size 1) in processing order.
+    
+    Keys only depend on the block's position, so they stay valid as a
+    resume cursor even when tiles already written are removed from the set.
+    
+    Args:
+        order: ORDER_ROWS, ORDER_HILBERT or ORDER_MORTON
+        z: Zoom level
+        block_x, block_y: Block coordinates (tile coordinates // size)
+        size: Block edge length in tiles
+    
+    Returns:
+        Tuple, increasing in the order TileSet.iter_blocks() yields blocks
+    """
+    if order == ORDER_HILBERT:
+        return (z, hilbert_index(_curve_bits(z, size), block_x, block_y))
+    if order == ORDER_MORTON:
+        return (z, morton_index(block_x, block_y))
+    return (z, block_y, block_x)
+
+def _curve_bits(z, size):
+    """Curve order covering the block grid of a zoom level."""
+    return ((2 ** z - 1) // size).bit_length()
+
+# ======================================================
+# COMPACT TILE SET
+# ======================================================
+def _combine_rows(a, b, keep):
+    """
+    Combine two rows of half-open x-intervals with a boolean operator.
+    
+    Args:
+        a, b: array('I') of sorted, disjoint, non-touching half-open
+              intervals [start0, end0, start1, end1, ...]
+        keep: Function (in_a, in_b) -> bool deciding membership
+    
+    Returns:
+        Normalized array('I') with the combined intervals
+    """
+    out = array('I')
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    in_a = in_b = False
+    inside = False
+    while i < len_a or j < len_b:
+        if j >= len_b or (i < len_a and a[i] <= b[j]):
+            x = a[i]
+        else:
+            x = b[j]
+        if i < len_a and a[i] == x:
+            in_a = not in_a
+            i += 1
+        if j < len_b and b[j] == x:
+            in_b = not in_b
+            j += 1
+        now_inside = keep(in_a, in_b)
+        if now_inside != inside:
+            out.append(x)
+            inside = now_inside
+    return out
+
+class TileSet:
+    """
+    Compact run-length set of XYZ tiles.
+    
+    Tiles are stored per zoom and per row as a sorted array('I') of
+    half-open x-intervals [start0, end0, start1, end1, ...]. A polygon's
+    tile set has only a few intervals per row, so even 100M-tile jobs fit
+    in a few MB and can be written to disk cheaply (see to_bytes()/save()).
+    
+    Iteration order is zoom, then row (y), then column (x).
+    """
+    
+    _MAGIC = b'TSET1'
+    
+    def __init__(self):
+        self._zooms = {}   # z -> {y: array('I')}
+        self._count = 0
+    
+    # ---- building ----
+    
+    def add(self, z, x, y):
+        """Add a single tile."""
+        self.add_range(z, y, x, x)
+    
+    def add_range(self, z, y, x_first, x_last):
+        """
+        Add the inclusive run of tiles x_first..x_last in row y of zoom z.
+        
+        Appending runs in increasing x order (as the enumeration engines do)
+        is O(1); other insertions merge the row.
+        """
+        rows = self._zooms.setdefault(z, {})
+        row = rows.get(y)
+        start, end = x_first, x_last + 1
+        if row is None:
+            rows[y] = array('I', (start, end))
+            self._count += end - start
+        elif start > row[-1]:
+            row.append(start)
+            row.append(end)
+            self._count += end - start
+        elif start == row[-1]:
+            row[-1] = end
+            self._count += end - start
+        else:
+            merged = _combine_rows(row, array('I', (start, end)), lambda p, q: p or q)
+            self._count += _row_count(merged) - _row_count(row)
+            rows[y] = merged
+    
+    def add_rows(self, z, rows):
+        """
+        Add scanline output for one zoom level.
+        
+        Args:
+            z: Zoom level
+            rows: Dict mapping row to inclusive (x_first, x_last) ranges, as
+                  returned by scanline_tile_rows()
+        """
+        for y, ranges in rows.items():
+            for x_first, x_last in ranges:
+                self.add_range(z, y, x_first, x_last)
+    
+    def update(self, other):
+        """Add every tile of another TileSet to this one (in place)."""
+        for z, other_rows in other._zooms.items():
+            rows = self._zooms.setdefault(z, {})
+            for y, other_row in other_rows.items():
+                row = rows.get(y)
+                if row is None:
+                    rows[y] = array('I', other_row)
+                    self._count += _row_count(other_row)
+                else:
+                    merged = _combine_rows(row, other_row, lambda p, q: p or q)
+                    self._count += _row_count(merged) - _row_count(row)
+                    rows[y] = merged
+    
+    # ---- set operations ----
+    
+    def union(self, other):
+        """Return a new TileSet with the tiles of both sets."""
+        return self._combine(other, lambda p, q: p or q)
+    
+    def difference(self, other):
+        """Return a new TileSet with the tiles of this set not in other."""
+        return self._combine(other, lambda p, q: p and not q)
+    
+    def intersection(self, other):
+        """Return a new TileSet with the tiles present in both sets."""
+        return self._combine(other, lambda p, q: p and q)
+    
+    def _combine(self, other, keep):
+        result = TileSet()
+        empty = array('I')
+        for z in set(self._zooms) | set(other._zooms):
+            rows_a = self._zooms.get(z, {})
+            rows_b = other._zooms.get(z, {})
+            rows = {}
+            for y in set(rows_a) | set(rows_b):
+                row = _combine_rows(rows_a.get(y, empty), rows_b.get(y, empty), keep)
+                if row:
+                    rows[y] = row
+                    result._count += _row_count(row)
+            if rows:
+                result._zooms[z] = rows
+        return result
+    
+    # ---- queries ----
+    
+    def __len__(self):
+        return self._count
+    
+    def __contains__(self, tile):
+        z, x, y = tile
+        row = self._zooms.get(z, {}).get(y)
+        # Inside an interval iff an odd number of boundaries are <= x
+        return row is not None and bisect_right(row, x) % 2 == 1
+    
+    def __iter__(self):
+        for z in sorted(self._zooms):
+            rows = self._zooms[z]
+            for y in sorted(rows):
+                row = rows[y]
+                for i in range(0, len(row), 2):
+                    for x in range(row[i], row[i + 1]):
+                        yield z, x, y
+    
+    def zooms(self):
+        """Return the sorted list of zoom levels present in the set."""
+        return sorted(z for z, rows in self._zooms.items() if rows)
+    
+    def rows(self, z):
+        """
+        Iterate over the rows of one zoom level.
+        
+        Yields:
+            (y, [(x_first, x_last), ...]) with inclusive ranges, by row
+        """
+        rows = self._zooms.get(z, {})
+        for y in sorted(rows):
+            row = rows[y]
+            yield y, [(row[i], row[i + 1] - 1) for i in range(0, len(row), 2)]
+    
+    def count_zoom(self, z):
+        """Return the number of tiles at one zoom level."""
+        return sum(_row_count(row) for row in self._zooms.get(z, {}).values())
+    
+    def iter_blocks(self, size, order=ORDER_ROWS):
+        """
+        Group the tiles into aligned size×size blocks (metatiles).
+        
+        Blocks start at multiples of size in x and y, so neighbouring blocks
+        never overlap. Only tiles in the set are listed for each block.
+        
+        Curve orders keep consecutive blocks next to each other on the map,
+        so data provider caches (raster blocks, feature iterators) get more
+        reuse. They cost one 8-byte curve index per block of a zoom level,
+        sorted before the zoom is yielded.
+        
+        Args:
+            size: Block edge length in tiles (1 = single tiles)
+            order: ORDER_ROWS, ORDER_HILBERT or ORDER_MORTON
+        
+        Yields:
+            (z, block_x, block_y, [(x, y), ...]) by zoom, then in the given
+            order (rows: by block row and block column)
+        """
+        if order != ORDER_ROWS:
+            yield from self._iter_curve_blocks(size, order)
+            return
+        
+        for z in sorted(self._zooms):
+            rows = self._zooms[z]
+            for block_y, ys in groupby(sorted(rows), key=lambda y: y // size):
+                blocks = {}
+                for y in ys:
+                    row = rows[y]
+                    for i in range(0, len(row), 2):
+                        for x in range(row[i], row[i + 1]):
+                            blocks.setdefault(x // size, []).append((x, y))
+                for block_x in sorted(blocks):
+                    yield z, block_x, block_y, blocks[block_x]
+    
+    def _iter_curve_blocks(self, size, order):
+        for z in sorted(self._zooms):
+            rows = self._zooms[z]
+            bits = _curve_bits(z, size)
+            keys = array('Q')
+            for block_y, ys in groupby(sorted(rows), key=lambda y: y // size):
+                block_xs = set()
+                for y in ys:
+                    row = rows[y]
+                    for i in range(0, len(row), 2):
+                        block_xs.update(range(row[i] // size, (row[i + 1] - 1) // size + 1))
+                for block_x in block_xs:
+                    if order == ORDER_HILBERT:
+                        keys.append(hilbert_index(bits, block_x, block_y))
+                    else:
+                        keys.append(morton_index(block_x, block_y))
+            
+            for key in sorted(keys):
+                if order == ORDER_HILBERT:
+                    block_x, block_y = hilbert_cell(bits, key)
+                else:
+                    block_x, block_y = morton_cell(key)
+                yield z, block_x, block_y, self._block_tiles(z, block_x, block_y, size)
+    
+    def _block_tiles(self, z, block_x, block_y, size):
+        """Tiles of the set inside one block, by row and column."""
+        rows = self._zooms[z]
+        x0 = block_x * size
+        tiles = []
+        for y in range(block_y * size, (block_y + 1) * size):
+            row = rows.get(y)
+            if row is None:
+                continue
+            for i in range(0, len(row), 2):
+                first = max(row[i], x0)
+                end = min(row[i + 1], x0 + size)
+                tiles.extend((x, y) for x in range(first, end))
+        return tiles
+    
+    def zoom_subset(self, zooms):
+        """Return a new TileSet restricted to the given zoom levels (shares no state)."""
+        result = TileSet()
+        for z in zooms:
+            for y, row in self._zooms.get(z, {}).items():
+                result._zooms.setdefault(z, {})[y] = array('I', row)
+                result._count += _row_count(row)
+        return result
+    
+    # ---- serialization ----
+    
+    def to_bytes(self):
+        """
+        Serialize the set to a compact, zlib-compressed byte string.
+        
+        Layout (little-endian, before compression): for each zoom, a
+        (zoom, row count) header followed by (y, boundary count) and the
+        interval boundaries of every row.
+        """
+        parts = []
+        for z in sorted(self._zooms):
+            rows = self._zooms[z]
+            parts.append(struct.pack('<BI', z, len(rows)))
+            for y in sorted(rows):
+                row = rows[y]
+                parts.append(struct.pack('<II', y, len(row)))
+                if sys.byteorder == 'big':
+                    row = array('I', row)
+                    row.byteswap()
+                parts.append(row.tobytes())
+        return self._MAGIC + zlib.compress(b''.join(parts))
+    
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Rebuild a TileSet serialized with to_bytes().
+        
+        Raises:
+            ValueError: If data is not a serialized TileSet
+        """
+        if not data.startswith(cls._MAGIC):
+            raise ValueError("Not a serialized TileSet")
+        payload = zlib.decompress(data[len(cls._MAGIC):])
+        result = cls()
+        offset = 0
+        while offset < len(payload):
+            z, row_count = struct.unpack_from('<BI', payload, offset)
+            offset += struct.calcsize('<BI')
+            rows = result._zooms.setdefault(z, {})
+            for _ in range(row_count):
+                y, length = struct.unpack_from('<II', payload, offset)
+                offset += struct.calcsize('<II')
+                row = array('I')
+                row.frombytes(payload[offset:offset + length * row.itemsize])
+                offset += length * row.itemsize
+                if sys.byteorder == 'big':
+                    row.byteswap()
+                rows[y] = row
+                result._count += _row_count(row)
+        return result
+    
+    def save(self, path):
+        """Write the serialized set to a file."""
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+    
+    @classmethod
+    def load(cls, path):
+        """Read a set written with save()."""
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+def _row_count(row):
+    """Number of tiles in a row of half-open intervals."""
+    return sum(row[i + 1] - row[i] for i in range(0, len(row), 2))
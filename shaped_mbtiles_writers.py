@@ -0,0 +1,1197 @@
+"""
+Tile storage writers for the Shaped MBTiles Generator.
+
+This module has no QGIS imports so the writers can be used from the plugin,
+the render farm coordinator and benchmarks alike.
+
+- MBTilesWriter: MBTiles (SQLite) database, written on the calling thread
+- PMTilesWriter: PMTiles v3 archive for serving from object storage, with
+  the same interface
+- DirectoryTileWriter: plain z/x/y folder tree, written by a thread pool
+- create_writer: picks one of them from the output path
+- ThreadedTileWriter: runs a writer on a dedicated thread behind a bounded
+  queue, so SQLite inserts and commit (fsync) latency never stall rendering;
+  tiles can be read back through the same connection (pyramid mode)
+- read_job_metadata / read_existing_tiles: what a resumed export needs to
+  know about a partially written file
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .shaped_mbtiles_tiles import hilbert_tile_id
+from .shaped_mbtiles_tilemath import packed_key_sql, tile_set_from_keys
+from .shaped_mbtiles_stats import STAGE_WRITE, STAGE_COMMIT
+
+# ThreadedTileWriter defaults
+WRITE_QUEUE_TILES = 256    # Max tiles waiting to be written (bounds memory)
+WRITE_BATCH_TILES = 64     # Max tiles per executemany() batch
+COMMIT_TILES = 1000        # Commit after this many tiles...
+COMMIT_INTERVAL_S = 2.0    # ...or after this many seconds, whichever is first
+
+# Output kinds (see output_kind())
+OUTPUT_MBTILES = 'mbtiles'
+OUTPUT_PMTILES = 'pmtiles'
+OUTPUT_DIRECTORY = 'directory'
+
+# PRAGMA profiles for MBTilesWriter
+SQLITE_PROFILE_SAFE = 'safe'  # SQLite defaults: rollback journal, synchronous=FULL
+SQLITE_PROFILE_BULK = 'bulk'  # Bulk load: WAL without per-commit fsync, big cache (see BULK_PRAGMAS)
+
+# Applied when the database is opened with the bulk profile. With the
+# write-ahead log and synchronous=NORMAL, commits don't fsync (only WAL
+# checkpoints do), yet a crash never corrupts the file: at worst the last
+# commits are lost, and a resumed export renders them again. These PRAGMAs
+# only affect this connection, except journal_mode=WAL, which is stored in
+# the file and switched back at close() (see BULK_FINAL_JOURNAL_MODE).
+BULK_PRAGMAS = (
+    ('page_size', 32768),       # Only takes effect on a new, empty database
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -262144),    # Negative = KiB, i.e. 256 MB
+    ('temp_store', 'MEMORY'),
+    ('locking_mode', 'EXCLUSIVE'),  # WAL index in memory, no -shm file
+)
+
+# Journal mode of a finished bulk-loaded file, so readers don't need
+# write access for the WAL's -shm/-wal files
+BULK_FINAL_JOURNAL_MODE = 'DELETE'
+
+# Metadata rows used to resume an interrupted export
+JOB_METADATA_KEY = 'shaped_mbtiles_job'        # JSON job definition
+CURSOR_METADATA_KEY = 'shaped_mbtiles_cursor'  # JSON key: work done through here
+COMPLETE_METADATA_KEY = 'shaped_mbtiles_complete'  # '1' once the export finished
+RESUME_FETCH_ROWS = 65536  # Stored tiles read per NumPy batch (read_existing_tiles)
+
+# PMTiles v3 archive layout
+PMTILES_HEADER_SIZE = 127
+PMTILES_ROOT_MAX = 16384 - PMTILES_HEADER_SIZE  # Header + root directory fit in 16 KB
+PMTILES_LEAF_ENTRIES = 4096                      # Initial entries per leaf directory
+PMTILES_ROOT_TRY_ENTRIES = 16 * PMTILES_LEAF_ENTRIES  # More entries never fit the root
+PMTILES_COPY_CHUNK = 1 << 20                     # Read size when copying tile data
+PMTILES_COMPRESSION_NONE = 1
+PMTILES_COMPRESSION_GZIP = 2
+PMTILES_TILE_TYPES = {'png': 2, 'jpg': 3}
+
+# DirectoryTileWriter defaults
+DIRECTORY_WRITE_THREADS = 8      # File writes run in parallel (the GIL is released during I/O)
+DIRECTORY_METADATA_FILE = 'metadata.json'
+
+# Queue markers
+_COMMIT = object()
+_CLOSE = object()
+
+# ======================================================
+# MBTILES DATABASE HANDLER
+# ======================================================
+class MBTilesWriter:
+    """
+    Writes tiles to an MBTiles SQLite database.
+    
+    Handles:
+    - Schema initialization (tiles and metadata tables)
+    - Metadata writing (name, bounds, format, zoom levels, etc.)
+    - Tile writing with XYZ to TMS coordinate conversion
+    - Batch commits for performance
+    - Optional bulk-load PRAGMA profile (WAL, no fsync per commit), switched
+      back to a rollback journal at close()
+    - Optional deduplicated layout: map + images tables keyed by a content
+      hash, with a tiles view for readers (as allowed by the spec)
+    
+    MBTiles spec: https://github.com/mapbox/mbtiles-spec
+    """
+    
+    def __init__(self, path, name="Shaped Export", description="Generated by QGIS", 
+                 tile_format="png", bounds=None, min_zoom=0, max_zoom=14,
+                 profile=SQLITE_PROFILE_SAFE, deduplicate=False):
+        """
+        Initialize MBTiles database.
+        
+        Args:
+            path: Output file path (.mbtiles)
+            name: Tileset name for metadata
+            description: Tileset description for metadata
+            tile_format: "png" or "jpg"
+            bounds: WGS84 bounds tuple (lon_min, lat_min, lon_max, lat_max)
+            min_zoom, max_zoom: Zoom level range
+            profile: SQLITE_PROFILE_SAFE or SQLITE_PROFILE_BULK
+            deduplicate: Store each distinct tile image once (map/images layout)
+        
+        Raises:
+            ValueError: If an existing file uses the other layout
+        """
+        self.path = path
+        self.profile = profile
+        self.deduplicate = deduplicate
+        self.conn = sqlite3.connect(path)
+        self.cursor = self.conn.cursor()
+        if profile == SQLITE_PROFILE_BULK:
+            self._apply_pragmas(BULK_PRAGMAS)
+        self._init_schema()
+        self._write_metadata(name, description, tile_format, bounds, min_zoom, max_zoom)
+    
+    def _apply_pragmas(self, pragmas):
+        for name, value in pragmas:
+            self.cursor.execute(f"PRAGMA {name} = {value}")
+            # journal_mode and wal_checkpoint return a row; fetch it so the
+            # statement completes
+            self.cursor.fetchall()
+    
+    def _init_schema(self):
+        # An existing file keeps its layout; refuse to mix the two
+        row = self.cursor.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'tiles'"
+        ).fetchone()
+        if row is not None and (row[0] == 'view') != self.deduplicate:
+            existing = "deduplicated" if row[0] == 'view' else "flat"
+            raise ValueError(f"{self.path} already uses the {existing} MBTiles layout")
+        
+        if self.deduplicate:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS map (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_id TEXT,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row)
+                )
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    tile_id TEXT PRIMARY KEY,
+                    tile_data BLOB
+                )
+            """)
+            self.cursor.execute("""
+                CREATE VIEW IF NOT EXISTS tiles AS
+                SELECT map.zoom_level AS zoom_level,
+                       map.tile_column AS tile_column,
+                       map.tile_row AS tile_row,
+                       images.tile_data AS tile_data
+                FROM map JOIN images ON images.tile_id = map.tile_id
+            """)
+        else:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_data BLOB,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row)
+                )
+            """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self.conn.commit()
+    
+    def _write_metadata(self, name, description, tile_format, bounds, min_zoom, max_zoom):
+        metadata = {
+            'name': name,
+            'type': 'baselayer',
+            'version': '1.0',
+            'description': description,
+            'format': tile_format,
+            'minzoom': str(min_zoom),
+            'maxzoom': str(max_zoom)
+        }
+        if bounds:
+            metadata['bounds'] = f"{bounds[0]},{bounds[1]},{bounds[2]},{bounds[3]}"
+            # Add center point (lon, lat, zoom)
+            center_lon = (bounds[0] + bounds[2]) / 2
+            center_lat = (bounds[1] + bounds[3]) / 2
+            center_zoom = (min_zoom + max_zoom) // 2
+            metadata['center'] = f"{center_lon},{center_lat},{center_zoom}"
+        
+        for key, value in metadata.items():
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                (key, value)
+            )
+        self.conn.commit()
+    
+    def write_tile(self, z, x, y, image_data):
+        """
+        Write a single tile to the database.
+        
+        Converts XYZ coordinates to TMS (flips Y axis) as required by MBTiles spec.
+        Uses INSERT OR REPLACE to overwrite existing tiles.
+        
+        Args:
+            z, x, y: XYZ tile coordinates
+            image_data: Tile image as bytes (PNG or JPEG)
+        """
+        if self.deduplicate:
+            self.write_tiles([(z, x, y, image_data)])
+            return
+        
+        # Convert XYZ (origin top-left) to TMS (origin bottom-left)
+        tms_y = (2 ** z) - 1 - y
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+            (z, x, tms_y, image_data)
+        )
+    
+    def write_tiles(self, tiles):
+        """
+        Write a batch of tiles with a single executemany().
+        
+        In the deduplicated layout, images already stored are skipped by
+        INSERT OR IGNORE on their content hash, so only the map row is
+        written for a duplicate tile.
+        
+        Args:
+            tiles: Iterable of (z, x, y, image_data) in XYZ coordinates
+        """
+        if self.deduplicate:
+            rows = [(z, x, (2 ** z) - 1 - y, hashlib.md5(data).hexdigest(), data)
+                    for z, x, y, data in tiles]
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)",
+                ((tile_id, data) for _, _, _, tile_id, data in rows)
+            )
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                ((z, x, tms_y, tile_id) for z, x, tms_y, tile_id, _ in rows)
+            )
+            return
+        
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+            (((z, x, (2 ** z) - 1 - y, data) for z, x, y, data in tiles))
+        )
+    
+    def read_tiles(self, tiles):
+        """
+        Read stored tiles back (including ones not committed yet).
+        
+        Works for both layouts: in the deduplicated one, tiles is a view.
+        
+        Args:
+            tiles: Iterable of (z, x, y) in XYZ coordinates
+        
+        Returns:
+            List of image bytes, None for tiles that are not stored
+        """
+        result = []
+        for z, x, y in tiles:
+            row = self.cursor.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (2 ** z) - 1 - y)
+            ).fetchone()
+            result.append(row[0] if row else None)
+        return result
+    
+    def set_metadata(self, key, value):
+        """Insert or replace one metadata row."""
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            (key, value)
+        )
+    
+    def commit(self):
+        self.conn.commit()
+    
+    def close(self):
+        """
+        Commit and close the database connection.
+        
+        After a bulk load, the WAL is checkpointed into the database and
+        the file is switched back to BULK_FINAL_JOURNAL_MODE (stored in the
+        file, unlike the per-connection PRAGMAs).
+        """
+        self.conn.commit()
+        if self.profile == SQLITE_PROFILE_BULK:
+            self._apply_pragmas((('wal_checkpoint', 'TRUNCATE'),
+                                 ('journal_mode', BULK_FINAL_JOURNAL_MODE)))
+        self.conn.close()
+
+# ======================================================
+# PMTILES ARCHIVE
+# ======================================================
+class PMTilesWriter:
+    """
+    Writes tiles to a PMTiles v3 archive (single file, HTTP range reads).
+    
+    Same interface as MBTilesWriter, so the generator and ThreadedTileWriter
+    can target it directly instead of converting an MBTiles file afterwards.
+    
+    - Tile blobs are streamed to a temporary file next to the output as they
+      arrive; identical blobs (by MD5) are stored once
+    - Only (tile id, offset, length) is kept per tile, in compact arrays
+    - close() sorts the entries by Hilbert tile id, merges runs of identical
+      consecutive tiles, builds the root (and leaf) directories and writes
+      the archive with tile data in tile id order (clustered). All of it
+      works on NumPy arrays (a few dozen bytes per tile, no Python object
+      per tile), and leaf directories are streamed to a temporary file
+    
+    The archive only exists after close(); a crash leaves no partial file,
+    so exports to PMTiles cannot be resumed.
+    
+    PMTiles spec: https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+    """
+    
+    def __init__(self, path, name="Shaped Export", description="Generated by QGIS",
+                 tile_format="png", bounds=None, min_zoom=0, max_zoom=14):
+        """
+        Start a PMTiles archive.
+        
+        Args:
+            path: Output file path (.pmtiles)
+            name: Tileset name for metadata
+            description: Tileset description for metadata
+            tile_format: "png" or "jpg"
+            bounds: WGS84 bounds tuple (lon_min, lat_min, lon_max, lat_max)
+            min_zoom, max_zoom: Zoom level range
+        """
+        self.path = path
+        self.tile_format = tile_format
+        self.bounds = bounds or (-180.0, -85.05112878, 180.0, 85.05112878)
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.metadata = {
+            'name': name,
+            'type': 'baselayer',
+            'version': '1.0',
+            'description': description,
+            'format': tile_format,
+            'minzoom': str(min_zoom),
+            'maxzoom': str(max_zoom)
+        }
+        # Blob store: one copy of each distinct image, in arrival order
+        self.data = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                           prefix='.pmtiles-')
+        self.data_size = 0
+        self.blobs = {}  # MD5 digest -> offset in the blob store
+        # One entry per written tile (a rewritten tile keeps its last entry)
+        self.tile_ids = array('Q')
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        # tile id -> entry index for the zooms read back (read_tiles)
+        self.index = {}
+        self.indexed_zooms = set()
+    
+    def write_tile(self, z, x, y, image_data):
+        """
+        Write a single tile.
+        
+        Args:
+            z, x, y: XYZ tile coordinates
+            image_data: Tile image as bytes (PNG or JPEG)
+        """
+        self.write_tiles([(z, x, y, image_data)])
+    
+    def write_tiles(self, tiles):
+        """
+        Write a batch of tiles; blobs already stored are only referenced.
+        
+        Args:
+            tiles: Iterable of (z, x, y, image_data) in XYZ coordinates
+        """
+        for z, x, y, data in tiles:
+            digest = hashlib.md5(data).digest()
+            offset = self.blobs.get(digest)
+            if offset is None:
+                offset = self.data_size
+                self.data.write(data)
+                self.data_size += len(data)
+                self.blobs[digest] = offset
+            tile_id = hilbert_tile_id(z, x, y)
+            if z in self.indexed_zooms:
+                self.index[tile_id] = len(self.tile_ids)
+            self.tile_ids.append(tile_id)
+            self.offsets.append(offset)
+            self.lengths.append(len(data))
+    
+    def read_tiles(self, tiles):
+        """
+        Read written tiles back from the blob store.
+        
+        The first read at a zoom level indexes that level's entries, so the
+        memory cost is one dict entry per tile of the zooms actually read
+        (the zoom above each built level in pyramid mode).
+        
+        Args:
+            tiles: Iterable of (z, x, y) in XYZ coordinates
+        
+        Returns:
+            List of image bytes, None for tiles that are not stored
+        """
+        result = []
+        for z, x, y in tiles:
+            if z not in self.indexed_zooms:
+                self._index_zoom(z)
+            i = self.index.get(hilbert_tile_id(z, x, y))
+            if i is None:
+                result.append(None)
+                continue
+            self.data.seek(self.offsets[i])
+            result.append(self.data.read(self.lengths[i]))
+            self.data.seek(0, os.SEEK_END)
+        return result
+    
+    def set_metadata(self, key, value):
+        """Set one metadata value (written as JSON metadata at close())."""
+        self.metadata[key] = value
+    
+    def commit(self):
+        self.data.flush()
+    
+    def close(self):
+        """Write the archive: header, directories, metadata and clustered tile data."""
+        leaves = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)),
+                                        prefix='.pmtiles-')
+        try:
+            self.blobs.clear()  # Only needed while tiles arrive
+            entries, contents = self._clustered_entries()
+            root, leaves_length = _pmtiles_directories(entries, leaves)
+            metadata = gzip.compress(json.dumps(self.metadata).encode('utf-8'))
+            
+            root_offset = PMTILES_HEADER_SIZE
+            metadata_offset = root_offset + len(root)
+            leaves_offset = metadata_offset + len(metadata)
+            data_offset = leaves_offset + leaves_length
+            content_offsets, content_lengths = contents
+            header = self._header(root_offset, len(root), metadata_offset, len(metadata),
+                                  leaves_offset, leaves_length, data_offset,
+                                  int(content_lengths.sum()), int(entries[3].sum()),
+                                  len(entries[0]), len(content_offsets))
+            
+            # Written under a temporary name, so a failed close leaves no broken archive
+            partial = self.path + '.part'
+            with open(partial, 'wb') as out:
+                out.write(header)
+                out.write(root)
+                out.write(metadata)
+                leaves.seek(0)
+                shutil.copyfileobj(leaves, out)
+                _copy_ranges(self.data, out, content_offsets, content_lengths)
+            os.replace(partial, self.path)
+        finally:
+            leaves.close()
+            self.data.close()
+    
+    def _index_zoom(self, z):
+        first = hilbert_tile_id(z, 0, 0)
+        last = first + (1 << (2 * z))
+        for i, tile_id in enumerate(self.tile_ids):
+            if first <= tile_id < last:
+                self.index[tile_id] = i
+        self.indexed_zooms.add(z)
+    
+    def _clustered_entries(self):
+        """
+        Directory entries in tile id order, with the tile data re-laid out.
+        
+        Returns:
+            Tuple of (entries, contents): entries are the arrays (tile_ids,
+            offsets, lengths, run_lengths) with offsets in the clustered
+            tile data; contents are the arrays (offsets, lengths) of the
+            blob store ranges to copy, in tile data order
+        """
+        tile_ids = np.frombuffer(self.tile_ids, dtype=np.uint64)
+        # Stable sort: of several writes of one tile, the last one wins
+        order = np.argsort(tile_ids, kind='stable')
+        if len(order) < 1 << 32:
+            order = order.astype(np.uint32)  # Halves the largest temporary array
+        tile_ids = tile_ids[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = tile_ids[1:] != tile_ids[:-1]
+        order = order[last]
+        tile_ids = tile_ids[last]
+        del last
+        blob_offsets = np.frombuffer(self.offsets, dtype=np.uint64)[order]
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)[order]
+        del order
+        
+        # Each distinct blob is placed at its first tile in tile id order
+        blobs, first, blob_index = np.unique(blob_offsets, return_index=True, return_inverse=True)
+        del blob_offsets
+        placement = np.argsort(first)
+        content_lengths = lengths[first[placement]].astype(np.uint64)
+        del first
+        placed = np.empty(len(blobs), dtype=np.uint64)
+        placed[placement] = np.cumsum(content_lengths) - content_lengths
+        offsets = placed[blob_index.reshape(-1)]
+        del blob_index, placed
+        contents = (blobs[placement], content_lengths)
+        
+        # Run-length entries: consecutive tile ids sharing the same data
+        starts = np.ones(len(tile_ids), dtype=bool)
+        starts[1:] = (offsets[1:] != offsets[:-1]) | (tile_ids[1:] != tile_ids[:-1] + np.uint64(1))
+        starts = np.flatnonzero(starts)
+        runs = np.diff(np.append(starts, len(tile_ids))).astype(np.uint64)
+        entries = (tile_ids[starts], offsets[starts], lengths[starts], runs)
+        return entries, contents
+    
+    def _header(self, root_offset, root_length, metadata_offset, metadata_length,
+                leaves_offset, leaves_length, data_offset, data_length,
+                addressed_tiles, tile_entries, tile_contents):
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        return struct.pack(
+            '<7sB11Q6B4iB2i',
+            b'PMTiles', 3,
+            root_offset, root_length, metadata_offset, metadata_length,
+            leaves_offset, leaves_length, data_offset, data_length,
+            addressed_tiles, tile_entries, tile_contents,
+            1,  # Clustered: tile data is in tile id order
+            PMTILES_COMPRESSION_GZIP,  # Directories and metadata
+            PMTILES_COMPRESSION_NONE,  # PNG/JPEG tiles are already compressed
+            PMTILES_TILE_TYPES.get(self.tile_format, 0),
+            self.min_zoom, self.max_zoom,
+            int(lon_min * 1e7), int(lat_min * 1e7), int(lon_max * 1e7), int(lat_max * 1e7),
+            (self.min_zoom + self.max_zoom) // 2,
+            int((lon_min + lon_max) / 2 * 1e7), int((lat_min + lat_max) / 2 * 1e7)
+        )
+
+def _pmtiles_varints(values):
+    """
+    Encode an array of values as unsigned LEB128 varints.
+    
+    Args:
+        values: Array-like of non-negative integers
+    
+    Returns:
+        Concatenated varint bytes
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b''
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    starts = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    # Byte k of every value that has one; all but the last byte set the high bit
+    for k in range(int(sizes.max())):
+        has_byte = sizes > k
+        byte = (values[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= (sizes[has_byte] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has_byte] + k] = byte
+    return out.tobytes()
+
+def _pmtiles_directory(tile_ids, offsets, lengths, runs):
+    """
+    Serialize and gzip a PMTiles directory.
+    
+    Args:
+        tile_ids, offsets, lengths, runs: Arrays of the entries, by tile id
+    
+    Returns:
+        Compressed directory bytes
+    """
+    tile_ids = np.asarray(tile_ids, dtype=np.uint64)
+    offsets = np.asarray(offsets, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.uint64)
+    deltas = tile_ids.copy()
+    deltas[1:] -= tile_ids[:-1]
+    # 0 = directly after the previous entry's data
+    encoded = offsets + np.uint64(1)
+    encoded[1:][offsets[1:] == offsets[:-1] + lengths[:-1]] = 0
+    return gzip.compress(b''.join((
+        _pmtiles_varints([len(tile_ids)]),
+        _pmtiles_varints(deltas),
+        _pmtiles_varints(runs),
+        _pmtiles_varints(lengths),
+        _pmtiles_varints(encoded)
+    )))
+
+def _pmtiles_directories(entries, leaves):
+    """
+    Build the root directory, writing leaf directories if needed.
+    
+    The header and root directory must fit in the first 16 KB. If all
+    entries don't, they are split into leaf directories (doubling the leaf
+    size until the root fits), and the root points to the leaves with
+    run length 0. Leaves are written to a file as they are built.
+    
+    Args:
+        entries: Arrays (tile_ids, offsets, lengths, runs), by tile id
+        leaves: Binary file receiving the leaf directories (rewritten from
+                its start)
+    
+    Returns:
+        Tuple of (root directory bytes, length of the leaf directories)
+    """
+    count = len(entries[0])
+    if count <= PMTILES_ROOT_TRY_ENTRIES:
+        root = _pmtiles_directory(*entries)
+        if len(root) <= PMTILES_ROOT_MAX:
+            return root, 0
+    
+    leaf_size = PMTILES_LEAF_ENTRIES
+    while True:
+        leaves.seek(0)
+        leaves.truncate()
+        leaf_ids, leaf_offsets, leaf_lengths = [], [], []
+        size = 0
+        for start in range(0, count, leaf_size):
+            leaf = _pmtiles_directory(*(column[start:start + leaf_size] for column in entries))
+            leaf_ids.append(int(entries[0][start]))
+            leaf_offsets.append(size)
+            leaf_lengths.append(len(leaf))
+            leaves.write(leaf)
+            size += len(leaf)
+        root = _pmtiles_directory(leaf_ids, leaf_offsets, leaf_lengths, [0] * len(leaf_ids))
+        if len(root) <= PMTILES_ROOT_MAX:
+            return root, size
+        leaf_size *= 2
+
+def _copy_ranges(source, out, offsets, lengths):
+    """
+    Copy byte ranges of a file to another, in order.
+    
+    Ranges that continue where the previous one ended (blobs stored in tile
+    order) are merged into one sequential read.
+    
+    Args:
+        source: Binary file to read from
+        out: Binary file to write to
+        offsets, lengths: Arrays of the ranges in source
+    """
+    if not len(offsets):
+        return
+    ends = offsets + lengths
+    starts = np.flatnonzero(np.append(True, offsets[1:] != ends[:-1]))
+    last = np.append(starts[1:], len(offsets)) - 1
+    for offset, end in zip(offsets[starts].tolist(), ends[last].tolist()):
+        source.seek(offset)
+        remaining = end - offset
+        while remaining:
+            chunk = source.read(min(remaining, PMTILES_COPY_CHUNK))
+            out.write(chunk)
+            remaining -= len(chunk)
+
+# ======================================================
+# DIRECTORY TREE
+# ======================================================
+class DirectoryTileWriter:
+    """
+    Writes tiles as a plain XYZ folder tree: <path>/<z>/<x>/<y>.<format>.
+    
+    Same interface as MBTilesWriter. Files are written by a thread pool, so
+    the open/write/close latency of many small files overlaps. The
+    <z>/<x> folders are created up front from the known tile set, so the
+    workers never race to create them.
+    
+    A tile whose file already holds the same bytes is not rewritten, so an
+    incremental re-export into the same folder only touches changed tiles
+    (file modification times stay meaningful for syncing); the written
+    and unchanged counters report how many files each case hit. Metadata
+    is written to metadata.json at close().
+    """
+    
+    def __init__(self, path, name="Shaped Export", description="Generated by QGIS",
+                 tile_format="png", bounds=None, min_zoom=0, max_zoom=14,
+                 tiles=None, workers=DIRECTORY_WRITE_THREADS):
+        """
+        Prepare the folder tree.
+        
+        Args:
+            path: Output folder (created if missing)
+            name, description, tile_format, bounds, min_zoom, max_zoom: As
+                for MBTilesWriter (stored in metadata.json)
+            tiles: TileSet of the tiles to be written, used to create the
+                   <z>/<x> folders; None creates them on demand
+            workers: File write threads
+        """
+        self.path = path
+        self.extension = tile_format
+        self.metadata = {
+            'name': name,
+            'type': 'baselayer',
+            'version': '1.0',
+            'description': description,
+            'format': tile_format,
+            'minzoom': str(min_zoom),
+            'maxzoom': str(max_zoom),
+            'scheme': 'xyz'
+        }
+        if bounds:
+            self.metadata['bounds'] = f"{bounds[0]},{bounds[1]},{bounds[2]},{bounds[3]}"
+        self.written = 0
+        self.unchanged = 0
+        self.max_pending = 4 * workers
+        self.pending = []
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="ShapedMBTilesFiles")
+        
+        os.makedirs(path, exist_ok=True)
+        if tiles is not None:
+            for z in tiles.zooms():
+                for x_first, x_last in _tile_set_columns(tiles, z):
+                    for x in range(x_first, x_last + 1):
+                        os.makedirs(os.path.join(path, str(z), str(x)), exist_ok=True)
+    
+    def write_tile(self, z, x, y, image_data):
+        """
+        Write a single tile (on the thread pool).
+        
+        Args:
+            z, x, y: XYZ tile coordinates
+            image_data: Tile image as bytes (PNG or JPEG)
+        """
+        self.write_tiles([(z, x, y, image_data)])
+    
+    def write_tiles(self, tiles):
+        """
+        Queue a batch of tiles on the thread pool.
+        
+        Waits for the oldest writes while more than max_pending are in
+        flight, which bounds memory and surfaces I/O errors early.
+        
+        Args:
+            tiles: Iterable of (z, x, y, image_data) in XYZ coordinates
+        """
+        for z, x, y, data in tiles:
+            self.pending.append(self.pool.submit(self._write_file, self._tile_path(z, x, y), data))
+            if len(self.pending) > self.max_pending:
+                self._wait(len(self.pending) - self.max_pending)
+    
+    def read_tiles(self, tiles):
+        """
+        Read written tiles back (after the writes in flight finish).
+        
+        Args:
+            tiles: Iterable of (z, x, y) in XYZ coordinates
+        
+        Returns:
+            List of image bytes, None for tiles that are not stored
+        """
+        self._wait()
+        result = []
+        for z, x, y in tiles:
+            try:
+                with open(self._tile_path(z, x, y), 'rb') as f:
+                    result.append(f.read())
+            except FileNotFoundError:
+                result.append(None)
+        return result
+    
+    def set_metadata(self, key, value):
+        """Set one metadata value (written to metadata.json at close())."""
+        self.metadata[key] = value
+    
+    def commit(self):
+        """Wait for the writes in flight."""
+        self._wait()
+    
+    def close(self):
+        """Finish all writes and write metadata.json."""
+        try:
+            self._wait()
+            with open(os.path.join(self.path, DIRECTORY_METADATA_FILE), 'w') as f:
+                json.dump(self.metadata, f, indent=2)
+        finally:
+            self.pool.shutdown(wait=True)
+    
+    def _tile_path(self, z, x, y):
+        return os.path.join(self.path, str(z), str(x), f"{y}.{self.extension}")
+    
+    def _wait(self, count=None):
+        """Wait for the oldest count writes (all by default), re-raising errors."""
+        count = len(self.pending) if count is None else count
+        done, self.pending = self.pending[:count], self.pending[count:]
+        for future in done:
+            if future.result():
+                self.written += 1
+            else:
+                self.unchanged += 1
+    
+    def _write_file(self, tile_path, data):
+        """
+        Write one tile file unless it already holds the same bytes.
+        
+        Returns:
+            True if the file was written, False if it was unchanged
+        """
+        try:
+            if os.path.getsize(tile_path) == len(data):
+                with open(tile_path, 'rb') as f:
+                    if f.read() == data:
+                        return False
+        except FileNotFoundError:
+            pass
+        try:
+            f = open(tile_path, 'wb')
+        except FileNotFoundError:
+            # Folder not created up front (no tile set given, or a tile
+            # outside it)
+            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+            f = open(tile_path, 'wb')
+        with f:
+            f.write(data)
+        return True
+
+def _tile_set_columns(tiles, z):
+    """
+    Merged column ranges used by any row of one zoom of a TileSet.
+    
+    Returns:
+        List of inclusive (x_first, x_last) ranges, sorted
+    """
+    ranges = sorted(r for _, row_ranges in tiles.rows(z) for r in row_ranges)
+    merged = []
+    for x_first, x_last in ranges:
+        if merged and x_first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], x_last)
+        else:
+            merged.append([x_first, x_last])
+    return merged
+
+def output_kind(path, directory=False):
+    """
+    Storage kind of an output path.
+    
+    .mbtiles and .pmtiles files are databases/archives. A z/x/y folder tree
+    is only chosen for an existing folder, a path without extension or when
+    asked for explicitly, so a mistyped extension ("out.mbtile") is an
+    error instead of thousands of tile files.
+    
+    Args:
+        path: Output file or folder path
+        directory: Write a folder tree whatever the path looks like
+    
+    Returns:
+        OUTPUT_MBTILES, OUTPUT_PMTILES or OUTPUT_DIRECTORY
+    
+    Raises:
+        ValueError: For a file path with an unknown extension
+    """
+    if directory or os.path.isdir(path):
+        return OUTPUT_DIRECTORY
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.mbtiles':
+        return OUTPUT_MBTILES
+    if extension == '.pmtiles':
+        return OUTPUT_PMTILES
+    if not extension:
+        return OUTPUT_DIRECTORY
+    raise ValueError(f"Unknown output format '{extension}': use .mbtiles, .pmtiles "
+                     "or a folder (no extension)")
+
+def create_writer(path, name="Shaped Export", description="Generated by QGIS",
+                  tile_format="png", bounds=None, min_zoom=0, max_zoom=14,
+                  profile=SQLITE_PROFILE_SAFE, deduplicate=False, tiles=None,
+                  directory=False):
+    """
+    Open the writer for an output path.
+    
+    .pmtiles files get a PMTiles archive, .mbtiles files an MBTiles
+    database, and folders (see output_kind()) a z/x/y folder tree.
+    
+    Args:
+        path: Output file or folder path
+        name, description, tile_format, bounds, min_zoom, max_zoom: As for
+            MBTilesWriter
+        profile: PRAGMA profile (MBTiles only)
+        deduplicate: Deduplicated layout (MBTiles only; PMTiles archives
+                     always store identical blobs once)
+        tiles: TileSet to be written (folder tree only: creates its folders)
+        directory: Write a folder tree whatever the path looks like
+    
+    Returns:
+        MBTilesWriter, PMTilesWriter or DirectoryTileWriter
+    
+    Raises:
+        ValueError: For a file path with an unknown extension
+    """
+    kind = output_kind(path, directory)
+    if kind == OUTPUT_PMTILES:
+        return PMTilesWriter(path, name=name, description=description, tile_format=tile_format,
+                             bounds=bounds, min_zoom=min_zoom, max_zoom=max_zoom)
+    if kind == OUTPUT_DIRECTORY:
+        return DirectoryTileWriter(path, name=name, description=description,
+                                   tile_format=tile_format, bounds=bounds,
+                                   min_zoom=min_zoom, max_zoom=max_zoom, tiles=tiles)
+    return MBTilesWriter(path, name=name, description=description, tile_format=tile_format,
+                         bounds=bounds, min_zoom=min_zoom, max_zoom=max_zoom,
+                         profile=profile, deduplicate=deduplicate)
+
+# ======================================================
+# WRITER THREAD
+# ======================================================
+class ThreadedTileWriter:
+    """
+    Runs a tile writer on its own thread behind a bounded queue.
+    
+    Same interface as MBTilesWriter (write_tile / read_tiles / commit /
+    close). The
+    wrapped writer is created on the writer thread, because SQLite
+    connections belong to the thread that opened them. The thread drains
+    the queue in batches written with write_tiles() (executemany) and
+    commits by size or time.
+    
+    write_tile() blocks while the queue is full, which applies backpressure
+    to the renderer and keeps memory bounded. Errors raised on the writer
+    thread are re-raised by the next write_tile(), commit() or close().
+    """
+    
+    def __init__(self, writer_factory, max_queue=WRITE_QUEUE_TILES,
+                 batch_size=WRITE_BATCH_TILES, commit_tiles=COMMIT_TILES,
+                 commit_interval=COMMIT_INTERVAL_S, stats=None):
+        """
+        Start the writer thread.
+        
+        Args:
+            writer_factory: Callable returning the writer (e.g. an
+                            MBTilesWriter), called on the writer thread
+            max_queue: Max tiles waiting in the queue
+            batch_size: Max tiles per write_tiles() batch
+            commit_tiles: Commit after this many tiles
+            commit_interval: Commit after this many seconds
+            stats: RunStats receiving write (per tile) and commit timings
+        
+        Raises:
+            Exception: Whatever writer_factory raised (e.g. sqlite3.Error)
+        """
+        self.batch_size = batch_size
+        self.commit_tiles = commit_tiles
+        self.commit_interval = commit_interval
+        self.stats = stats
+        self._queue = queue.Queue(max_queue)
+        self._error = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(writer_factory,),
+                                        name="ShapedMBTilesWriter", daemon=True)
+        self._thread.start()
+        
+        # Surface open/schema errors right away
+        self._ready.wait()
+        self._raise_error()
+    
+    def write_tile(self, z, x, y, image_data):
+        """
+        Queue a tile for writing (blocks while the queue is full).
+        
+        Args:
+            z, x, y: XYZ tile coordinates
+            image_data: Encoded tile image bytes
+        """
+        self._put((z, x, y, image_data))
+    
+    def set_metadata(self, key, value):
+        """
+        Queue a metadata row, written after the tiles queued before it.
+        
+        Since it is committed together with (or after) those tiles, a
+        checkpoint written this way never claims tiles that are not stored.
+        """
+        self._put(_Metadata(key, value))
+    
+    def read_tiles(self, tiles):
+        """
+        Read tiles back on the writer thread (blocks until done).
+        
+        The request is queued like a tile, so it sees every tile queued
+        before it, committed or not. The bulk profile locks the database
+        exclusively, so reads have to use the writer's own connection.
+        
+        Args:
+            tiles: List of (z, x, y) in XYZ coordinates
+        
+        Returns:
+            List of image bytes, None for tiles that are not stored
+        """
+        request = _Read(tiles)
+        self._put(request)
+        while not request.done.wait(0.5):
+            if not self._thread.is_alive():
+                self._raise_error()
+                raise RuntimeError("Tile writer thread stopped")
+        return request.result
+    
+    def commit(self):
+        """Ask the writer thread to commit once the queued tiles are written."""
+        self._put(_COMMIT)
+    
+    def close(self):
+        """Write all queued tiles, commit, close the writer and stop the thread."""
+        if self._thread.is_alive():
+            self._put(_CLOSE)
+            self._thread.join()
+        self._raise_error()
+    
+    def _put(self, item):
+        """Put an item on the queue, waking up periodically to check for errors."""
+        while True:
+            self._raise_error()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if not self._thread.is_alive():
+                    self._raise_error()
+                    raise RuntimeError("Tile writer thread stopped")
+    
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+    
+    def _run(self, writer_factory):
+        """Writer thread: drain the queue in batches, commit by size or time."""
+        try:
+            writer = writer_factory()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        
+        uncommitted = 0
+        last_commit = time.monotonic()
+        try:
+            while True:
+                # Block for the first item (waking up to commit when idle),
+                # then take whatever else is already waiting
+                batch = []
+                try:
+                    batch.append(self._queue.get(timeout=self.commit_interval))
+                    while len(batch) < self.batch_size:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+                
+                tiles = [item for item in batch if isinstance(item, tuple)]
+                if tiles:
+                    start = time.perf_counter()
+                    writer.write_tiles(tiles)
+                    if self.stats is not None:
+                        self._record_write(tiles, time.perf_counter() - start)
+                    uncommitted += len(tiles)
+                for item in batch:
+                    if isinstance(item, _Metadata):
+                        writer.set_metadata(item.key, item.value)
+                        uncommitted += 1
+                    elif isinstance(item, _Read):
+                        item.result = writer.read_tiles(item.tiles)
+                        item.done.set()
+                
+                closing = _CLOSE in batch
+                if uncommitted and (closing or _COMMIT in batch
+                                    or uncommitted >= self.commit_tiles
+                                    or time.monotonic() - last_commit >= self.commit_interval):
+                    start = time.perf_counter()
+                    writer.commit()
+                    if self.stats is not None:
+                        self.stats.record(STAGE_COMMIT, time.perf_counter() - start)
+                    uncommitted = 0
+                    last_commit = time.monotonic()
+                
+                if closing:
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            try:
+                writer.close()
+            except Exception as e:
+                self._error = self._error or e
+
+    def _record_write(self, tiles, seconds):
+        """Record a batch write as the same per-tile time for each of its tiles."""
+        zooms = {}
+        for z, _, _, _ in tiles:
+            zooms[z] = zooms.get(z, 0) + 1
+        per_tile = seconds / len(tiles)
+        for z, count in zooms.items():
+            self.stats.record(STAGE_WRITE, per_tile, zoom=z, count=count)
+
+class _Metadata:
+    """Queue item: a metadata row for ThreadedTileWriter."""
+    
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+class _Read:
+    """Queue item: a read_tiles() request for ThreadedTileWriter."""
+    
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.result = None
+        self.done = threading.Event()
+
+# ======================================================
+# RESUME SUPPORT
+# ======================================================
+def read_job_metadata(path):
+    """
+    Read the resume information stored in an MBTiles file.
+    
+    Args:
+        path: MBTiles file written by this plugin
+    
+    Returns:
+        Tuple of (job dict or None, cursor list or None, complete). The
+        cursor is the JSON key of the last work item completed in order (see
+        IncrementalTileGenerator); None if no checkpoint was written.
+        complete is True once the export finished successfully, including
+        the empty tiles it skipped rather than stored.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        rows = dict(conn.execute(
+            "SELECT name, value FROM metadata WHERE name IN (?, ?, ?)",
+            (JOB_METADATA_KEY, CURSOR_METADATA_KEY, COMPLETE_METADATA_KEY)
+        ).fetchall())
+    finally:
+        conn.close()
+    job = json.loads(rows[JOB_METADATA_KEY]) if JOB_METADATA_KEY in rows else None
+    cursor = json.loads(rows[CURSOR_METADATA_KEY]) if CURSOR_METADATA_KEY in rows else None
+    return job, cursor, rows.get(COMPLETE_METADATA_KEY) == '1'
+
+def read_existing_tiles(path):
+    """
+    Collect the tiles already stored in an MBTiles file.
+    
+    Uses one SELECT ordered by the primary key (zoom, column, row), so
+    SQLite packs each stored tile to a pack_tiles() key (packed_key_sql(),
+    rows flipped to XYZ), so every fetched row is a single integer; the
+    keys are fetched in batches of RESUME_FETCH_ROWS into NumPy, sorted,
+    and become a TileSet with one Python step per run of columns
+    (tile_set_from_keys()) instead of one per tile.
+    
+    Args:
+        path: MBTiles file (flat or deduplicated layout)
+    
+    Returns:
+        TileSet of the stored tiles in XYZ coordinates
+    """
+    conn = sqlite3.connect(path)
+    try:
+        # In the deduplicated layout, map holds the same key without the join
+        is_view = conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'tiles'"
+        ).fetchone() == ('view',)
+        table = 'map' if is_view else 'tiles'
+        rows = conn.execute(f"SELECT {packed_key_sql()} FROM {table}")
+        
+        keys = [np.empty(0, dtype=np.int64)]
+        while True:
+            batch = rows.fetchmany(RESUME_FETCH_ROWS)
+            if not batch:
+                break
+            keys.append(np.array(batch, dtype=np.int64).ravel())
+        # The primary key is unique, so sorting is enough (no np.unique())
+        return tile_set_from_keys(np.sort(np.concatenate(keys)))
+    finally:
+        conn.close()
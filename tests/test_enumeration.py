@@ -0,0 +1,64 @@
+"""
+Tile enumeration: the scanline and quadtree engines must return the same tiles.
+
+The scanline engine has no QGIS imports; the quadtree comparison is skipped
+where qgis.core cannot be imported.
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+tiles_module = importlib.import_module(f"{PACKAGE}.shaped_mbtiles_tiles")
+
+ZOOM = 4
+
+def _tile_corner(z, u, v):
+    """Web Mercator meters of a tile grid corner (u right, v down)."""
+    tile_meters = tiles_module.WORLD_CIRCUMFERENCE / 2 ** z
+    return (u * tile_meters - tiles_module.ORIGIN_SHIFT,
+            tiles_module.ORIGIN_SHIFT - v * tile_meters)
+
+def _aligned_rings():
+    """A tile-aligned L shape plus a triangle touching it at one corner."""
+    l_shape = [(5, 3), (9, 3), (9, 5), (7, 5), (7, 8), (5, 8), (5, 3)]
+    triangle = [(9, 8), (11, 8), (11, 10), (9, 8)]
+    return [[_tile_corner(ZOOM, u, v) for u, v in ring] for ring in (l_shape, triangle)]
+
+def _scanline_tiles(rings, z):
+    """(tiles, boundary tiles) of the scanline engine as sets of (x, y)."""
+    rows, boundary_rows = tiles_module.scanline_tile_classes(rings, z)
+    flatten = lambda rows: {(x, y) for y, ranges in rows.items()
+                            for first, last in ranges for x in range(first, last + 1)}
+    return flatten(rows), flatten(boundary_rows)
+
+def test_scanline_skips_touching_tiles():
+    tiles, boundary = _scanline_tiles(_aligned_rings(), ZOOM)
+    l_shape = ({(x, y) for x in range(5, 9) for y in range(3, 5)}
+               | {(x, y) for x in range(5, 7) for y in range(5, 8)})
+    # The triangle covers half of tiles (9, 8) and (10, 9) and all of
+    # (10, 8); the L shape's neighbours, (11, 8) and (9, 9) only touch
+    triangle = {(9, 8), (10, 8), (10, 9)}
+    assert tiles == l_shape | triangle
+    assert boundary == {(9, 8), (10, 9)}
+
+def test_quadtree_matches_scanline():
+    qgis_core = pytest.importorskip("qgis.core")
+    shaped_mbtiles = importlib.import_module(f"{PACKAGE}.shaped_mbtiles")
+    
+    rings = _aligned_rings()
+    polygon = qgis_core.QgsGeometry.fromMultiPolygonXY([
+        [[qgis_core.QgsPointXY(x, y) for x, y in ring]] for ring in rings
+    ])
+    for z in (ZOOM - 1, ZOOM, ZOOM + 1):
+        scanline = set(shaped_mbtiles.iter_intersecting_tiles(
+            polygon, z, z, shaped_mbtiles.ENUMERATION_SCANLINE))
+        quadtree = set(shaped_mbtiles.iter_intersecting_tiles(
+            polygon, z, z, shaped_mbtiles.ENUMERATION_QUADTREE))
+        assert quadtree == scanline